@@ -0,0 +1,305 @@
+
+import asyncio
+import json
+import time
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from .client import PgNeedToKnowClient
+from .compression import ACCEPT_ENCODING, compress_request
+from .metrics import RequestEvent, emit, operation_name, request_size, response_sizes
+
+
+class Response(object):
+
+    """
+    Fully read HTTP response, with the parts of the requests.Response
+    interface used by PgNeedToKnowClient callers.
+    """
+
+    def __init__(self, status_code, headers, content, encoding=None, url=None):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.encoding = encoding or 'utf-8'
+        self.url = url
+
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding, 'replace')
+
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class AsyncHttpSession(object):
+
+    """
+    Pooled aiohttp session with a bound on the number of requests in flight.
+
+    The aiohttp.ClientSession is created lazily, inside the running event loop.
+    """
+
+    def __init__(self, max_concurrency=100, pool_maxsize=100,
+                 pool_maxsize_per_host=0, keep_alive=True):
+        """
+        Parameters
+        ----------
+        max_concurrency: int
+            maximum number of requests in flight, extra requests wait
+        pool_maxsize: int
+            maximum number of open connections, 0 for no limit
+        pool_maxsize_per_host: int
+            maximum number of open connections per host, 0 for no limit
+        keep_alive: bool
+            re-use connections between requests
+
+        """
+        if aiohttp is None:
+            raise Exception('aiohttp is required for AsyncPgNeedToKnowClient')
+        self.max_concurrency = max_concurrency
+        self.pool_maxsize = pool_maxsize
+        self.pool_maxsize_per_host = pool_maxsize_per_host
+        self.keep_alive = keep_alive
+        self._session = None
+        self._semaphore = None
+        self._closed = False
+        self._num_requests = 0
+        self._in_flight = 0
+
+
+    def _get_session(self):
+        if self._closed:
+            raise Exception('Session is closed')
+        if self._session is None:
+            connector = aiohttp.TCPConnector(limit=self.pool_maxsize,
+                                             limit_per_host=self.pool_maxsize_per_host,
+                                             force_close=not self.keep_alive)
+            self._session = aiohttp.ClientSession(
+                connector=connector, headers={'Accept-Encoding': ACCEPT_ENCODING})
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._session
+
+
+    async def request(self, method, url, headers=None, data=None):
+        session = self._get_session()
+        async with self._semaphore:
+            self._in_flight += 1
+            self._num_requests += 1
+            try:
+                async with session.request(method, url, headers=headers,
+                                           data=data) as resp:
+                    content = await resp.read()
+                    return Response(resp.status, resp.headers, content,
+                                    resp.charset, str(resp.url))
+            finally:
+                self._in_flight -= 1
+
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+
+    def patch(self, url, **kwargs):
+        return self.request('PATCH', url, **kwargs)
+
+
+    def stats(self):
+        """
+        Returns
+        -------
+        dict
+
+            {requests, in_flight, max_concurrency}
+
+        """
+        return {'requests': self._num_requests,
+                'in_flight': self._in_flight,
+                'max_concurrency': self.max_concurrency}
+
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+        self._closed = True
+
+
+class AsyncPgNeedToKnowClient(PgNeedToKnowClient):
+
+    """
+    asyncio API client for pg-need-to-know.
+
+    Has the same methods, endpoints and payload checks as PgNeedToKnowClient,
+    but every API method returns an awaitable. At most max_concurrency
+    requests are in flight at any time, so many calls can be scheduled at
+    once on the same event loop:
+
+        async with AsyncPgNeedToKnowClient(max_concurrency=50) as c:
+            await asyncio.gather(*[c.user_register(d) for d in owners])
+
+    Methods that are built from several requests, e.g. the bulk, paging,
+    streaming, counting and export methods, are not supported, see UNSUPPORTED.
+    """
+
+    def __init__(self, url=None, api_endpoints=None, session=None,
+                 max_concurrency=100, pool_maxsize=100,
+                 pool_maxsize_per_host=0, keep_alive=True, metrics=None,
+                 hooks=None, compression=None, compression_level=6,
+                 compression_min_size=1024):
+        """
+        Parameters
+        ----------
+        url: str
+            base URL of the REST API, default http://localhost:3000
+        api_endpoints: dict
+            endpoint name -> path, default pg-need-to-know routing
+        session: AsyncHttpSession
+            optional, if None one is created using the remaining arguments
+        max_concurrency: int
+            maximum number of requests in flight
+        pool_maxsize: int
+            maximum number of open connections, 0 for no limit
+        pool_maxsize_per_host: int
+            maximum number of open connections per host, 0 for no limit
+        keep_alive: bool
+            re-use connections between requests
+        metrics: MetricsRegistry or bool
+            optional, record per-operation request metrics
+        hooks: list
+            optional, callables called with a metrics.RequestEvent
+            after every request
+        compression: str
+            optional, <gzip, deflate>, compress large request bodies
+        compression_level: int
+        compression_min_size: int
+            bytes
+
+        """
+        if not session:
+            session = AsyncHttpSession(max_concurrency=max_concurrency,
+                                       pool_maxsize=pool_maxsize,
+                                       pool_maxsize_per_host=pool_maxsize_per_host,
+                                       keep_alive=keep_alive)
+        super(AsyncPgNeedToKnowClient, self).__init__(url=url,
+                                                      api_endpoints=api_endpoints,
+                                                      session=session,
+                                                      metrics=metrics,
+                                                      hooks=hooks,
+                                                      compression=compression,
+                                                      compression_level=compression_level,
+                                                      compression_min_size=compression_min_size)
+
+
+    def _request(self, method, url, **kwargs):
+        send = getattr(self.session, method)
+        raw_size = None
+        if self.compression is not None and kwargs.get('data') is not None:
+            raw_size = len(kwargs['data'])
+            kwargs = compress_request(kwargs, self.compression, self.compression_level,
+                                      self.compression_min_size)
+        if not self.hooks:
+            return send(url, **kwargs)
+        operation = operation_name(self._operation_codes, method.upper(), url)
+        return self._instrumented(operation, method.upper(), url, send, kwargs, raw_size)
+
+
+    async def _instrumented(self, operation, method, url, send, kwargs, raw_size=None):
+        bytes_out = request_size(kwargs.get('data'))
+        if raw_size is None:
+            raw_size = bytes_out
+        start = time.time()
+        try:
+            resp = await send(url, **kwargs)
+        except Exception as e:
+            emit(self.hooks, RequestEvent(operation, method, url, None,
+                                          time.time() - start, bytes_out, 0, e,
+                                          raw_size, 0))
+            raise
+        bytes_in, bytes_in_raw = response_sizes(resp)
+        emit(self.hooks, RequestEvent(operation, method, url, resp.status_code,
+                                      time.time() - start, bytes_out, bytes_in, None,
+                                      raw_size, bytes_in_raw))
+        return resp
+
+
+    async def close(self):
+        await self.session.close()
+
+
+    def __enter__(self):
+        # close is a coroutine, a plain with block could not await it
+        raise TypeError('Use "async with AsyncPgNeedToKnowClient() as c:" instead of "with"')
+
+
+    def __exit__(self, *args):
+        pass
+
+
+    async def __aenter__(self):
+        return self
+
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+
+    async def token(self, user_id=None, token_type=None):
+        resp = await self._http_get(self._token_endpoint(user_id, token_type))
+        return self.json(resp)['token']
+
+
+def _not_supported(name):
+    def method(self, *args, **kwargs):
+        raise Exception('%s is not supported on the async client, schedule single '
+                        'requests with asyncio.gather, or use PgNeedToKnowClient' % name)
+    method.__name__ = name
+    method.__doc__ = 'Not supported on the async client.'
+    return method
+
+
+# built from several requests, or on the threaded bulk, pagination and
+# streaming helpers, which need responses rather than awaitables
+UNSUPPORTED = [
+    'user_register_many',
+    'user_delete_many',
+    'user_delete_data_many',
+    'prefetch_tokens',
+    'group_sync_members',
+    'apply_plan',
+    'tail_event_logs',
+    'post_data_many',
+    'publish_data_many',
+    'ingest',
+    'stream_data',
+    'export_table',
+    'export_event_log',
+    'iter_data',
+    'iter_user_registrations',
+    'iter_event_log_user_group_removals',
+    'iter_event_log_user_data_deletions',
+    'iter_event_log_data_access',
+    'iter_event_log_access_control',
+    'iter_event_log_data_updates',
+    'count',
+    'count_group_members',
+    'count_user_registrations',
+    'count_event_log',
+]
+
+for _name in UNSUPPORTED:
+    setattr(AsyncPgNeedToKnowClient, _name, _not_supported(_name))
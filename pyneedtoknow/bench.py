@@ -0,0 +1,420 @@
+
+"""
+Client benchmarks for pg-need-to-know.
+
+Runs the main client operations at several concurrency levels and
+payload sizes against a running API, and records latency percentiles,
+throughput and client CPU time per operation as JSON:
+
+    python -m pyneedtoknow.bench run --url http://localhost:3000 --output new.json
+    python -m pyneedtoknow.bench compare old.json new.json
+
+Transports are compared by running with --transport requests, urllib3 or
+http.client and comparing the output files.
+
+The client's own per-call overhead, without any network I/O, is measured with:
+
+    python -m pyneedtoknow.bench overhead
+
+"""
+
+import json
+import math
+import os
+import platform
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+
+from .client import PgNeedToKnowClient
+from .codec import available_codecs
+from .transport import Response
+
+BENCH_TABLE = {
+    'table_name': 'bench',
+    'columns': [{'name': 'payload', 'type': 'text'}],
+    'description': 'pyneedtoknow benchmark data',
+}
+EVENT_LOGS = [
+    'get_event_log_user_group_removals',
+    'get_event_log_user_data_deletions',
+    'get_event_log_data_access',
+    'get_event_log_access_control',
+    'get_event_log_data_updates',
+]
+
+
+def percentile(values, p):
+    """
+    Nearest-rank percentile of a list of numbers.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = int(math.ceil(p / 100.0 * len(ordered))) - 1
+    return ordered[min(max(rank, 0), len(ordered) - 1)]
+
+
+def measure(func, n, concurrency):
+    """
+    Call func(i) for i in range(n), with concurrency calls in flight.
+
+    Returns
+    -------
+    dict
+
+        {count, errors, mean_ms, p50_ms, p95_ms, p99_ms, max_ms, rps,
+         cpu_seconds, cpu_ms_per_call}
+
+    """
+    def timed(i):
+        start = time.time()
+        try:
+            resp = func(i)
+            ok = getattr(resp, 'status_code', 200) < 400
+        except Exception:
+            ok = False
+        return time.time() - start, ok
+
+    cpu_start = time.process_time()
+    start = time.time()
+    if concurrency == 1:
+        results = [timed(i) for i in range(n)]
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(timed, range(n)))
+    elapsed = time.time() - start
+    cpu = time.process_time() - cpu_start
+    latencies = [r[0] * 1000 for r in results]
+    return {'count': n,
+            'errors': sum(1 for r in results if not r[1]),
+            'mean_ms': sum(latencies) / len(latencies) if latencies else None,
+            'p50_ms': percentile(latencies, 50),
+            'p95_ms': percentile(latencies, 95),
+            'p99_ms': percentile(latencies, 99),
+            'max_ms': max(latencies) if latencies else None,
+            'rps': n / elapsed if elapsed else None,
+            'cpu_seconds': cpu,
+            'cpu_ms_per_call': cpu * 1000 / n if n else None}
+
+
+class Benchmark(object):
+
+    """
+    Sets up benchmark users, a table and a group, runs the operations,
+    and removes the users and group again.
+    """
+
+    def __init__(self, client, n_requests=200, concurrency_levels=(1, 4, 16),
+                 payload_sizes=(100, 1000, 10000), operations=None):
+        """
+        Parameters
+        ----------
+        client: PgNeedToKnowClient
+        n_requests: int
+            calls per operation and concurrency level
+        concurrency_levels: list
+        payload_sizes: list
+            bytes per row, for post_data
+        operations: list
+            names of operations to run, default all
+
+        """
+        self.client = client
+        self.n_requests = n_requests
+        self.concurrency_levels = list(concurrency_levels)
+        self.payload_sizes = list(payload_sizes)
+        self.operations = operations
+        self.prefix = 'bench%d_' % os.getpid()
+        self.group = self.prefix + 'group'
+        self.owners = [self.prefix + 'o%d' % i for i in range(max(self.concurrency_levels))]
+        self.registered = []
+
+
+    def _wanted(self, operation):
+        return not self.operations or operation in self.operations
+
+
+    def setup(self):
+        c = self.client
+        self.admin_token = c.token(token_type='admin')
+        c.table_create({'definition': BENCH_TABLE, 'type': 'mac'}, self.admin_token)
+        c.group_create({'group_name': self.group, 'group_metadata': {}}, self.admin_token)
+        c.user_register_many({'user_id': o, 'user_type': 'data_owner', 'user_metadata': {}}
+                             for o in self.owners)
+        self.owner_tokens = [c.token(user_id=o, token_type='owner') for o in self.owners]
+
+
+    def teardown(self):
+        c = self.client
+        c.group_remove_members({'group_name': self.group, 'remove_all': True}, self.admin_token)
+        c.group_delete({'group_name': self.group}, self.admin_token)
+        c.user_delete_data_many(self.owners)
+        users = [{'user_id': u, 'user_type': 'data_owner'} for u in self.owners + self.registered]
+        c.user_delete_many(users, self.admin_token)
+
+
+    def cases(self, concurrency):
+        """
+        Returns
+        -------
+        list of (operation, payload_bytes, func)
+
+        """
+        c = self.client
+        tokens = self.owner_tokens
+        cases = []
+        if self._wanted('token'):
+            owners = self.owners
+            cases.append(('token', None,
+                          lambda i: c._fetch_token(owners[i % len(owners)], 'owner')))
+        if self._wanted('user_register') or self._wanted('group_add_members'):
+            users = [self.prefix + 'c%d_%d' % (concurrency, i) for i in range(self.n_requests)]
+            self.registered.extend(users)
+            cases.append(('user_register', None,
+                          lambda i: c.user_register({'user_id': users[i],
+                                                     'user_type': 'data_owner',
+                                                     'user_metadata': {}})))
+            if self._wanted('group_add_members'):
+                group = self.group
+                cases.append(('group_add_members', None,
+                              lambda i: c.group_add_members(
+                                  {'group_name': group,
+                                   'members': {'memberships': {'data_owners': [users[i]]}}},
+                                  self.admin_token)))
+        if self._wanted('post_data'):
+            for size in self.payload_sizes:
+                row = {'payload': 'x' * size}
+                cases.append(('post_data', size,
+                              lambda i, row=row: c.post_data(row, tokens[i % len(tokens)],
+                                                             '/bench')))
+        if self._wanted('get_data'):
+            cases.append(('get_data', None,
+                          lambda i: c.get_data(tokens[i % len(tokens)], '/bench')))
+        for name in EVENT_LOGS:
+            if self._wanted(name):
+                func = getattr(c, name)
+                cases.append((name, None, lambda i, func=func: func(self.admin_token)))
+        return cases
+
+
+    def run(self, progress=None):
+        """
+        Returns
+        -------
+        dict
+
+            {meta, results: [{operation, concurrency, payload_bytes, ...}]}
+
+        """
+        results = []
+        self.setup()
+        try:
+            for concurrency in self.concurrency_levels:
+                for operation, size, func in self.cases(concurrency):
+                    result = measure(func, self.n_requests, concurrency)
+                    result.update({'operation': operation,
+                                   'concurrency': concurrency,
+                                   'payload_bytes': size})
+                    results.append(result)
+                    if progress:
+                        progress(result)
+        finally:
+            self.teardown()
+        return {'meta': {'url': self.client.url,
+                         'transport': type(self.client.session).__name__,
+                         'python': platform.python_version(),
+                         'platform': platform.platform(),
+                         'time': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                         'requests': self.n_requests},
+                'results': results}
+
+
+class NullSession(object):
+
+    """
+    Answers every request with the same response, without any I/O.
+    """
+
+    def __init__(self, body):
+        self.resp = Response(200, {'Content-Type': 'application/json; charset=utf-8'},
+                             body)
+
+
+    def get(self, url, **kwargs):
+        return self.resp
+
+
+    def post(self, url, **kwargs):
+        return self.resp
+
+
+    def patch(self, url, **kwargs):
+        return self.resp
+
+
+    def close(self):
+        pass
+
+
+def _per_call_us(func, n, rounds=5):
+    # best of several rounds, to filter out noise from other processes
+    per_round = max(n // rounds, 1)
+    best = None
+    for r in range(rounds):
+        start = time.perf_counter()
+        for i in range(per_round):
+            func()
+        elapsed = (time.perf_counter() - start) * 1e6 / per_round
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def overhead(n=20000, rows=100):
+    """
+    Client CPU time per post_data plus get_data call, in microseconds,
+    against a session that does no I/O.
+
+    'before' builds headers and URLs on every call, encodes to str with
+    json.dumps and decodes the response with json.loads(resp.text), as the
+    client did before codecs; the others use the client with each codec.
+
+    Returns
+    -------
+    dict
+
+        {before, json, orjson}, orjson only if installed
+
+    """
+    row = {'name': 'A', 'age': 75, 'email': 'a@b.se', 'country': 'Sweden'}
+    body = json.dumps([dict(row, row_id=i, row_owner='owner_A', row_originator='owner_A')
+                       for i in range(rows)]).encode('utf-8')
+    session = NullSession(body)
+    base_url = 'http://localhost:3000'
+    token = 'x' * 200
+
+    def before():
+        headers = {'Content-Type': 'application/json', 'Authorization': 'Bearer ' + token}
+        session.post(base_url + '/t1', headers=headers, data=json.dumps(row))
+        resp = session.get(base_url + '/t1', headers={'Authorization': 'Bearer ' + token})
+        return json.loads(resp.text)
+
+    results = {'before': _per_call_us(before, n)}
+    for codec in available_codecs():
+        client = PgNeedToKnowClient(url=base_url, session=session, codec=codec)
+        def after():
+            client.post_data(row, token, '/t1')
+            return client.json(client.get_data(token, '/t1'))
+        results[codec.name] = _per_call_us(after, n)
+    return results
+
+
+def _key(result):
+    return (result['operation'], result['concurrency'], result['payload_bytes'])
+
+
+def compare(old, new, threshold=0.1):
+    """
+    Compare two benchmark runs.
+
+    Parameters
+    ----------
+    old: dict
+    new: dict
+    threshold: float
+        relative increase in p95 latency or client CPU per call
+        that counts as a regression
+
+    Returns
+    -------
+    list of dict
+
+        {operation, concurrency, payload_bytes, metric, old, new, change, regression}
+
+    """
+    before = dict((_key(r), r) for r in old['results'])
+    rows = []
+    for result in new['results']:
+        previous = before.get(_key(result))
+        if not previous:
+            continue
+        for metric in ['p95_ms', 'cpu_ms_per_call', 'rps']:
+            if not previous[metric] or result[metric] is None:
+                continue
+            change = (result[metric] - previous[metric]) / previous[metric]
+            worse = -change if metric == 'rps' else change
+            rows.append({'operation': result['operation'],
+                         'concurrency': result['concurrency'],
+                         'payload_bytes': result['payload_bytes'],
+                         'metric': metric, 'old': previous[metric],
+                         'new': result[metric], 'change': change,
+                         'regression': worse > threshold})
+    return rows
+
+
+def _format(result):
+    return ('%-34s c=%-3d %-7s p50=%8.2fms p95=%8.2fms p99=%8.2fms %9.1f req/s '
+            'cpu=%.3fms/call errors=%d' % (result['operation'], result['concurrency'],
+                                           result['payload_bytes'] or '',
+                                           result['p50_ms'], result['p95_ms'],
+                                           result['p99_ms'], result['rps'],
+                                           result['cpu_ms_per_call'], result['errors']))
+
+
+@click.group()
+def main():
+    pass
+
+
+@main.command()
+@click.option('--url', default=None)
+@click.option('--requests', 'n_requests', default=200)
+@click.option('--concurrency', multiple=True, type=int, default=[1, 4, 16])
+@click.option('--payload-size', multiple=True, type=int, default=[100, 1000, 10000])
+@click.option('--operation', multiple=True)
+@click.option('--transport', default='requests',
+              type=click.Choice(['requests', 'urllib3', 'http.client']))
+@click.option('--output', default='bench_output.json')
+def run(url, n_requests, concurrency, payload_size, operation, transport, output):
+    with PgNeedToKnowClient(url=url, pool_maxsize=max(concurrency),
+                            transport=transport) as client:
+        bench = Benchmark(client, n_requests, concurrency, payload_size, operation)
+        report = bench.run(progress=lambda r: click.echo(_format(r)))
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    click.echo('results written to %s' % output)
+
+
+@main.command('compare')
+@click.argument('old')
+@click.argument('new')
+@click.option('--threshold', default=0.1)
+def compare_command(old, new, threshold):
+    with open(old) as f:
+        old = json.load(f)
+    with open(new) as f:
+        new = json.load(f)
+    regressions = 0
+    for row in compare(old, new, threshold):
+        regressions += row['regression']
+        click.echo('%-34s c=%-3d %-7s %-16s %10.3f -> %10.3f %+7.1f%%%s'
+                   % (row['operation'], row['concurrency'], row['payload_bytes'] or '',
+                      row['metric'], row['old'], row['new'], row['change'] * 100,
+                      '  REGRESSION' if row['regression'] else ''))
+    sys.exit(1 if regressions else 0)
+
+
+@main.command('overhead')
+@click.option('--calls', default=20000)
+@click.option('--rows', default=100)
+def overhead_command(calls, rows):
+    results = overhead(calls, rows)
+    for name in sorted(results, key=lambda k: k != 'before'):
+        click.echo('%-8s %8.1f us/call %+7.1f%%' % (name, results[name],
+                                                   (results[name] / results['before'] - 1) * 100))
+
+
+if __name__ == '__main__':
+    main()
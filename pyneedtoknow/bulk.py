@@ -0,0 +1,225 @@
+
+import json
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+
+ItemResult = namedtuple('ItemResult', ['index', 'item', 'ok', 'status_code',
+                                       'error', 'elapsed'])
+
+
+class BulkResult(object):
+
+    """
+    Per-item outcome of a bulk operation, with totals and throughput.
+    """
+
+    def __init__(self, items, elapsed):
+        self.items = items
+        self.elapsed = elapsed
+        self.succeeded = sum(1 for i in items if i.ok)
+        self.failed = len(items) - self.succeeded
+
+
+    @property
+    def throughput(self):
+        """
+        Items per second.
+        """
+        if not self.elapsed:
+            return 0.0
+        return len(self.items) / self.elapsed
+
+
+    def failures(self):
+        return [i for i in self.items if not i.ok]
+
+
+    def summary(self):
+        """
+        Returns
+        -------
+        dict
+
+            {total, succeeded, failed, elapsed, throughput}
+
+        """
+        return {'total': len(self.items), 'succeeded': self.succeeded,
+                'failed': self.failed, 'elapsed': self.elapsed,
+                'throughput': self.throughput}
+
+
+    def __repr__(self):
+        return ('<BulkResult total=%d succeeded=%d failed=%d elapsed=%.3fs '
+                'throughput=%.1f/s>' % (len(self.items), self.succeeded,
+                                        self.failed, self.elapsed,
+                                        self.throughput))
+
+
+def send_one(send, limiter=None, satisfied=()):
+    """
+    Call send(), which makes one request, and report it to the limiter,
+    which must have been acquired for it.
+
+    Parameters
+    ----------
+    send: callable
+        send() -> response
+    limiter: concurrency.AdaptiveLimiter
+        optional
+    satisfied: tuple
+        error status codes that count as success, e.g. 409 when
+        the thing being created already exists
+
+    Returns
+    -------
+    tuple
+
+        (ok, status_code, error, elapsed)
+
+    """
+    start = time.time()
+    try:
+        resp = send()
+    except Exception as e:
+        elapsed = time.time() - start
+        if limiter is not None:
+            limiter.release(elapsed, error=True)
+        return False, None, str(e), elapsed
+    elapsed = time.time() - start
+    status_code = getattr(resp, 'status_code', None)
+    if limiter is not None:
+        limiter.release(elapsed, status_code)
+    if status_code is None:
+        # e.g. an un-awaited coroutine, nothing was sent
+        return False, None, 'no response with a status code: %r' % (resp,), elapsed
+    if status_code < 400 or status_code in satisfied:
+        return True, status_code, None, elapsed
+    return False, status_code, resp.text, elapsed
+
+
+def _call(func, index, item, limiter=None):
+    ok, status_code, error, elapsed = send_one(lambda: func(item), limiter)
+    return ItemResult(index, item, ok, status_code, error, elapsed)
+
+
+def run_many(func, items, max_workers=8, progress=None, limiter=None):
+    """
+    Call func on every item, with at most max_workers calls in flight.
+
+    Items are read from the iterable as workers become free, so it can be
+    a generator over a large input. A failing item (an exception, or a
+    response with status code >= 400) is recorded and does not stop the batch.
+
+    Parameters
+    ----------
+    func: callable
+        func(item) -> requests.Response
+    items: iterable
+    max_workers: int
+    progress: callable
+        optional, progress(done, total, item_result) after each item,
+        total is None if items has no length
+    limiter: concurrency.AdaptiveLimiter
+        optional, decides how many calls are in flight instead of
+        max_workers, and can be shared with other bulk operations
+
+    Returns
+    -------
+    BulkResult
+
+    """
+    total = len(items) if hasattr(items, '__len__') else None
+    results = []
+    start = time.time()
+
+    def _collect(futures):
+        for f in futures:
+            result = f.result()
+            results.append(result)
+            if progress:
+                progress(len(results), total, result)
+
+    if limiter is not None:
+        max_workers = limiter.max_limit
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = set()
+        for index, item in enumerate(items):
+            if len(pending) >= max_workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                _collect(done)
+            if limiter is not None:
+                limiter.acquire()
+            pending.add(executor.submit(_call, func, index, item, limiter))
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            _collect(done)
+    results.sort(key=lambda r: r.index)
+    return BulkResult(results, time.time() - start)
+
+
+class Batch(object):
+
+    """
+    JSON encoded rows, str or bytes, sent as one array in a single request.
+    """
+
+    def __init__(self, offset, rows):
+        self.offset = offset
+        self.size = len(rows)
+        self.rows = rows
+
+
+    def body(self):
+        if self.rows and isinstance(self.rows[0], bytes):
+            return b'[' + b','.join(self.rows) + b']'
+        return '[' + ','.join(self.rows) + ']'
+
+
+    def __len__(self):
+        return self.size
+
+
+    def __repr__(self):
+        return '<Batch offset=%d rows=%d>' % (self.offset, self.size)
+
+
+def batches(rows, max_rows=500, max_bytes=1048576, encode=json.dumps):
+    """
+    Split rows into batches by row count and encoded size.
+
+    Parameters
+    ----------
+    rows: iterable
+        of dicts
+    max_rows: int
+        maximum number of rows per batch
+    max_bytes: int
+        maximum size of the JSON array per batch, a single row
+        larger than this is sent in a batch of its own
+    encode: callable
+        row -> str or bytes
+
+    Returns
+    -------
+    generator of Batch
+
+    """
+    offset = 0
+    chunk = []
+    # brackets, less the comma counted for the first row
+    size = 1
+    for row in rows:
+        encoded = encode(row)
+        # row plus separating comma
+        n = len(encoded) + 1
+        if chunk and (len(chunk) >= max_rows or size + n > max_bytes):
+            yield Batch(offset, chunk)
+            offset += len(chunk)
+            chunk = []
+            size = 1
+        chunk.append(encoded)
+        size += n
+    if chunk:
+        yield Batch(offset, chunk)
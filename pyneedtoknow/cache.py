@@ -0,0 +1,103 @@
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache(object):
+
+    """
+    Thread-safe LRU cache with a time-to-live, and tag based invalidation.
+
+    Every entry can carry tags, e.g. 'groups' or 'group_members:group1',
+    and invalidate(tag) drops all entries with that tag.
+    """
+
+    def __init__(self, maxsize=1024, ttl=60):
+        """
+        Parameters
+        ----------
+        maxsize: int
+            maximum number of entries, least recently used are evicted
+        ttl: int
+            seconds an entry is valid for
+
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+
+    def get(self, key):
+        """
+        Returns the cached value, raises KeyError if missing or expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] < time.time():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                raise KeyError(key)
+            self._entries[key] = self._entries.pop(key)
+            self.hits += 1
+            return entry[0]
+
+
+    def put(self, key, value, tags=(), generation=None):
+        """
+        Parameters
+        ----------
+        key: hashable
+        value: object
+        tags: iterable
+        generation: int
+            optional, the value of self.generation when the value was
+            fetched, if anything was invalidated since, the value is
+            not stored, since it may already be stale
+
+        """
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._entries.pop(key, None)
+            self._entries[key] = (value, time.time() + self.ttl, frozenset(tags))
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+
+    def invalidate(self, *tags):
+        tags = set(tags)
+        with self._lock:
+            self.generation += 1
+            for key in [k for k, e in self._entries.items() if e[2] & tags]:
+                del self._entries[key]
+                self.invalidations += 1
+
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+
+
+    def stats(self):
+        """
+        Returns
+        -------
+        dict
+
+            {size, hits, misses, evictions, invalidations}
+
+        """
+        with self._lock:
+            return {'size': len(self._entries), 'hits': self.hits,
+                    'misses': self.misses, 'evictions': self.evictions,
+                    'invalidations': self.invalidations}
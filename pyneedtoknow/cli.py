@@ -0,0 +1,338 @@
+
+"""
+Command-line tool for common pg-need-to-know admin tasks.
+
+    pyneedtoknow token --type admin
+    pyneedtoknow groups
+    pyneedtoknow register owners.txt --user-type data_owner --concurrency 16
+    cat ids.txt | pyneedtoknow delete-users - --user-type data_owner
+    pyneedtoknow grant t1 group1 select
+    pyneedtoknow apply plan.json --stats
+    pyneedtoknow --adaptive 64 --stats register owners.txt
+    pyneedtoknow ingest t1 submissions.csv.gz --checkpoints ingest.json
+    pyneedtoknow dump-logs --checkpoints checkpoints.json > events.ndjson
+
+Bulk commands read one item per line from a file, or stdin with '-':
+either an ID, or a JSON object as for the matching client method.
+
+The client is imported when a command runs, not at startup, and the
+http.client transport is used by default, so short commands do not
+pay for importing requests.
+
+The admin token is taken from --token or PYNEEDTOKNOW_TOKEN,
+and requested from the API otherwise.
+"""
+
+import json
+import sys
+import time
+
+import click
+
+TRANSPORT_NAMES = ['http.client', 'urllib3', 'requests']
+
+
+class Context(object):
+
+    def __init__(self, url, token, transport, timeout, stats, adaptive=None):
+        self.url = url
+        self.token = token
+        self.transport = transport
+        self.timeout = timeout
+        self.stats = stats
+        self.adaptive = adaptive
+        self.started = time.time()
+        self.metrics = None
+        self._client = None
+
+
+    def client(self, concurrency=10):
+        if self._client is None:
+            # imported here, so --help and argument errors stay fast
+            from .client import PgNeedToKnowClient
+            from .metrics import MetricsRegistry
+            self.metrics = MetricsRegistry()
+            limiter = None
+            if self.adaptive:
+                from .concurrency import AdaptiveLimiter
+                limiter = AdaptiveLimiter(initial=min(concurrency, self.adaptive),
+                                          max_limit=self.adaptive)
+                concurrency = self.adaptive
+            self._client = PgNeedToKnowClient(url=self.url, transport=self.transport,
+                                              timeout=self.timeout,
+                                              pool_maxsize=max(concurrency, 1),
+                                              metrics=self.metrics,
+                                              concurrency=limiter)
+        return self._client
+
+
+    def admin_token(self):
+        if not self.token:
+            self.token = self.client().token(token_type='admin')
+        return self.token
+
+
+    def close(self):
+        if self._client is None:
+            return
+        self._client.close()
+        if self.stats:
+            print_stats(self.metrics.snapshot(), time.time() - self.started)
+            if self._client.limiter is not None:
+                print_limiter(self._client.limiter)
+
+
+def print_stats(snapshot, elapsed):
+    total = sum(m['count'] for m in snapshot.values())
+    errors = sum(m['errors'] for m in snapshot.values())
+    rps = total / elapsed if elapsed else 0.0
+    click.echo('elapsed=%.3fs requests=%d errors=%d rps=%.1f'
+               % (elapsed, total, errors, rps), err=True)
+    for name in sorted(snapshot):
+        m = snapshot[name]
+        # None when the p95 falls in the overflow bucket, past the largest bound
+        p95 = '-' if m['p95_ms'] is None else '%.2fms' % m['p95_ms']
+        click.echo('  %-34s count=%-6d errors=%-4d mean=%8.2fms p95<=%10s'
+                   % (name, m['count'], m['errors'], m['mean_ms'], p95), err=True)
+
+
+def print_limiter(limiter):
+    stats = limiter.stats()
+    click.echo('limit=%d min=%d max=%d increases=%d decreases=%d'
+               % (stats['limit'], min(h['limit'] for h in limiter.history()),
+                  max(h['limit'] for h in limiter.history()),
+                  stats['increases'], stats['decreases']), err=True)
+
+
+def read_items(f):
+    """
+    Parameters
+    ----------
+    f: file
+        one ID or JSON object per line, blank lines are skipped
+
+    Returns
+    -------
+    generator of str or dict
+
+    """
+    for line in f:
+        line = line.strip()
+        if not line:
+            continue
+        yield json.loads(line) if line.startswith('{') else line
+
+
+def echo_json(data):
+    click.echo(json.dumps(data, sort_keys=True))
+
+
+def check(resp):
+    if resp.status_code >= 400:
+        raise click.ClickException('%d %s' % (resp.status_code, resp.text))
+    return resp
+
+
+def report(result):
+    click.echo(json.dumps(result.summary(), sort_keys=True))
+    for failure in result.failures():
+        click.echo('failed: %s %s %s' % (getattr(failure, 'item', None)
+                                         or getattr(failure, 'name', None),
+                                         failure.status_code, failure.error), err=True)
+    if result.failed:
+        sys.exit(1)
+
+
+@click.group()
+@click.option('--url', envvar='PYNEEDTOKNOW_URL', default=None,
+              help='base URL of the REST API, default http://localhost:3000')
+@click.option('--token', envvar='PYNEEDTOKNOW_TOKEN', default=None,
+              help='admin JWT, requested from the API if not given')
+@click.option('--transport', default='http.client', type=click.Choice(TRANSPORT_NAMES))
+@click.option('--timeout', default=None, type=float, help='seconds')
+@click.option('--stats', is_flag=True, help='print timing and throughput to stderr')
+@click.option('--adaptive', default=None, type=click.IntRange(1),
+              help='adapt the concurrency of bulk commands to latency and errors, '
+                   'up to this many requests in flight')
+@click.pass_context
+def main(ctx, url, token, transport, timeout, stats, adaptive):
+    ctx.obj = Context(url, token, transport, timeout, stats, adaptive)
+    ctx.call_on_close(ctx.obj.close)
+
+
+@main.command()
+@click.option('--type', 'token_type', default='admin',
+              type=click.Choice(['admin', 'owner', 'user']))
+@click.option('--user-id', default=None)
+@click.pass_obj
+def token(obj, token_type, user_id):
+    if token_type != 'admin' and not user_id:
+        raise click.UsageError('--user-id is required for %s tokens' % token_type)
+    click.echo(obj.client().token(user_id=user_id, token_type=token_type))
+
+
+@main.command()
+@click.pass_obj
+def groups(obj):
+    client = obj.client()
+    echo_json(client.json(check(client.get_groups(obj.admin_token()))))
+
+
+@main.command()
+@click.pass_obj
+def tables(obj):
+    client = obj.client()
+    echo_json(client.json(check(client.get_table_overview(obj.admin_token()))))
+
+
+@main.command()
+@click.argument('source', type=click.File('r'))
+@click.option('--user-type', default='data_owner',
+              type=click.Choice(['data_owner', 'data_user']),
+              help='for lines that are plain IDs')
+@click.option('--concurrency', default=8)
+@click.pass_obj
+def register(obj, source, user_type, concurrency):
+    def user(item):
+        if isinstance(item, dict):
+            return item
+        return {'user_id': item, 'user_type': user_type, 'user_metadata': {}}
+    client = obj.client(concurrency)
+    report(client.user_register_many((user(i) for i in read_items(source)),
+                                     max_workers=concurrency))
+
+
+@main.command('delete-users')
+@click.argument('source', type=click.File('r'))
+@click.option('--user-type', default='data_owner',
+              type=click.Choice(['data_owner', 'data_user']),
+              help='for lines that are plain IDs')
+@click.option('--concurrency', default=8)
+@click.pass_obj
+def delete_users(obj, source, user_type, concurrency):
+    def user(item):
+        if isinstance(item, dict):
+            return item
+        return {'user_id': item, 'user_type': user_type}
+    client = obj.client(concurrency)
+    report(client.user_delete_many((user(i) for i in read_items(source)),
+                                   obj.admin_token(), max_workers=concurrency))
+
+
+@main.command()
+@click.argument('table_name')
+@click.argument('source')
+@click.option('--format', 'fmt', default=None, type=click.Choice(['csv', 'ndjson']),
+              help='default from the file name')
+@click.option('--owner-column', default='owner')
+@click.option('--checkpoints', default=None,
+              help='JSON file to resume from, and to save checkpoints in')
+@click.option('--rejects', default=None, help='NDJSON file for rows that were not loaded')
+@click.option('--batch-size', default=500)
+@click.option('--concurrency', default=8)
+@click.pass_obj
+def ingest(obj, table_name, source, fmt, owner_column, checkpoints, rejects,
+           batch_size, concurrency):
+    """
+    Load a CSV or NDJSON file into a table, on behalf of the owners in its rows.
+    """
+    if source == '-':
+        raise click.UsageError('ingest needs a file, so it can resume')
+    client = obj.client(concurrency)
+    result = client.ingest(source, table_name, obj.admin_token(), fmt=fmt,
+                           owner_column=owner_column, checkpoints=checkpoints,
+                           rejects=rejects, batch_size=batch_size,
+                           max_workers=concurrency,
+                           progress=lambda s: click.echo(json.dumps(s, sort_keys=True),
+                                                         err=True))
+    echo_json(result.summary())
+    if result.rows_failed or result.rows_invalid:
+        sys.exit(1)
+
+
+@main.command()
+@click.argument('table_name')
+@click.argument('group_name')
+@click.argument('grant_type', type=click.Choice(['select', 'insert', 'update']))
+@click.pass_obj
+def grant(obj, table_name, group_name, grant_type):
+    check(obj.client().table_group_access_grant({'table_name': table_name,
+                                                 'group_name': group_name,
+                                                 'grant_type': grant_type},
+                                                obj.admin_token()))
+
+
+@main.command()
+@click.argument('table_name')
+@click.argument('group_name')
+@click.argument('grant_type', type=click.Choice(['select', 'insert', 'update']))
+@click.pass_obj
+def revoke(obj, table_name, group_name, grant_type):
+    check(obj.client().table_group_access_revoke({'table_name': table_name,
+                                                  'group_name': group_name,
+                                                  'grant_type': grant_type},
+                                                 obj.admin_token()))
+
+
+@main.command('group-sync')
+@click.argument('group_name')
+@click.option('--owners', type=click.File('r'), default=None,
+              help='file of data owner IDs, - for stdin')
+@click.option('--users', type=click.File('r'), default=None,
+              help='file of data user IDs, - for stdin')
+@click.option('--all-owners', is_flag=True)
+@click.option('--all-users', is_flag=True)
+@click.option('--batch-size', default=1000)
+@click.option('--dry-run', is_flag=True)
+@click.option('--use-registrations', is_flag=True,
+              help='add by metadata or add_all_* where that takes fewer calls')
+@click.pass_obj
+def group_sync(obj, group_name, owners, users, all_owners, all_users,
+               batch_size, dry_run, use_registrations):
+    data = {'group_name': group_name}
+    for key, source, everyone in [('data_owners', owners, all_owners),
+                                  ('data_users', users, all_users)]:
+        if everyone:
+            data[key] = 'all'
+        elif source is not None:
+            data[key] = list(read_items(source))
+    result = obj.client().group_sync_members(data, obj.admin_token(),
+                                             batch_size=batch_size, dry_run=dry_run,
+                                             use_registrations=use_registrations)
+    echo_json(result)
+    if result.get('failed'):
+        sys.exit(1)
+
+
+@main.command()
+@click.argument('source', type=click.File('r'))
+@click.option('--concurrency', default=8)
+@click.pass_obj
+def apply(obj, source, concurrency):
+    """
+    Apply an access plan: a JSON object with the arguments of plan.AccessPlan.
+    """
+    from .plan import AccessPlan
+    plan = AccessPlan(**json.load(source))
+    client = obj.client(concurrency)
+    report(client.apply_plan(plan, obj.admin_token(), max_workers=concurrency))
+
+
+@main.command('dump-logs')
+@click.option('--log', 'logs', multiple=True, help='event log name, default all')
+@click.option('--checkpoints', default=None,
+              help='JSON file to resume from, and to save checkpoints in')
+@click.option('--page-size', default=1000)
+@click.pass_obj
+def dump_logs(obj, logs, checkpoints, page_size):
+    """
+    Write new event log rows to stdout, one JSON object per line.
+    """
+    tail = obj.client().tail_event_logs(obj.admin_token(), logs=list(logs) or None,
+                                         checkpoints=checkpoints, page_size=page_size)
+    for log, row in tail.poll_all():
+        click.echo(json.dumps({'log': log, 'row': row}, sort_keys=True))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,30 @@
 
 import json
+from collections import defaultdict, deque
+
+from .cache import TTLCache
+from .codec import create_codec
+from .compression import ENCODINGS, compress_request
+from .concurrency import AdaptiveLimiter
+from .metrics import MetricsRegistry, instrument, operation_codes, operation_name
+from .pagination import content_range_total, page_endpoint, paginate
+from .transport import create_session
+from .streaming import iter_json_array
+from .tokens import TokenCache
+
+# the bulk, hedging, ingest, membership, tail and export modules are
+# imported by the methods using them, so a single request does not pay
+# for importing concurrent.futures, csv and the like
+
+COUNT_METHODS = ['exact', 'planned', 'estimated']
+
+
+def _event_log_order(log):
+    # timestamps are shared by many rows, so offset pages are only stable
+    # when ordered by the columns that tell those rows apart as well
+    from .tail import EVENT_LOG_CURSORS, EVENT_LOG_TIEBREAKERS
+    return ','.join([EVENT_LOG_CURSORS[log]] + EVENT_LOG_TIEBREAKERS[log])
 
-import requests
 
 class PgNeedToKnowClient(object):
 
@@ -9,7 +32,112 @@ class PgNeedToKnowClient(object):
     API client for pg-need-to-know as exposed via postgrest's HTTP interface.
     """
 
-    def __init__(self, url=None, api_endpoints=None):
+    def __init__(self, url=None, api_endpoints=None, session=None,
+                 pool_connections=10, pool_maxsize=10, pool_block=False,
+                 keep_alive=True, transport='requests', timeout=None,
+                 token_cache=None, metadata_cache=None,
+                 metrics=None, hooks=None, hedging=None, compression=None,
+                 compression_level=6, compression_min_size=1024, codec=None,
+                 concurrency=None):
+        """
+        Parameters
+        ----------
+        url: str
+            base URL of the REST API, default http://localhost:3000
+        api_endpoints: dict
+            endpoint name -> path, default pg-need-to-know routing
+        session: HttpSession
+            optional, shared pooled session, if None one is created
+            using the transport, pool_*, keep_alive and timeout arguments
+        pool_connections: int
+            number of per-host connection pools
+        pool_maxsize: int
+            maximum number of connections kept open per host
+        pool_block: bool
+            block when all pool_maxsize connections to a host are in use
+        keep_alive: bool
+            re-use connections between requests
+        transport: str
+            <requests, urllib3, http.client>, HTTP library used,
+            see transport.py
+        timeout: float or tuple
+            optional, seconds, or (connect, read) seconds
+        token_cache: TokenCache or bool
+            optional, cache tokens returned by token(), if True
+            a TokenCache with default settings is used
+        metadata_cache: TTLCache or bool
+            optional, cache the results of table_metadata, get_table_overview,
+            get_groups, group_list_members and user_groups, entries are
+            invalidated by the calls that change them, if True a TTLCache
+            with default settings is used
+        metrics: MetricsRegistry or bool
+            optional, record per-operation request metrics, if True
+            a MetricsRegistry with default settings is used
+        hooks: list
+            optional, callables called with a metrics.RequestEvent
+            after every request
+        hedging: Hedger or bool
+            optional, hedge slow GET requests, i.e. send a second request
+            and use whichever response arrives first, POST and PATCH
+            requests are never hedged, if True a Hedger with default
+            settings is used, a Hedger passed in can be shared between
+            clients and is not closed by close()
+        compression: str
+            optional, <gzip, deflate>, compress request bodies of at least
+            compression_min_size bytes, the API (or a proxy in front of it)
+            must accept compressed requests
+        compression_level: int
+            1 (fastest) to 9 (smallest)
+        compression_min_size: int
+            bytes
+        codec: str or object
+            optional, <json, orjson>, or a JSON codec with
+            dumps(obj) -> bytes and loads(bytes) -> obj, default
+            the standard library json, orjson is faster but stricter
+        concurrency: AdaptiveLimiter or bool
+            optional, shared by all bulk operations, it sets how many of
+            their requests are in flight from observed latency and errors,
+            instead of their max_workers, if True an AdaptiveLimiter with
+            default settings is used
+
+        """
+        if token_cache is True:
+            token_cache = TokenCache()
+        self.token_cache = token_cache or None
+        if metadata_cache is True:
+            metadata_cache = TTLCache()
+        self.metadata_cache = metadata_cache or None
+        if metrics is True:
+            metrics = MetricsRegistry()
+        self.metrics = metrics or None
+        self.hooks = list(hooks or [])
+        if self.metrics is not None:
+            self.hooks.append(self.metrics)
+        self._operation_codes = operation_codes(type(self))
+        # a Hedger passed in may be shared with other clients
+        self._owns_hedger = hedging is True
+        if hedging is True:
+            from .hedge import Hedger
+            hedging = Hedger()
+        self.hedger = hedging or None
+        if compression is not None and compression not in ENCODINGS:
+            raise Exception('Unsupported compression: %s, use one of %s'
+                            % (compression, ENCODINGS))
+        self.compression = compression
+        self.compression_level = compression_level
+        self.compression_min_size = compression_min_size
+        self.codec = create_codec(codec)
+        if concurrency is True:
+            concurrency = AdaptiveLimiter()
+        self.limiter = concurrency or None
+        if not session:
+            session = create_session(transport,
+                                     pool_connections=pool_connections,
+                                     pool_maxsize=pool_maxsize,
+                                     pool_block=pool_block,
+                                     keep_alive=keep_alive,
+                                     timeout=timeout)
+        self.session = session
         if not url:
             self.url = 'http://localhost:3000'
         else:
@@ -44,6 +172,136 @@ class PgNeedToKnowClient(object):
             }
         else:
             self.api_endpoints = api_endpoints
+        # built once, instead of on every call
+        self._urls = dict((path, self.url + path) for path in self.api_endpoints.values())
+        self._json_headers = {'Content-Type': 'application/json'}
+        self._token_headers = {}
+
+
+    def close(self):
+        """
+        Close all pooled connections.
+        """
+        if self.token_cache is not None:
+            self.token_cache.close()
+        if self.hedger is not None and self._owns_hedger:
+            self.hedger.close()
+        self.session.close()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.close()
+
+
+    def hedging_stats(self):
+        """
+        Returns
+        -------
+        dict
+
+            {calls, fired, won, backlogged, delay}, or None if hedging is off
+
+        """
+        return None if self.hedger is None else self.hedger.stats()
+
+
+    def connection_stats(self):
+        """
+        Returns
+        -------
+        dict
+
+            {requests, connections, reused_connections}
+
+        """
+        return self.session.stats()
+
+
+    def add_hook(self, hook):
+        """
+        Call hook(metrics.RequestEvent) after every request.
+        """
+        self.hooks.append(hook)
+
+
+    def remove_hook(self, hook):
+        self.hooks.remove(hook)
+
+
+    def _request(self, method, url, **kwargs):
+        send = getattr(self.session, method)
+        raw_size = None
+        if self.compression is not None and kwargs.get('data') is not None:
+            raw_size = len(kwargs['data'])
+            kwargs = compress_request(kwargs, self.compression, self.compression_level,
+                                      self.compression_min_size)
+        if self.hedger is not None and method == 'get' and not kwargs.get('stream'):
+            send = self.hedger.wrap(send, self.limiter)
+        if not self.hooks:
+            return send(url, **kwargs)
+        operation = operation_name(self._operation_codes, method.upper(), url)
+        return instrument(self.hooks, operation, method.upper(), url, send, kwargs,
+                          raw_size)
+
+
+    def _cached(self, key, tags, fetch):
+        cache = self.metadata_cache
+        if cache is None:
+            return fetch()
+        try:
+            return cache.get(key)
+        except KeyError:
+            pass
+        generation = cache.generation
+        resp = fetch()
+        if resp.status_code == 200:
+            cache.put(key, resp, tags, generation)
+        return resp
+
+
+    def _invalidate(self, *tags):
+        if self.metadata_cache is not None:
+            self.metadata_cache.invalidate(*tags)
+
+
+    def json(self, resp):
+        """
+        Parse a JSON response body, straight from bytes.
+
+        Parameters
+        ----------
+        resp: requests.Response
+
+        Returns
+        -------
+        list or dict
+
+        """
+        return self.codec.loads(resp.content)
+
+
+    def _url(self, endpoint):
+        url = self._urls.get(endpoint)
+        if url is None:
+            url = self.url + endpoint
+        return url
+
+
+    def _auth_headers(self, token, content_type=False):
+        # shared between calls, must not be modified
+        headers = self._token_headers.get((token, content_type))
+        if headers is None:
+            if len(self._token_headers) > 1000:
+                self._token_headers.clear()
+            headers = {'Authorization': 'Bearer ' + token}
+            if content_type:
+                headers['Content-Type'] = 'application/json'
+            self._token_headers[(token, content_type)] = headers
+        return headers
 
 
     def _assert_keys_present(self, required_keys, existing_keys):
@@ -54,44 +312,89 @@ class PgNeedToKnowClient(object):
             raise Exception('Missing required key in data')
 
 
-    def _http_get(self, endpoint, headers=None):
-        url = self.url + endpoint
+    def _http_get(self, endpoint, headers=None, stream=False):
+        url = self._url(endpoint)
         if not headers:
             headers = None
-        return requests.get(url, headers=headers)
+        if stream:
+            return self._request('get', url, headers=headers, stream=True)
+        return self._request('get', url, headers=headers)
 
 
     def _http_post_unauthenticated(self, endpoint, payload=None):
-        return self._http_post(endpoint, {'Content-Type': 'application/json'},
-                               payload)
+        return self._http_post(endpoint, self._json_headers, payload)
 
 
     def _http_post_authenticated(self, endpoint, payload=None, token=None):
-        headers = {'Content-Type': 'application/json', 'Authorization': 'Bearer ' + token}
-        return self._http_post(endpoint, headers, payload)
+        return self._http_post(endpoint, self._auth_headers(token, True), payload)
 
 
     def _http_post(self, endpoint, headers, payload=None):
-        url = self.url + endpoint
+        url = self._url(endpoint)
         if payload:
-            return requests.post(url, headers=headers, data=json.dumps(payload))
+            return self._request('post', url, headers=headers, data=self.codec.dumps(payload))
         else:
-            return requests.post(url, headers=headers)
+            return self._request('post', url, headers=headers)
+
+
+    def _http_post_raw(self, endpoint, headers, body):
+        url = self._url(endpoint)
+        return self._request('post', url, headers=headers, data=body)
 
 
     def _http_patch_authenticated(self, endpoint, payload=None, token=None):
-        headers = {'Content-Type': 'application/json', 'Authorization': 'Bearer ' + token}
-        url = self.url + endpoint
-        return requests.patch(url, headers=headers, data=json.dumps(payload))
+        headers = self._auth_headers(token, True)
+        url = self._url(endpoint)
+        return self._request('patch', url, headers=headers, data=self.codec.dumps(payload))
 
 
-    def token(self, user_id=None, token_type=None):
+    def _token_endpoint(self, user_id=None, token_type=None):
         if user_id:
-            endpoint = '/rpc/token?user_id=' + user_id + '&token_type=' + token_type
+            return '/rpc/token?user_id=' + user_id + '&token_type=' + token_type
         else:
-            endpoint = '/rpc/token?token_type=' + token_type
-        resp = self._http_get(endpoint)
-        return json.loads(resp.text)['token']
+            return '/rpc/token?token_type=' + token_type
+
+
+    def _fetch_token(self, user_id=None, token_type=None):
+        resp = self._http_get(self._token_endpoint(user_id, token_type))
+        return self.json(resp)['token']
+
+
+    def _fetch_token_limited(self, user_id=None, token_type=None):
+        with self.limiter.slot() as slot:
+            resp = self._http_get(self._token_endpoint(user_id, token_type))
+            slot.status_code = resp.status_code
+        return self.json(resp)['token']
+
+
+    def _prefetch_token(self, user_id=None, token_type=None):
+        # as token, but a token request takes a slot of the client's limiter
+        if self.limiter is None:
+            return self.token(user_id, token_type)
+        if self.token_cache is not None:
+            return self.token_cache.get(user_id, token_type, self._fetch_token_limited)
+        return self._fetch_token_limited(user_id, token_type)
+
+
+    def token(self, user_id=None, token_type=None):
+        """
+        Parameters
+        ----------
+        user_id: str
+            optional, not needed for admin tokens
+        token_type: str
+            <admin, owner, user>
+
+        Returns
+        -------
+        str
+
+            JWT, from the token_cache if the client has one
+
+        """
+        if self.token_cache is not None:
+            return self.token_cache.get(user_id, token_type, self._fetch_token)
+        return self._fetch_token(user_id, token_type)
 
 
     def table_create(self, data, token, endpoint=None):
@@ -114,7 +417,9 @@ class PgNeedToKnowClient(object):
         if not endpoint:
             endpoint = self.api_endpoints['table_create']
         self._assert_keys_present(['definition', 'type'], data.keys())
-        return self._http_post_authenticated(endpoint, payload=data, token=token)
+        resp = self._http_post_authenticated(endpoint, payload=data, token=token)
+        self._invalidate('table_overview')
+        return resp
 
 
     def table_describe(self, data, token, endpoint=None):
@@ -132,7 +437,9 @@ class PgNeedToKnowClient(object):
         if not endpoint:
             endpoint = self.api_endpoints['table_describe']
         self._assert_keys_present(['table_name', 'table_description'], data.keys())
-        return self._http_post_authenticated(endpoint, payload=data, token=token)
+        resp = self._http_post_authenticated(endpoint, payload=data, token=token)
+        self._invalidate('table_metadata:' + data['table_name'], 'table_overview')
+        return resp
 
 
     def table_describe_columns(self, data, token, endpoint=None):
@@ -153,7 +460,9 @@ class PgNeedToKnowClient(object):
         if not endpoint:
             endpoint = self.api_endpoints['table_describe_columns']
         self._assert_keys_present(['table_name', 'column_descriptions'], data.keys())
-        return self._http_post_authenticated(endpoint, payload=data, token=token)
+        resp = self._http_post_authenticated(endpoint, payload=data, token=token)
+        self._invalidate('table_metadata:' + data['table_name'])
+        return resp
 
 
     def table_metadata(self, data, token, endpoint=None):
@@ -170,8 +479,10 @@ class PgNeedToKnowClient(object):
         if not endpoint:
             endpoint = self.api_endpoints['table_metadata']
         endpoint += '?table_name=%s' % data['table_name']
-        headers = {'Authorization': 'Bearer ' + token}
-        return self._http_get(endpoint, headers)
+        headers = self._auth_headers(token)
+        return self._cached(('table_metadata', endpoint, token),
+                            ['table_metadata:' + data['table_name']],
+                            lambda: self._http_get(endpoint, headers))
 
 
     def table_group_access_grant(self, data, token, endpoint=None):
@@ -187,7 +498,9 @@ class PgNeedToKnowClient(object):
         if not endpoint:
             endpoint = self.api_endpoints['table_group_access_grant']
         self._assert_keys_present(['table_name', 'group_name', 'grant_type'], data.keys())
-        return self._http_post_authenticated(endpoint, payload=data, token=token)
+        resp = self._http_post_authenticated(endpoint, payload=data, token=token)
+        self._invalidate('table_overview')
+        return resp
 
 
     def table_group_access_revoke(self, data, token, endpoint=None):
@@ -203,7 +516,9 @@ class PgNeedToKnowClient(object):
         if not endpoint:
             endpoint = self.api_endpoints['table_group_access_revoke']
         self._assert_keys_present(['table_name', 'group_name', 'grant_type'], data.keys())
-        return self._http_post_authenticated(endpoint, payload=data, token=token)
+        resp = self._http_post_authenticated(endpoint, payload=data, token=token)
+        self._invalidate('table_overview')
+        return resp
 
 
     def user_register(self, data, token=None, endpoint=None):
@@ -240,7 +555,9 @@ class PgNeedToKnowClient(object):
         if not endpoint:
             endpoint = self.api_endpoints['user_group_remove']
         self._assert_keys_present(['group_name'], data.keys())
-        return self._http_post_authenticated(endpoint, payload=data, token=token)
+        resp = self._http_post_authenticated(endpoint, payload=data, token=token)
+        self._invalidate('group_members:' + data['group_name'], 'user_groups')
+        return resp
 
 
     def user_groups(self, data, token, endpoint=None):
@@ -257,7 +574,9 @@ class PgNeedToKnowClient(object):
         if not endpoint:
             endpoint = self.api_endpoints['user_groups']
         self._assert_keys_present(['user_type'], data.keys())
-        return self._http_post_authenticated(endpoint, payload=data, token=token)
+        return self._cached(('user_groups', endpoint, token, json.dumps(data, sort_keys=True)),
+                            ['user_groups'],
+                            lambda: self._http_post_authenticated(endpoint, payload=data, token=token))
 
 
     def user_delete_data(self, data, token, endpoint=None):
@@ -290,7 +609,132 @@ class PgNeedToKnowClient(object):
         if not endpoint:
             endpoint = self.api_endpoints['user_delete']
         self._assert_keys_present(['user_id', 'user_type'], data.keys())
-        return self._http_post_authenticated(endpoint, payload=data, token=token)
+        resp = self._http_post_authenticated(endpoint, payload=data, token=token)
+        self._invalidate('group_members', 'user_groups')
+        return resp
+
+
+    def user_register_many(self, data, max_workers=8, progress=None,
+                           endpoint=None):
+        """
+        Register many users concurrently.
+
+        Parameters
+        ----------
+        data: iterable
+            of dicts, as for user_register
+        max_workers: int
+            maximum number of requests in flight, keep it at or
+            below pool_maxsize so connections are re-used
+        progress: callable
+            optional, progress(done, total, item_result) after each user
+        endpoint: str
+
+        Returns
+        -------
+        bulk.BulkResult
+
+        """
+        from .bulk import run_many
+        def register(d):
+            return self.user_register(d, endpoint=endpoint)
+        return run_many(register, data, max_workers, progress, self.limiter)
+
+
+    def user_delete_many(self, data, token, max_workers=8, progress=None,
+                         endpoint=None):
+        """
+        Delete many users concurrently.
+
+        Parameters
+        ----------
+        data: iterable
+            of dicts, as for user_delete
+        token: str
+            JWT
+        max_workers: int
+        progress: callable
+            optional, progress(done, total, item_result) after each user
+        endpoint: str
+
+        Returns
+        -------
+        bulk.BulkResult
+
+        """
+        from .bulk import run_many
+        def delete(d):
+            return self.user_delete(d, token, endpoint=endpoint)
+        return run_many(delete, data, max_workers, progress, self.limiter)
+
+
+    def prefetch_tokens(self, pairs, max_workers=8, lookahead=64):
+        """
+        Fetch tokens for many users concurrently, ahead of their use.
+
+        If the client has a concurrency limiter, each token request
+        takes a slot, as the requests of bulk operations do.
+
+        Parameters
+        ----------
+        pairs: iterable
+            of (user_id, token_type), read as tokens are consumed
+        max_workers: int
+            maximum number of token requests in flight
+        lookahead: int
+            maximum number of tokens fetched ahead of the consumer
+
+        Returns
+        -------
+        tokens.TokenPrefetcher
+
+            iterable of TokenResult(user_id, token_type, token, error),
+            in the order of pairs
+
+        """
+        from .tokens import TokenPrefetcher
+        return TokenPrefetcher(self._prefetch_token, pairs, max_workers, lookahead)
+
+
+    def user_delete_data_many(self, user_ids, token_type='owner',
+                              max_workers=8, progress=None, endpoint=None):
+        """
+        Delete the data of many users concurrently, each using their own token.
+
+        Tokens are fetched ahead of the deletions, see prefetch_tokens.
+        A concurrency limiter sees the token requests and the deletions
+        as separate requests.
+
+        Parameters
+        ----------
+        user_ids: iterable
+        token_type: str
+            <owner, user>
+        max_workers: int
+        progress: callable
+            optional, progress(done, total, item_result) after each user
+        endpoint: str
+
+        Returns
+        -------
+        bulk.BulkResult
+
+        """
+        from .bulk import run_many
+        # user_id -> prefetched tokens, in order, a user_id may be repeated
+        tokens = defaultdict(deque)
+        def prefetched(user_ids):
+            pairs = ((user_id, token_type) for user_id in user_ids)
+            for result in self.prefetch_tokens(pairs, max_workers, max_workers * 4):
+                tokens[result.user_id].append(result)
+                yield result.user_id
+        def delete_data(user_id):
+            result = tokens[user_id].popleft()
+            if result.error:
+                raise Exception('Could not get token: %s' % result.error)
+            return self.user_delete_data({}, result.token, endpoint=endpoint)
+        return run_many(delete_data, prefetched(user_ids), max_workers, progress,
+                        self.limiter)
 
 
     def group_create(self, data, token, endpoint=None):
@@ -307,7 +751,9 @@ class PgNeedToKnowClient(object):
         if not endpoint:
             endpoint = self.api_endpoints['group_create']
         self._assert_keys_present(['group_name', 'group_metadata'], data.keys())
-        return self._http_post_authenticated(endpoint, payload=data, token=token)
+        resp = self._http_post_authenticated(endpoint, payload=data, token=token)
+        self._invalidate('groups')
+        return resp
 
 
     def group_add_members(self, data, token, endpoint=None):
@@ -340,17 +786,19 @@ class PgNeedToKnowClient(object):
             endpoint = self.api_endpoints['group_add_members']
         keys = data.keys()
         if 'members' in keys:
-            return self._group_add_members_members(data, token, endpoint)
+            resp = self._group_add_members_members(data, token, endpoint)
         elif 'metadata' in keys:
-            return self._group_add_members_metadata(data, token, endpoint)
+            resp = self._group_add_members_metadata(data, token, endpoint)
         elif 'add_all' in keys:
-            return self._group_add_members_all(data, token, endpoint)
+            resp = self._group_add_members_all(data, token, endpoint)
         elif 'add_all_owners' in keys:
-            return self._group_add_members_all_owners(data, token, endpoint)
+            resp = self._group_add_members_all_owners(data, token, endpoint)
         elif 'add_all_users' in keys:
-            return self._group_add_members_all_users(data, token, endpoint)
+            resp = self._group_add_members_all_users(data, token, endpoint)
         else:
             raise Exception('Could not match keys to a method')
+        self._invalidate('group_members:' + data['group_name'], 'user_groups')
+        return resp
 
 
     def _group_add_members_members(self, data, token, endpoint):
@@ -392,7 +840,9 @@ class PgNeedToKnowClient(object):
         if not endpoint:
             endpoint = self.api_endpoints['group_list_members']
         self._assert_keys_present(['group_name'], data.keys())
-        return self._http_post_authenticated(endpoint, payload=data, token=token)
+        return self._cached(('group_list_members', endpoint, token, data['group_name']),
+                            ['group_members', 'group_members:' + data['group_name']],
+                            lambda: self._http_post_authenticated(endpoint, payload=data, token=token))
 
 
     def group_remove_members(self, data, token, endpoint=None):
@@ -421,13 +871,15 @@ class PgNeedToKnowClient(object):
             endpoint = self.api_endpoints['group_remove_members']
         keys = data.keys()
         if 'members' in keys:
-            return self._group_remove_members_members(data, token, endpoint)
+            resp = self._group_remove_members_members(data, token, endpoint)
         elif 'metadata' in keys:
-            return self._group_remove_members_metadata(data, token, endpoint)
+            resp = self._group_remove_members_metadata(data, token, endpoint)
         elif 'remove_all' in keys:
-            return self._group_remove_members_all(data, token, endpoint)
+            resp = self._group_remove_members_all(data, token, endpoint)
         else:
             raise Exception('Could not match keys to a method')
+        self._invalidate('group_members:' + data['group_name'], 'user_groups')
+        return resp
 
 
 
@@ -446,6 +898,41 @@ class PgNeedToKnowClient(object):
         return self._http_post_authenticated(endpoint, payload=data, token=token)
 
 
+    def group_sync_members(self, data, token, batch_size=1000, dry_run=False,
+                           use_registrations=False):
+        """
+        Make a group's membership match a desired set of members,
+        adding and removing only the differences.
+
+        Parameters
+        ----------
+        data: dict
+            {'group_name': 'group1',
+             'data_owners': ['A', 'B'] or 'all',
+             'data_users': ['X'] or 'all'}
+        token: str
+            JWT, role=admin
+        batch_size: int
+            maximum number of members per call
+        dry_run: bool
+            only compute the changes
+        use_registrations: bool
+            also fetch the user registrations, to add members with
+            add_all_owners, add_all_users or by metadata where that
+            takes fewer calls
+
+        Returns
+        -------
+        dict
+
+            {group_name, added, removed, calls, naive_calls, calls_saved, failed}
+
+        """
+        from .membership import sync_group_members
+        return sync_group_members(self, data, token, batch_size, dry_run,
+                                  use_registrations)
+
+
     def group_delete(self, data, token, endpoint=None):
         """
         Parameters
@@ -459,7 +946,9 @@ class PgNeedToKnowClient(object):
         if not endpoint:
             endpoint = self.api_endpoints['group_delete']
         self._assert_keys_present(['group_name'], data.keys())
-        return self._http_post_authenticated(endpoint, payload=data, token=token)
+        resp = self._http_post_authenticated(endpoint, payload=data, token=token)
+        self._invalidate('groups', 'group_members:' + data['group_name'], 'user_groups', 'table_overview')
+        return resp
 
 
     def get_table_overview(self, token, endpoint=None):
@@ -479,7 +968,8 @@ class PgNeedToKnowClient(object):
         """
         if not endpoint:
             endpoint = self.api_endpoints['table_overview']
-        return self.get_data(token, endpoint)
+        return self._cached(('table_overview', endpoint, token), ['table_overview'],
+                            lambda: self.get_data(token, endpoint))
 
 
     def get_user_registrations(self, token, endpoint=None):
@@ -519,7 +1009,8 @@ class PgNeedToKnowClient(object):
         """
         if not endpoint:
             endpoint = self.api_endpoints['groups']
-        return self.get_data(token, endpoint)
+        return self._cached(('groups', endpoint, token), ['groups'],
+                            lambda: self.get_data(token, endpoint))
 
 
     def get_event_log_user_group_removals(self, token, endpoint=None):
@@ -622,17 +1113,492 @@ class PgNeedToKnowClient(object):
         return self.get_data(token, endpoint)
 
 
+    def apply_plan(self, plan, token, max_workers=8):
+        """
+        Create everything described by an access control plan,
+        running independent calls concurrently.
+
+        Parameters
+        ----------
+        plan: plan.AccessPlan
+        token: str
+            JWT, role=admin
+        max_workers: int
+            maximum number of calls in flight, unless the
+            client has a concurrency limiter
+
+        Returns
+        -------
+        plan.PlanResult
+
+            with the status and timing of each step
+
+        """
+        return plan.apply(self, token, max_workers)
+
+
+    def tail_event_logs(self, token, logs=None, checkpoints=None, **kwargs):
+        """
+        Follow the event logs, fetching only rows added since the last poll.
+
+        Parameters
+        ----------
+        token: str or callable
+            admin JWT, or a function returning one
+        logs: list
+            event log names, e.g. ['event_log_data_access'], default all
+        checkpoints: str or checkpoint store
+            path of a JSON file to persist checkpoints in, or a store,
+            by default checkpoints are kept in memory
+        kwargs:
+            page_size, checkpoint_every
+
+        Returns
+        -------
+        tail.EventLogTail
+
+        """
+        from .tail import EventLogTail, FileCheckpointStore
+        if isinstance(checkpoints, str):
+            checkpoints = FileCheckpointStore(checkpoints)
+        return EventLogTail(self, token, logs, checkpoints, **kwargs)
+
+
     def post_data(self, data, token, endpoint):
         return self._http_post_authenticated(endpoint, payload=data, token=token)
 
 
+    def post_data_many(self, rows, token, endpoint, batch_size=500,
+                       max_bytes=1048576, return_minimal=True, max_workers=4,
+                       progress=None):
+        """
+        Insert many rows, sending each batch of rows as one JSON array.
+
+        Parameters
+        ----------
+        rows: iterable
+            of dicts, rows in one call should have the same keys
+        token: str
+            JWT
+        endpoint: str
+            API endpoint, e.g. '/t1'
+        batch_size: int
+            maximum number of rows per request
+        max_bytes: int
+            maximum request body size
+        return_minimal: bool
+            send 'Prefer: return=minimal', so inserted rows are not returned
+        max_workers: int
+            maximum number of requests in flight
+        progress: callable
+            optional, progress(done, total, item_result) after each batch
+
+        Returns
+        -------
+        bulk.BulkResult
+
+            one item per batch, rows are kept only for failed batches
+
+        """
+        from .bulk import batches, run_many
+        headers = dict(self._auth_headers(token, True))
+        if return_minimal:
+            headers['Prefer'] = 'return=minimal'
+        def post(batch):
+            resp = self._http_post_raw(endpoint, headers, batch.body())
+            if resp.status_code < 400:
+                batch.rows = None
+            return resp
+        return run_many(post, batches(rows, batch_size, max_bytes, self.codec.dumps),
+                        max_workers, progress, self.limiter)
+
+
+    def publish_data_many(self, rows, token, endpoint, **kwargs):
+        """
+        Make many rows available to specific data owners, in batches.
+
+        Parameters
+        ----------
+        rows: iterable
+            of (data, recipient) tuples, as for publish_data
+        token: str
+            JWT
+        endpoint: str
+            API endpoint
+        kwargs:
+            batching options, as for post_data_many
+
+        Returns
+        -------
+        bulk.BulkResult
+
+        """
+        def owned(rows):
+            for data, recipient in rows:
+                row = dict(data)
+                row['row_owner'] = 'owner_' + recipient
+                yield row
+        return self.post_data_many(owned(rows), token, endpoint, **kwargs)
+
+
+    def ingest(self, source, table_name, token, fmt=None, progress=None, **kwargs):
+        """
+        Load a CSV or NDJSON file into a table, on behalf of the data owners
+        named in its rows, resuming from the last checkpoint.
+
+        Parameters
+        ----------
+        source: str or file
+            path, or a file opened in binary mode
+        table_name: str
+        token: str
+            JWT used to read the table metadata
+        fmt: str
+            <csv, ndjson>, by default from the file name
+        progress: callable
+            optional, progress(summary) after each segment
+        kwargs:
+            owner_column, checkpoints, rejects, batching and
+            concurrency options, as for ingest.Ingest
+
+        Returns
+        -------
+        ingest.IngestResult
+
+        """
+        from .ingest import Ingest
+        return Ingest(self, table_name, token, **kwargs).run(source, fmt, progress)
+
+
     def patch_data(self, data, token , endpoint):
-        return self._http_patch_authenticated(endpoint, payload=data, token=token)
+        """
+        Parameters
+        ----------
+        data: dict
+            column -> new value
+        token: str
+            JWT
+        endpoint: str or query.Query
+            API endpoint, with filters selecting the rows to update,
+            e.g. '/t1?row_originator=eq.user_X'
+
+        """
+        return self._http_patch_authenticated(str(endpoint), payload=data, token=token)
 
 
     def get_data(self, token, endpoint):
-        headers = {'Authorization': 'Bearer ' + token}
-        return self._http_get(endpoint, headers)
+        """
+        Parameters
+        ----------
+        token: str
+            JWT
+        endpoint: str or query.Query
+            API endpoint, e.g. '/t1', or a Query selecting
+            only the columns and rows needed
+
+        """
+        headers = self._auth_headers(token)
+        return self._http_get(str(endpoint), headers)
+
+
+    def stream_data(self, token, endpoint, chunk_size=65536):
+        """
+        Stream the rows of a table or view, decoding the response incrementally.
+
+        Rows are yielded as soon as they have been received, and the full
+        response body is never held in memory.
+
+        Parameters
+        ----------
+        token: str
+            JWT
+        endpoint: str or query.Query
+            API endpoint
+        chunk_size: int
+            number of bytes read from the connection at a time
+
+        Returns
+        -------
+        generator of dict
+
+        """
+        endpoint = str(endpoint)
+        headers = self._auth_headers(token)
+        resp = self._http_get(endpoint, headers, stream=True)
+        try:
+            if resp.status_code >= 400:
+                raise Exception('Could not fetch %s: %d %s'
+                                % (endpoint, resp.status_code, resp.text))
+            for row in iter_json_array(resp.iter_content(chunk_size)):
+                yield row
+        finally:
+            resp.close()
+
+
+    def export_table(self, table_name, token, endpoint=None, path=None,
+                     chunk_size=65536):
+        """
+        Stream the rows of a table into typed column buffers, with
+        column types from table_metadata.
+
+        Parameters
+        ----------
+        table_name: str
+        token: str
+            JWT
+        endpoint: str or query.Query
+            API endpoint, may include filters, default '/' + table_name
+        path: str
+            optional, also write the table to a .parquet or .feather file
+        chunk_size: int
+            number of bytes read from the connection at a time
+
+        Returns
+        -------
+        export.ColumnarTable
+
+        """
+        # imported here, numpy and pyarrow take a while to import
+        from .export import to_columns
+        from .ingest import column_types
+        types = column_types(self, table_name, token)
+        table = to_columns(self.stream_data(token, endpoint or '/' + table_name,
+                                            chunk_size), types)
+        if path:
+            table.write(path)
+        return table
+
+
+    def export_event_log(self, log, token, path=None, chunk_size=65536):
+        """
+        Stream an event log into typed column buffers,
+        with column types inferred from the values.
+
+        Parameters
+        ----------
+        log: str
+            event log name, e.g. 'event_log_data_access'
+        token: str
+            JWT, role=admin
+        path: str
+            optional, also write the table to a .parquet or .feather file
+        chunk_size: int
+
+        Returns
+        -------
+        export.ColumnarTable
+
+        """
+        from .export import to_columns
+        table = to_columns(self.stream_data(token, self.api_endpoints[log], chunk_size))
+        if path:
+            table.write(path)
+        return table
+
+
+    def iter_data(self, token, endpoint, page_size=1000, order=None,
+                  keyset=None, prefetch=False):
+        """
+        Iterate over the rows of a table or view, fetching one page at a time.
+
+        Parameters
+        ----------
+        token: str
+            JWT
+        endpoint: str or query.Query
+            API endpoint, may include filters, e.g. '/t1?age=gt.18',
+            but not a limit, offset or, with order or keyset, ordering
+        page_size: int
+            number of rows per request
+        order: str
+            column to order by, so offset pages are stable
+        keyset: str
+            unique column to page on instead of using offsets
+        prefetch: bool
+            fetch the next page while the current one is consumed
+
+        Returns
+        -------
+        generator of dict
+
+        """
+        headers = self._auth_headers(token)
+        def fetch(path):
+            resp = self._http_get(path, headers)
+            if resp.status_code >= 400:
+                raise Exception('Could not fetch %s: %d %s'
+                                % (path, resp.status_code, resp.text))
+            return self.json(resp)
+        return paginate(fetch, str(endpoint), page_size, order, keyset, prefetch)
+
+
+    def iter_user_registrations(self, token, endpoint=None, **kwargs):
+        """
+        Paged version of get_user_registrations, kwargs as for iter_data.
+        """
+        if not endpoint:
+            endpoint = self.api_endpoints['user_registrations']
+        kwargs.setdefault('order', 'registration_date,user_name')
+        return self.iter_data(token, endpoint, **kwargs)
+
+
+    def iter_event_log_user_group_removals(self, token, endpoint=None, **kwargs):
+        """
+        Paged version of get_event_log_user_group_removals, kwargs as for iter_data.
+        """
+        if not endpoint:
+            endpoint = self.api_endpoints['event_log_user_group_removals']
+        kwargs.setdefault('order', _event_log_order('event_log_user_group_removals'))
+        return self.iter_data(token, endpoint, **kwargs)
+
+
+    def iter_event_log_user_data_deletions(self, token, endpoint=None, **kwargs):
+        """
+        Paged version of get_event_log_user_data_deletions, kwargs as for iter_data.
+        """
+        if not endpoint:
+            endpoint = self.api_endpoints['event_log_user_data_deletions']
+        kwargs.setdefault('order', _event_log_order('event_log_user_data_deletions'))
+        return self.iter_data(token, endpoint, **kwargs)
+
+
+    def iter_event_log_data_access(self, token, endpoint=None, **kwargs):
+        """
+        Paged version of get_event_log_data_access, kwargs as for iter_data.
+        """
+        if not endpoint:
+            endpoint = self.api_endpoints['event_log_data_access']
+        kwargs.setdefault('order', _event_log_order('event_log_data_access'))
+        return self.iter_data(token, endpoint, **kwargs)
+
+
+    def iter_event_log_access_control(self, token, endpoint=None, **kwargs):
+        """
+        Paged version of get_event_log_access_control, kwargs as for iter_data.
+        """
+        if not endpoint:
+            endpoint = self.api_endpoints['event_log_access_control']
+        if 'order' not in kwargs:
+            kwargs.setdefault('keyset', 'id')
+        return self.iter_data(token, endpoint, **kwargs)
+
+
+    def iter_event_log_data_updates(self, token, endpoint=None, **kwargs):
+        """
+        Paged version of get_event_log_data_updates, kwargs as for iter_data.
+        """
+        if not endpoint:
+            endpoint = self.api_endpoints['event_log_data_updates']
+        kwargs.setdefault('order', _event_log_order('event_log_data_updates'))
+        return self.iter_data(token, endpoint, **kwargs)
+
+
+    def count(self, token, endpoint, count='exact'):
+        """
+        Number of rows of a table or view, without fetching them.
+
+        Asks PostgREST for the count in the Content-Range header of a
+        request for no rows, and falls back to streaming and counting
+        the rows if the server does not return one.
+
+        Parameters
+        ----------
+        token: str
+            JWT
+        endpoint: str or query.Query
+            API endpoint, may include filters, but not a limit or offset
+        count: str
+            <exact, planned, estimated>, planned and estimated use the
+            query planner's estimate, which is much cheaper on large tables
+
+        Returns
+        -------
+        int
+
+        """
+        if count not in COUNT_METHODS:
+            raise Exception('Unsupported count: %s, use one of %s' % (count, COUNT_METHODS))
+        endpoint = str(endpoint)
+        headers = dict(self._auth_headers(token))
+        headers['Prefer'] = 'count=' + count
+        resp = self._http_get(page_endpoint(endpoint, 0), headers)
+        if resp.status_code >= 400:
+            raise Exception('Could not count %s: %d %s'
+                            % (endpoint, resp.status_code, resp.text))
+        total = content_range_total(resp.headers.get('Content-Range'))
+        if total is None:
+            total = sum(1 for row in self.stream_data(token, endpoint))
+        return total
+
+
+    def _count_rpc(self, endpoint, data, token):
+        headers = self._auth_headers(token, True)
+        resp = self._request('post', self._url(endpoint), headers=headers,
+                             data=self.codec.dumps(data), stream=True)
+        try:
+            if resp.status_code >= 400:
+                raise Exception('Could not count %s: %d %s'
+                                % (endpoint, resp.status_code, resp.text))
+            return sum(1 for row in iter_json_array(resp.iter_content(65536)))
+        finally:
+            resp.close()
+
+
+    def count_group_members(self, data, token, endpoint=None):
+        """
+        Number of members of a group.
+
+        group_list_members is a function, which PostgREST cannot count,
+        so its result is streamed and counted without being kept.
+
+        Parameters
+        ----------
+        data: dict
+            {'group_name': 'group1'}
+        token: str
+            JWT, role=admin
+        endpoint: str
+
+        Returns
+        -------
+        int
+
+        """
+        if not endpoint:
+            endpoint = self.api_endpoints['group_list_members']
+        self._assert_keys_present(['group_name'], data.keys())
+        return self._count_rpc(endpoint, data, token)
+
+
+    def count_user_registrations(self, token, endpoint=None, count='exact'):
+        """
+        Number of registered users, count as for count.
+        """
+        if not endpoint:
+            endpoint = self.api_endpoints['user_registrations']
+        return self.count(token, endpoint, count)
+
+
+    def count_event_log(self, log, token, endpoint=None, count='exact'):
+        """
+        Parameters
+        ----------
+        log: str
+            event log name, e.g. 'event_log_data_access'
+        token: str
+            JWT, role=admin
+        endpoint: str or query.Query
+            optional, the log's endpoint with filters,
+            e.g. Query('event_log_data_access').eq('data_user', 'user_X')
+        count: str
+            <exact, planned, estimated>
+
+        Returns
+        -------
+        int
+
+        """
+        return self.count(token, endpoint or self.api_endpoints[log], count)
 
 
     def publish_data(self, data, recipient, token, endpoint):
@@ -0,0 +1,102 @@
+
+import json
+
+
+class JsonCodec(object):
+
+    """
+    JSON encoding to, and decoding from, bytes with the standard library.
+    """
+
+    name = 'json'
+
+    def __init__(self):
+        # json.dumps builds a new encoder per call when given any options
+        self._encode = json.JSONEncoder(separators=(',', ':')).encode
+        self._decode = json.JSONDecoder().decode
+
+
+    def dumps(self, obj):
+        return self._encode(obj).encode('utf-8')
+
+
+    def loads(self, data):
+        if isinstance(data, bytes):
+            data = data.decode('utf-8')
+        return self._decode(data)
+
+
+class OrjsonCodec(object):
+
+    """
+    JSON encoding to, and decoding from, bytes with orjson.
+    """
+
+    name = 'orjson'
+
+    def __init__(self):
+        # imported here, only when asked for
+        try:
+            import orjson
+        except ImportError:
+            raise Exception('orjson is required for OrjsonCodec')
+        self._dumps = orjson.dumps
+        self._loads = orjson.loads
+
+
+    def dumps(self, obj):
+        return self._dumps(obj)
+
+
+    def loads(self, data):
+        return self._loads(data)
+
+
+CODECS = {'json': JsonCodec, 'orjson': OrjsonCodec}
+
+
+def available_codecs():
+    """
+    Returns
+    -------
+    list
+
+        an instance of each codec whose dependencies are installed
+
+    """
+    codecs = []
+    for name in sorted(CODECS):
+        try:
+            codecs.append(CODECS[name]())
+        except Exception:
+            pass
+    return codecs
+
+
+def default_codec():
+    """
+    JsonCodec, orjson is only used when asked for, since it rejects
+    non-str dict keys and integers over 64 bits, and its output differs.
+    """
+    return JsonCodec()
+
+
+def create_codec(codec=None):
+    """
+    Parameters
+    ----------
+    codec: str or object
+        optional, <json, orjson>, or a codec object, default default_codec()
+
+    Returns
+    -------
+    codec object
+
+    """
+    if codec is None:
+        return default_codec()
+    if isinstance(codec, str):
+        if codec not in CODECS:
+            raise Exception('Unknown codec: %s, use one of %s' % (codec, sorted(CODECS)))
+        return CODECS[codec]()
+    return codec
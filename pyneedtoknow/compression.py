@@ -0,0 +1,78 @@
+
+import gzip
+import io
+import zlib
+
+ACCEPT_ENCODING = 'gzip, deflate'
+ENCODINGS = ['gzip', 'deflate']
+
+
+def compress(body, encoding='gzip', level=6):
+    """
+    Parameters
+    ----------
+    body: bytes or str
+    encoding: str
+        <gzip, deflate>
+    level: int
+        1 (fastest) to 9 (smallest)
+
+    Returns
+    -------
+    bytes
+
+    """
+    if not isinstance(body, bytes):
+        body = body.encode('utf-8')
+    if encoding == 'gzip':
+        buf = io.BytesIO()
+        with gzip.GzipFile(fileobj=buf, mode='wb', compresslevel=level, mtime=0) as f:
+            f.write(body)
+        return buf.getvalue()
+    if encoding == 'deflate':
+        return zlib.compress(body, level)
+    raise Exception('Unsupported encoding: %s, use one of %s' % (encoding, ENCODINGS))
+
+
+def decompress(body, encoding):
+    if encoding == 'gzip':
+        return zlib.decompress(body, 16 + zlib.MAX_WBITS)
+    if encoding == 'deflate':
+        try:
+            return zlib.decompress(body)
+        except zlib.error:
+            # raw deflate, without the zlib header
+            return zlib.decompress(body, -zlib.MAX_WBITS)
+    if encoding in (None, '', 'identity'):
+        return body
+    raise Exception('Unsupported encoding: %s, use one of %s' % (encoding, ENCODINGS))
+
+
+def compress_request(kwargs, encoding='gzip', level=6, min_size=1024):
+    """
+    Compress the data of a request if it is at least min_size bytes.
+
+    Parameters
+    ----------
+    kwargs: dict
+        request arguments, with data and headers
+    encoding: str
+    level: int
+    min_size: int
+
+    Returns
+    -------
+    dict
+
+        kwargs, with compressed data and a Content-Encoding header
+
+    """
+    data = kwargs.get('data')
+    if data is None or len(data) < min_size:
+        return kwargs
+    kwargs = dict(kwargs)
+    headers = dict(kwargs.get('headers') or {})
+    headers['Content-Encoding'] = encoding
+    kwargs['headers'] = headers
+    kwargs['data'] = compress(data, encoding, level)
+    return kwargs
@@ -0,0 +1,250 @@
+
+import threading
+import time
+from collections import deque
+
+
+def overloaded(status_code=None, error=False):
+    """
+    Whether a request's outcome means the server is overloaded:
+    an exception (e.g. a timeout or refused connection), 429, or a 5xx status.
+    """
+    if error:
+        return True
+    return status_code is not None and (status_code == 429 or status_code >= 500)
+
+
+class AdaptiveLimiter(object):
+
+    """
+    Limit on the number of requests in flight that adapts to the server,
+    with additive increase and multiplicative decrease (AIMD).
+
+    While latency stays close to the lowest latency recently seen the limit
+    grows by about increase per round trip. When a request fails with an
+    overload signal, or the smoothed latency rises above latency_tolerance
+    times that baseline, the limit is multiplied by decrease, at most once
+    per round trip. The limit settles just below the point where the
+    server starts queueing, and follows it as load changes.
+
+    One limiter can be shared by several bulk operations, so together they
+    stay within the limit.
+
+        limiter = AdaptiveLimiter(initial=4, max_limit=128)
+        client = PgNeedToKnowClient(concurrency=limiter)
+        client.user_register_many(users)
+        limiter.history()
+
+    """
+
+    def __init__(self, initial=4, min_limit=1, max_limit=64, increase=1.0,
+                 decrease=0.7, latency_tolerance=2.0, smoothing=0.2,
+                 window=200, history_size=1000):
+        """
+        Parameters
+        ----------
+        initial: int
+            starting limit
+        min_limit: int
+        max_limit: int
+            the limit never grows above this, it is also the
+            number of worker threads bulk operations use
+        increase: float
+            added to the limit per round trip without congestion
+        decrease: float
+            the limit is multiplied by this on congestion
+        latency_tolerance: float
+            smoothed latency, relative to the baseline, that counts as congestion
+        smoothing: float
+            weight of the latest latency in the smoothed latency
+        window: int
+            number of recent latencies the baseline is the minimum of
+        history_size: int
+            number of limit changes kept
+
+        """
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_tolerance = latency_tolerance
+        self.smoothing = smoothing
+        self._limit = float(min(max(initial, min_limit), max_limit))
+        self._in_flight = 0
+        self._latencies = deque(maxlen=window)
+        self._smoothed = None
+        self._last_decrease = 0.0
+        self._history = deque(maxlen=history_size)
+        self._condition = threading.Condition()
+        self.completed = 0
+        self.increases = 0
+        self.decreases = 0
+        self._record('initial', None)
+
+
+    @property
+    def limit(self):
+        """
+        Current number of requests allowed in flight.
+        """
+        return int(self._limit)
+
+
+    @property
+    def in_flight(self):
+        return self._in_flight
+
+
+    def _record(self, reason, latency):
+        self._history.append({'time': time.time(), 'limit': int(self._limit),
+                              'reason': reason, 'latency': latency,
+                              'in_flight': self._in_flight})
+
+
+    def acquire(self):
+        """
+        Wait until a request may start.
+        """
+        with self._condition:
+            while self._in_flight >= int(self._limit):
+                self._condition.wait()
+            self._in_flight += 1
+
+
+    def try_acquire(self):
+        """
+        Start a request only if one may start now, without waiting.
+
+        Returns
+        -------
+        bool
+
+        """
+        with self._condition:
+            if self._in_flight >= int(self._limit):
+                return False
+            self._in_flight += 1
+            return True
+
+
+    def release(self, elapsed, status_code=None, error=False):
+        """
+        Report a finished request, and adjust the limit.
+
+        Parameters
+        ----------
+        elapsed: float
+            seconds the request took
+        status_code: int
+            optional, HTTP status
+        error: bool
+            the request raised an exception
+
+        """
+        with self._condition:
+            in_flight = self._in_flight
+            self._in_flight -= 1
+            self.completed += 1
+            self._adjust(elapsed, overloaded(status_code, error), in_flight)
+            self._condition.notify_all()
+
+
+    def _adjust(self, elapsed, overload, in_flight):
+        now = time.time()
+        if not overload:
+            self._latencies.append(elapsed)
+            if self._smoothed is None:
+                self._smoothed = elapsed
+            else:
+                self._smoothed += self.smoothing * (elapsed - self._smoothed)
+        baseline = min(self._latencies) if self._latencies else None
+        congested = overload or (baseline is not None and baseline > 0
+                                 and self._smoothed > baseline * self.latency_tolerance)
+        if congested:
+            # one decrease per round trip, requests that were already in
+            # flight when the limit was lowered report the same congestion
+            if now - self._last_decrease < (self._smoothed or elapsed):
+                return
+            limit = max(self.min_limit, self._limit * self.decrease)
+            if int(limit) < int(self._limit) or limit < self._limit:
+                self._limit = limit
+                self._last_decrease = now
+                self.decreases += 1
+                self._record('error' if overload else 'latency', self._smoothed)
+            return
+        # only grow when the limit is what holds requests back
+        if in_flight < int(self._limit):
+            return
+        previous = int(self._limit)
+        self._limit = min(self.max_limit, self._limit + self.increase / self._limit)
+        if int(self._limit) > previous:
+            self.increases += 1
+            self._record('increase', self._smoothed)
+
+
+    def slot(self):
+        """
+        Context manager around one request, counting exceptions as overload.
+
+            with limiter.slot() as slot:
+                resp = send()
+                slot.status_code = resp.status_code
+
+        """
+        return _Slot(self)
+
+
+    def history(self):
+        """
+        Returns
+        -------
+        list of dict
+
+            {time, limit, reason, latency, in_flight} for every change
+            of the limit, reason is one of initial, increase, latency, error
+
+        """
+        with self._condition:
+            return list(self._history)
+
+
+    def stats(self):
+        """
+        Returns
+        -------
+        dict
+
+            {limit, in_flight, completed, increases, decreases,
+             baseline_ms, smoothed_ms}
+
+        """
+        with self._condition:
+            baseline = min(self._latencies) if self._latencies else None
+            return {'limit': int(self._limit), 'in_flight': self._in_flight,
+                    'completed': self.completed, 'increases': self.increases,
+                    'decreases': self.decreases,
+                    'baseline_ms': None if baseline is None else baseline * 1000,
+                    'smoothed_ms': None if self._smoothed is None else self._smoothed * 1000}
+
+
+    def __repr__(self):
+        return '<AdaptiveLimiter limit=%d in_flight=%d>' % (self.limit, self._in_flight)
+
+
+class _Slot(object):
+
+    def __init__(self, limiter):
+        self.limiter = limiter
+        self.status_code = None
+
+
+    def __enter__(self):
+        self.limiter.acquire()
+        self._start = time.time()
+        return self
+
+
+    def __exit__(self, exc_type, exc, tb):
+        self.limiter.release(time.time() - self._start, self.status_code,
+                             exc_type is not None)
+        return False
@@ -0,0 +1,379 @@
+
+import array
+import json
+from collections import OrderedDict
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+# column type -> kind of buffer, other types are kept as strings
+TYPE_KINDS = {
+    'int': 'int',
+    'integer': 'int',
+    'smallint': 'int',
+    'bigint': 'int',
+    'int2': 'int',
+    'int4': 'int',
+    'int8': 'int',
+    'real': 'float',
+    'float': 'float',
+    'float4': 'float',
+    'float8': 'float',
+    'double precision': 'float',
+    'bool': 'bool',
+    'boolean': 'bool',
+}
+
+SYSTEM_COLUMN_TYPES = {'row_id': 'int', 'row_owner': 'text', 'row_originator': 'text'}
+
+# kind -> array typecode
+TYPECODES = {'int': 'q', 'float': 'd', 'bool': 'b'}
+
+
+def column_kind(column_type):
+    base = (column_type or '').split('(')[0].strip().lower()
+    return TYPE_KINDS.get(base, 'string')
+
+
+def _value_kind(value):
+    if isinstance(value, bool):
+        return 'bool'
+    if isinstance(value, int):
+        return 'int'
+    if isinstance(value, float):
+        return 'float'
+    return 'string'
+
+
+def _encode(value):
+    if isinstance(value, str):
+        return value.encode('utf-8')
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, sort_keys=True).encode('utf-8')
+    if isinstance(value, bool):
+        return b'true' if value else b'false'
+    return str(value).encode('utf-8')
+
+
+def _pack_bits(values):
+    # one byte per value, 0 or 1, to Arrow's least significant bit first bitmap
+    if numpy is not None:
+        bits = numpy.frombuffer(values, dtype=numpy.uint8)
+        return pyarrow.py_buffer(numpy.packbits(bits, bitorder='little').tobytes())
+    bitmap = bytearray((len(values) + 7) // 8)
+    for i, value in enumerate(values):
+        if value:
+            bitmap[i >> 3] |= 1 << (i & 7)
+    return pyarrow.py_buffer(bytes(bitmap))
+
+
+class Column(object):
+
+    """
+    Values of one column in a contiguous typed buffer, with a validity byte
+    per row. Strings are kept as UTF-8 bytes in one buffer with an array of
+    end offsets, the layout Arrow uses.
+
+    A declared kind is kept, values are coerced to it, or rejected if they
+    cannot be without losing information. An inferred kind is widened as
+    values need it: bool to int to float, and to string for anything else.
+    Bools are treated as ints, 0 and 1, either way.
+    """
+
+    def __init__(self, name, kind=None, length=0):
+        """
+        Parameters
+        ----------
+        name: str
+        kind: str
+            <int, float, bool, string>, declared, inferred from the values if None
+        length: int
+            number of null rows to start with
+
+        """
+        self.name = name
+        self.kind = None
+        self.declared = kind is not None
+        self.valid = bytearray(length)
+        self.null_count = length
+        self._reset(kind)
+        for i in range(length):
+            self._append_null()
+
+
+    def _reset(self, kind):
+        self.kind = kind
+        self.values = array.array(TYPECODES[kind]) if kind in TYPECODES else None
+        self.offsets = array.array('q', [0]) if kind == 'string' else None
+        self.data = bytearray() if kind == 'string' else None
+
+
+    def __len__(self):
+        return len(self.valid)
+
+
+    def _append_null(self):
+        if self.kind == 'string':
+            self.offsets.append(len(self.data))
+        elif self.kind is not None:
+            self.values.append(0)
+
+
+    def append(self, value):
+        if value is None:
+            self.valid.append(0)
+            self.null_count += 1
+            self._append_null()
+            return
+        if self.kind != 'string':
+            kind = _value_kind(value)
+            if kind != self.kind:
+                if self.declared:
+                    value = self._coerce(value)
+                else:
+                    self._promote(kind)
+        self.valid.append(1)
+        if self.kind == 'string':
+            self.data += _encode(value)
+            self.offsets.append(len(self.data))
+        else:
+            self.values.append(value)
+
+
+    def _coerce(self, value):
+        try:
+            if self.kind == 'float':
+                # PostgreSQL sends NaN and Infinity as strings
+                return float(value)
+            if not isinstance(value, str):
+                if self.kind == 'int' and int(value) == value:
+                    return int(value)
+                if self.kind == 'bool' and value in (0, 1):
+                    return bool(value)
+        except (TypeError, ValueError, OverflowError):
+            pass
+        raise Exception('Column %s is %s, cannot store %r' % (self.name, self.kind, value))
+
+
+    def _promote(self, kind):
+        if self.kind is None:
+            self._reset(kind)
+            for i in range(len(self.valid)):
+                self._append_null()
+            return
+        if (self.kind, kind) in (('int', 'float'), ('bool', 'float')):
+            target = 'float'
+        elif (self.kind, kind) == ('bool', 'int'):
+            target = 'int'
+        elif (self.kind, kind) in (('float', 'int'), ('float', 'bool'), ('int', 'bool')):
+            return
+        else:
+            target = 'string'
+        previous, values = self.kind, self.values
+        self._reset(target)
+        if target == 'string':
+            for value, valid in zip(values, self.valid):
+                if valid:
+                    self.data += _encode(bool(value) if previous == 'bool' else value)
+                self.offsets.append(len(self.data))
+        else:
+            self.values.fromlist(values.tolist())
+
+
+    @property
+    def nbytes(self):
+        size = len(self.valid)
+        if self.values is not None:
+            size += self.values.itemsize * len(self.values)
+        if self.data is not None:
+            size += self.offsets.itemsize * len(self.offsets) + len(self.data)
+        return size
+
+
+    def strings(self):
+        """
+        Returns
+        -------
+        generator of str or None
+
+        """
+        data, offsets = self.data, self.offsets
+        for i, valid in enumerate(self.valid):
+            yield data[offsets[i]:offsets[i + 1]].decode('utf-8') if valid else None
+
+
+    def to_numpy(self):
+        """
+        Numeric and boolean columns share their buffer with the returned array,
+        masked if they have nulls. Strings become an object array.
+        """
+        if numpy is None:
+            raise Exception('numpy is required for to_numpy')
+        if self.kind == 'string' or self.kind is None:
+            return numpy.array(list(self.strings()), dtype=object)
+        values = numpy.frombuffer(self.values, dtype=TYPECODES[self.kind])
+        if self.kind == 'bool':
+            values = values.view(numpy.bool_)
+        if not self.null_count:
+            return values
+        mask = numpy.frombuffer(bytes(self.valid), dtype=numpy.uint8) == 0
+        return numpy.ma.masked_array(values, mask=mask)
+
+
+    def _bitmap(self):
+        if not self.null_count:
+            return None
+        return _pack_bits(self.valid)
+
+
+    def to_arrow(self):
+        """
+        Arrow array over the column's buffers, without copying them,
+        except for boolean values, which Arrow stores as bits.
+        """
+        if pyarrow is None:
+            raise Exception('pyarrow is required for to_arrow')
+        length = len(self.valid)
+        if self.kind == 'string' or self.kind is None:
+            offsets = self.offsets if self.kind else array.array('q', [0] * (length + 1))
+            return pyarrow.Array.from_buffers(pyarrow.large_string(), length,
+                                              [self._bitmap(), pyarrow.py_buffer(offsets),
+                                               pyarrow.py_buffer(self.data or b'')],
+                                              null_count=self.null_count)
+        if self.kind == 'bool':
+            values = _pack_bits(self.values)
+        else:
+            values = pyarrow.py_buffer(self.values)
+        arrow_type = {'int': pyarrow.int64, 'float': pyarrow.float64,
+                      'bool': pyarrow.bool_}[self.kind]()
+        return pyarrow.Array.from_buffers(arrow_type, length, [self._bitmap(), values],
+                                          null_count=self.null_count)
+
+
+class ColumnarTable(object):
+
+    """
+    Rows of a table or view stored column by column in typed buffers.
+    """
+
+    def __init__(self, columns):
+        self.columns = OrderedDict((c.name, c) for c in columns)
+
+
+    @property
+    def names(self):
+        return [c.name for c in self.columns.values()]
+
+
+    @property
+    def num_rows(self):
+        return len(next(iter(self.columns.values()))) if self.columns else 0
+
+
+    @property
+    def nbytes(self):
+        return sum(c.nbytes for c in self.columns.values())
+
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+
+    def __len__(self):
+        return self.num_rows
+
+
+    def to_numpy(self):
+        """
+        Returns
+        -------
+        dict
+
+            column name -> numpy array
+
+        """
+        return dict((c.name, c.to_numpy()) for c in self.columns.values())
+
+
+    def to_arrow(self):
+        """
+        Returns
+        -------
+        pyarrow.Table
+
+        """
+        if pyarrow is None:
+            raise Exception('pyarrow is required for to_arrow')
+        return pyarrow.Table.from_arrays([c.to_arrow() for c in self.columns.values()],
+                                         names=self.names)
+
+
+    def write(self, path, fmt=None):
+        """
+        Parameters
+        ----------
+        path: str
+        fmt: str
+            <parquet, feather>, by default from the file extension
+
+        """
+        if pyarrow is None:
+            raise Exception('pyarrow is required for write')
+        fmt = fmt or ('feather' if path.endswith(('.feather', '.arrow')) else 'parquet')
+        if fmt == 'parquet':
+            from pyarrow import parquet
+            parquet.write_table(self.to_arrow(), path)
+        elif fmt == 'feather':
+            from pyarrow import feather
+            feather.write_feather(self.to_arrow(), path)
+        else:
+            raise Exception('Unsupported format: %s, use one of parquet, feather' % fmt)
+
+
+    def __repr__(self):
+        return '<ColumnarTable rows=%d columns=%d nbytes=%d>' % (self.num_rows,
+                                                                 len(self.columns),
+                                                                 self.nbytes)
+
+
+def to_columns(rows, types=None):
+    """
+    Append rows to typed column buffers as they are read.
+
+    Parameters
+    ----------
+    rows: iterable
+        of dicts
+    types: dict
+        column_name -> column_type, e.g. from table_metadata,
+        columns without a type have it inferred from their values
+
+    Returns
+    -------
+    ColumnarTable
+
+    """
+    kinds = dict(SYSTEM_COLUMN_TYPES)
+    kinds.update(types or {})
+    kinds = dict((name, column_kind(t)) for name, t in kinds.items())
+    columns = []
+    by_name = {}
+    count = 0
+    for row in rows:
+        if len(row) != len(columns) or any(name not in by_name for name in row):
+            for name in row:
+                if name not in by_name:
+                    column = Column(name, kinds.get(name), count)
+                    by_name[name] = column
+                    columns.append(column)
+        for column in columns:
+            column.append(row.get(column.name))
+        count += 1
+    return ColumnarTable(columns)
@@ -0,0 +1,228 @@
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures import TimeoutError as FutureTimeout
+
+
+class Hedger(object):
+
+    """
+    Hedged calls: if a call has not returned after a delay, the same call
+    is sent again and whichever returns first is used.
+
+    The delay is a percentile of recent latencies, so only the slowest
+    calls are hedged, and at most max_extra hedges are sent per call made,
+    to cap the extra load. Only use this for idempotent calls.
+
+    The delay is measured from when a call starts running, not from when
+    it was queued. When all max_workers threads are busy, calls run in the
+    caller's thread and are not hedged, so a busy client does not add
+    hedges while the server is already saturated.
+
+    Calls wrapped with a concurrency limiter only send a hedge if the
+    limiter has a free slot, and report the hedge to it as a request.
+    """
+
+    def __init__(self, percentile=95, delay=None, initial_delay=0.05,
+                 min_delay=0.001, max_extra=0.05, window=1000,
+                 min_samples=20, max_workers=64):
+        """
+        Parameters
+        ----------
+        percentile: float
+            hedge calls slower than this percentile of recent latencies
+        delay: float
+            optional, fixed delay in seconds instead of a percentile
+        initial_delay: float
+            seconds, used until min_samples latencies have been seen
+        min_delay: float
+            lower bound on the delay, seconds
+        max_extra: float
+            maximum number of hedges per call, e.g. 0.05 for 5% extra load
+        window: int
+            number of recent latencies the percentile is taken over
+        min_samples: int
+        max_workers: int
+            maximum number of calls and hedges in flight
+
+        """
+        self.percentile = percentile
+        self.fixed_delay = delay
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.max_extra = max_extra
+        self.min_samples = min_samples
+        self.latencies = deque(maxlen=window)
+        self.calls = 0
+        self.fired = 0
+        self.won = 0
+        self._delay = initial_delay
+        self._since_update = 0
+        self._lock = threading.Lock()
+        self.max_workers = max_workers
+        self._pending = 0
+        self.backlogged = 0
+        self.limited = 0
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+
+    def delay(self):
+        if self.fixed_delay is not None:
+            return self.fixed_delay
+        with self._lock:
+            if len(self.latencies) >= self.min_samples and self._since_update >= 10:
+                ordered = sorted(self.latencies)
+                rank = int(self.percentile / 100.0 * (len(ordered) - 1))
+                self._delay = max(ordered[rank], self.min_delay)
+                self._since_update = 0
+            return self._delay
+
+
+    def _record(self, elapsed):
+        with self._lock:
+            self.latencies.append(elapsed)
+            self._since_update += 1
+
+
+    def _run(self, started, func, args, kwargs, limiter=None):
+        started.set()
+        start = time.time()
+        try:
+            result = func(*args, **kwargs)
+        except Exception:
+            if limiter is not None:
+                limiter.release(time.time() - start, error=True)
+            raise
+        elapsed = time.time() - start
+        self._record(elapsed)
+        if limiter is not None:
+            limiter.release(elapsed, getattr(result, 'status_code', None))
+        return result
+
+
+    def _submit(self, func, *args):
+        with self._lock:
+            self._pending += 1
+        future = self._executor.submit(func, *args)
+        future.add_done_callback(self._done)
+        return future
+
+
+    def _done(self, future):
+        with self._lock:
+            self._pending -= 1
+
+
+    def _allow_hedge(self):
+        with self._lock:
+            if self.fired < self.max_extra * self.calls:
+                self.fired += 1
+                return True
+            return False
+
+
+    def call(self, func, *args, **kwargs):
+        """
+        Call func(*args, **kwargs), hedging it if it is slow.
+        """
+        return self._call(func, args, kwargs)
+
+
+    def _call(self, func, args, kwargs, limiter=None):
+        with self._lock:
+            self.calls += 1
+            backlogged = self._pending >= self.max_workers
+            if backlogged:
+                self.backlogged += 1
+        if backlogged:
+            start = time.time()
+            result = func(*args, **kwargs)
+            self._record(time.time() - start)
+            return result
+        started = threading.Event()
+        primary = self._submit(self._run, started, func, args, kwargs)
+        # the delay counts from when the call starts, not while it is queued
+        started.wait()
+        started_at = time.time()
+        try:
+            return primary.result(timeout=max(self.delay() - (time.time() - started_at), 0))
+        except FutureTimeout:
+            pass
+        with self._lock:
+            backlogged = self._pending >= self.max_workers
+        if backlogged or not self._allow_hedge():
+            return primary.result()
+        if limiter is not None and not limiter.try_acquire():
+            with self._lock:
+                self.fired -= 1
+                self.limited += 1
+            return primary.result()
+        hedge = self._submit(self._run, threading.Event(), func, args, kwargs, limiter)
+        pending = set([primary, hedge])
+        first = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    first = future
+                    break
+            if first is not None:
+                break
+        if first is None:
+            return primary.result()
+        if first is hedge:
+            with self._lock:
+                self.won += 1
+        for future in pending:
+            future.add_done_callback(_discard)
+        return first.result()
+
+
+    def wrap(self, func, limiter=None):
+        """
+        Parameters
+        ----------
+        func: callable
+        limiter: concurrency.AdaptiveLimiter
+            optional, hedges are only sent when it has a free slot
+
+        Returns
+        -------
+        callable
+
+            func, hedged
+
+        """
+        def hedged(*args, **kwargs):
+            return self._call(func, args, kwargs, limiter)
+        return hedged
+
+
+    def stats(self):
+        """
+        Returns
+        -------
+        dict
+
+            {calls, fired, won, backlogged, limited, delay}, backlogged
+            calls ran without hedging because all workers were busy,
+            limited calls were not hedged because the limiter was full
+
+        """
+        with self._lock:
+            return {'calls': self.calls, 'fired': self.fired, 'won': self.won,
+                    'backlogged': self.backlogged, 'limited': self.limited,
+                    'delay': self.fixed_delay if self.fixed_delay is not None else self._delay}
+
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+
+def _discard(future):
+    if future.exception() is None:
+        close = getattr(future.result(), 'close', None)
+        if close:
+            close()
@@ -0,0 +1,472 @@
+
+import codecs
+import csv
+import gzip
+import json
+import time
+from collections import OrderedDict
+
+from .bulk import batches, run_many
+from .tail import FileCheckpointStore, MemoryCheckpointStore
+from .tokens import TokenCache, TokenPrefetcher
+
+
+def _to_bool(value):
+    lowered = value.strip().lower()
+    if lowered in ('t', 'true', 'y', 'yes', '1'):
+        return True
+    if lowered in ('f', 'false', 'n', 'no', '0'):
+        return False
+    raise ValueError('not a boolean: %r' % value)
+
+
+# column type -> conversion of a str value, other types are sent as str
+COERCIONS = {
+    'int': int,
+    'integer': int,
+    'smallint': int,
+    'bigint': int,
+    'int2': int,
+    'int4': int,
+    'int8': int,
+    'real': float,
+    'float': float,
+    'float4': float,
+    'float8': float,
+    'double precision': float,
+    'bool': _to_bool,
+    'boolean': _to_bool,
+    'json': json.loads,
+    'jsonb': json.loads,
+}
+
+# column types an empty string is a valid value of, blanks in columns
+# of any other type, e.g. date, numeric or uuid, are sent as null
+TEXT_TYPES = frozenset(['text', 'varchar', 'character varying', 'char', 'character',
+                        'bpchar', 'citext', 'name'])
+
+
+def _unchanged(value):
+    return value
+
+
+def column_types(client, table_name, token):
+    """
+    Parameters
+    ----------
+    client: PgNeedToKnowClient
+    table_name: str
+    token: str
+        JWT
+
+    Returns
+    -------
+    dict
+
+        column_name -> column_type
+
+    """
+    resp = client.table_metadata({'table_name': table_name}, token)
+    if resp.status_code >= 400:
+        raise Exception('Could not fetch metadata for %s: %d %s'
+                        % (table_name, resp.status_code, resp.text))
+    return dict((c['column_name'], c['column_type']) for c in client.json(resp))
+
+
+def coercer(types):
+    """
+    Parameters
+    ----------
+    types: dict
+        column_name -> column_type, as returned by column_types
+
+    Returns
+    -------
+    callable
+
+        coerce(row) -> row, converting str values to the column type,
+        empty strings become None for columns that are not text,
+        raises ValueError for values that cannot be converted
+
+    """
+    conversions = {}
+    for name, column_type in types.items():
+        base = (column_type or '').split('(')[0].strip().lower()
+        if base in COERCIONS:
+            conversions[name] = COERCIONS[base]
+        elif base and base not in TEXT_TYPES:
+            conversions[name] = _unchanged
+    def coerce(row):
+        for name, convert in conversions.items():
+            value = row.get(name)
+            if isinstance(value, str):
+                row[name] = convert(value) if value.strip() else None
+        return row
+    return coerce
+
+
+def detect_format(path):
+    name = path.lower()
+    if name.endswith('.gz'):
+        name = name[:-3]
+    if name.endswith('.csv'):
+        return 'csv'
+    if name.endswith(('.ndjson', '.jsonl', '.json')):
+        return 'ndjson'
+    raise Exception('Cannot tell the format of %s, use one of csv, ndjson' % path)
+
+
+class RecordReader(object):
+
+    """
+    Read rows one at a time from a CSV or NDJSON file, keeping track of
+    the byte offset after the last row returned, so reading can resume
+    there with a new reader.
+    """
+
+    def __init__(self, f, fmt='csv', offset=0, fieldnames=None, encoding='utf-8'):
+        """
+        Parameters
+        ----------
+        f: file
+            opened in binary mode, seekable if offset is given
+        fmt: str
+            <csv, ndjson>
+        offset: int
+            byte offset to start reading at, the end of a row
+        fieldnames: list
+            CSV column names, read from the first line if None
+        encoding: str
+
+        """
+        if fmt not in ('csv', 'ndjson'):
+            raise Exception('Unsupported format: %s, use one of csv, ndjson' % fmt)
+        if offset:
+            f.seek(offset)
+        self.fmt = fmt
+        self.offset = offset
+        self.fieldnames = fieldnames
+        self._file = f
+        self._decode = codecs.getdecoder(encoding)
+
+
+    def _lines(self):
+        for line in self._file:
+            self.offset += len(line)
+            yield self._decode(line)[0]
+
+
+    def __iter__(self):
+        lines = self._lines()
+        if self.fmt == 'ndjson':
+            for line in lines:
+                if line.strip():
+                    yield json.loads(line)
+            return
+        reader = csv.reader(lines)
+        if self.fieldnames is None:
+            header = next(reader, None)
+            if header is None:
+                return
+            if header and header[0].startswith(u'\ufeff'):
+                header[0] = header[0][1:]
+            self.fieldnames = header
+        fieldnames = self.fieldnames
+        for values in reader:
+            if values:
+                yield dict(zip(fieldnames, values))
+
+
+def open_source(path):
+    if path.lower().endswith('.gz'):
+        return gzip.open(path, 'rb')
+    return open(path, 'rb')
+
+
+class IngestResult(object):
+
+    """
+    Totals of an ingest run, including the parts done before a restart.
+    """
+
+    def __init__(self, checkpoint, failures, elapsed, resumed=None):
+        self.rows_read = checkpoint['rows_read']
+        self.rows_sent = checkpoint['rows_sent']
+        self.rows_failed = checkpoint['rows_failed']
+        self.rows_invalid = checkpoint['rows_invalid']
+        self.batches = checkpoint['batches']
+        self.offset = checkpoint['offset']
+        self.resumed_from = resumed['offset'] if resumed else 0
+        self._rows_before = resumed['rows_read'] if resumed else 0
+        self.failures = failures
+        self.elapsed = elapsed
+
+
+    @property
+    def throughput(self):
+        """
+        Rows read per second in this run.
+        """
+        if not self.elapsed:
+            return 0.0
+        return (self.rows_read - self._rows_before) / self.elapsed
+
+
+    def summary(self):
+        """
+        Returns
+        -------
+        dict
+
+            {rows_read, rows_sent, rows_failed, rows_invalid, batches,
+             offset, resumed_from, elapsed, throughput}
+
+        """
+        return {'rows_read': self.rows_read, 'rows_sent': self.rows_sent,
+                'rows_failed': self.rows_failed, 'rows_invalid': self.rows_invalid,
+                'batches': self.batches, 'offset': self.offset,
+                'resumed_from': self.resumed_from, 'elapsed': self.elapsed, 'throughput': self.throughput}
+
+
+    def __repr__(self):
+        return ('<IngestResult rows_read=%d rows_sent=%d rows_failed=%d '
+                'rows_invalid=%d elapsed=%.3fs>' % (self.rows_read, self.rows_sent,
+                                                    self.rows_failed, self.rows_invalid,
+                                                    self.elapsed))
+
+
+class Ingest(object):
+
+    """
+    Load rows from a CSV or NDJSON file into a table, on behalf of the
+    data owners named in each row.
+
+    The file is read in segments of segment_rows rows, so memory use does
+    not depend on its size. In each segment rows are converted to the
+    column types from table_metadata and grouped by owner, every owner's
+    token is fetched once, ahead of its rows, and the rows of each owner
+    are sent in batches of JSON arrays, max_workers requests at a time.
+    Once all batches of a segment are done the byte offset reached is
+    saved as a checkpoint, and a restarted run continues from there, so
+    at most one segment is sent again after a crash.
+
+    Rows that cannot be converted, or were in a failed batch, are written
+    to the rejects file, if given, as NDJSON that can be ingested again.
+
+        ingest = Ingest(client, 't1', admin_token, owner_column='owner_id',
+                        checkpoints='ingest.json', rejects='rejects.ndjson')
+        result = ingest.run('submissions.csv.gz')
+
+    """
+
+    def __init__(self, client, table_name, token, owner_column='owner',
+                 endpoint=None, types=None, segment_rows=100000, batch_size=500,
+                 max_bytes=1048576, max_workers=8, checkpoints=None,
+                 checkpoint_name=None, rejects=None, token_cache_size=100000):
+        """
+        Parameters
+        ----------
+        client: PgNeedToKnowClient
+        table_name: str
+        token: str
+            JWT used to read the table metadata
+        owner_column: str
+            column with the data owner's user_id, it is not sent
+        endpoint: str
+            API endpoint, default '/' + table_name
+        types: dict
+            column_name -> column_type, read with table_metadata if None,
+            an empty dict disables conversion
+        segment_rows: int
+            number of rows read between checkpoints
+        batch_size: int
+            maximum number of rows per request
+        max_bytes: int
+            maximum request body size
+        max_workers: int
+            maximum number of requests in flight, unless the
+            client has a concurrency limiter
+        checkpoints: str or checkpoint store
+            path of a JSON file to persist checkpoints in, or a store,
+            by default checkpoints are kept in memory
+        checkpoint_name: str
+            key of the checkpoint in the store, default 'ingest:' + table_name
+        rejects: str
+            optional, path of an NDJSON file rejected rows are appended to
+        token_cache_size: int
+            number of owner tokens kept between segments, if the
+            client has no token_cache
+
+        """
+        self.client = client
+        self.table_name = table_name
+        self.token = token
+        self.owner_column = owner_column
+        self.endpoint = endpoint or '/' + table_name
+        self.types = types
+        self.segment_rows = segment_rows
+        self.batch_size = batch_size
+        self.max_bytes = max_bytes
+        self.max_workers = max_workers
+        if isinstance(checkpoints, str):
+            checkpoints = FileCheckpointStore(checkpoints)
+        self.store = checkpoints or MemoryCheckpointStore()
+        self.checkpoint_name = checkpoint_name or 'ingest:' + table_name
+        self.rejects = rejects
+        if client.token_cache is None:
+            self.tokens = TokenCache(maxsize=token_cache_size, background_refresh=False)
+        else:
+            self.tokens = None
+
+
+    def checkpoint(self):
+        """
+        Returns
+        -------
+        dict or None
+
+            {offset, fieldnames, rows_read, rows_sent, rows_failed,
+             rows_invalid, batches}
+
+        """
+        return self.store.load(self.checkpoint_name)
+
+
+    def reset(self):
+        self.store.save(self.checkpoint_name, None)
+
+
+    def _owner_token(self, owner):
+        # token requests take a slot of the client's concurrency limiter
+        if self.tokens is None:
+            return self.client._prefetch_token(owner, 'owner')
+        return self.tokens.get(owner, 'owner', self.client._prefetch_token)
+
+
+    def _reject(self, rows):
+        if not self.rejects or not rows:
+            return
+        with open(self.rejects, 'a') as f:
+            for row in rows:
+                f.write(json.dumps(row, sort_keys=True) + '\n')
+
+
+    def _segments(self, reader, coerce):
+        owners = OrderedDict()
+        invalid = []
+        count = 0
+        for row in reader:
+            count += 1
+            owner = row.get(self.owner_column)
+            try:
+                if not owner:
+                    raise KeyError(self.owner_column)
+                del row[self.owner_column]
+                owners.setdefault(owner, []).append(coerce(row))
+            except (KeyError, ValueError, TypeError):
+                row[self.owner_column] = owner
+                invalid.append(row)
+            if count >= self.segment_rows:
+                yield count, owners, invalid
+                owners, invalid, count = OrderedDict(), [], 0
+        if count:
+            yield count, owners, invalid
+
+
+    def _send(self, owners):
+        failures = []
+        counts = {'batches': 0, 'rows_failed': 0}
+        def fetch(owner, token_type):
+            return self._owner_token(owner)
+        def work():
+            # batches of an owner are sent as soon as its token arrives,
+            # while the tokens of the next owners are being fetched
+            prefetcher = TokenPrefetcher(fetch, ((o, 'owner') for o in owners),
+                                         self.max_workers, self.max_workers * 4)
+            for owner, _, token, error in prefetcher:
+                rows = owners[owner]
+                if error:
+                    self._reject([dict(r, **{self.owner_column: owner}) for r in rows])
+                    failures.append({'owner': owner, 'rows': len(rows), 'status_code': None,
+                                     'error': 'could not get token: %s' % error})
+                    counts['rows_failed'] += len(rows)
+                    continue
+                for batch in batches(rows, self.batch_size, self.max_bytes,
+                                     self.client.codec.dumps):
+                    counts['batches'] += 1
+                    yield owner, token, batch
+        def post(item):
+            owner, token, batch = item
+            headers = dict(self.client._auth_headers(token, True))
+            headers['Prefer'] = 'return=minimal'
+            resp = self.client._http_post_raw(self.endpoint, headers, batch.body())
+            if resp.status_code < 400:
+                batch.rows = None
+            return resp
+        result = run_many(post, work(), self.max_workers, limiter=self.client.limiter)
+        for item in result.failures():
+            owner, _, batch = item.item
+            rows = [dict(self.client.codec.loads(r), **{self.owner_column: owner})
+                    for r in batch.rows]
+            self._reject(rows)
+            failures.append({'owner': owner, 'rows': len(batch), 'status_code':
+                             item.status_code, 'error': item.error})
+            counts['rows_failed'] += len(batch)
+        return counts['batches'], counts['rows_failed'], failures
+
+
+    def run(self, source, fmt=None, progress=None):
+        """
+        Parameters
+        ----------
+        source: str or file
+            path, files ending in .gz are decompressed, or a file
+            opened in binary mode
+        fmt: str
+            <csv, ndjson>, by default from the file name
+        progress: callable
+            optional, progress(summary) after each segment,
+            with summary as for IngestResult.summary
+
+        Returns
+        -------
+        IngestResult
+
+        """
+        if fmt is None:
+            if not isinstance(source, str):
+                raise Exception('fmt is required when source is a file')
+            fmt = detect_format(source)
+        if self.types is None:
+            self.types = column_types(self.client, self.table_name, self.token)
+        coerce = coercer(self.types)
+        checkpoint = self.checkpoint() or {'offset': 0, 'fieldnames': None,
+                                           'rows_read': 0, 'rows_sent': 0,
+                                           'rows_failed': 0, 'rows_invalid': 0,
+                                           'batches': 0}
+        resumed = dict(checkpoint)
+        failures = []
+        start = time.time()
+        f = open_source(source) if isinstance(source, str) else source
+        try:
+            reader = RecordReader(f, fmt, checkpoint['offset'], checkpoint['fieldnames'])
+            for count, owners, invalid in self._segments(reader, coerce):
+                self._reject(invalid)
+                sent_batches, rows_failed, segment_failures = self._send(owners)
+                failures.extend(segment_failures)
+                rows = count - len(invalid)
+                checkpoint.update({
+                    'offset': reader.offset, 'fieldnames': reader.fieldnames,
+                    'rows_read': checkpoint['rows_read'] + count,
+                    'rows_sent': checkpoint['rows_sent'] + rows - rows_failed,
+                    'rows_failed': checkpoint['rows_failed'] + rows_failed,
+                    'rows_invalid': checkpoint['rows_invalid'] + len(invalid),
+                    'batches': checkpoint['batches'] + sent_batches})
+                self.store.save(self.checkpoint_name, checkpoint)
+                if progress:
+                    progress(IngestResult(checkpoint, failures, time.time() - start,
+                                          resumed).summary())
+        finally:
+            if isinstance(source, str):
+                f.close()
+        return IngestResult(checkpoint, failures, time.time() - start, resumed)
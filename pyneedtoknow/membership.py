@@ -0,0 +1,283 @@
+
+import math
+
+OWNER_PREFIX = 'owner_'
+USER_PREFIX = 'user_'
+
+
+def current_members(rows):
+    """
+    Split group_list_members rows into data owner and data user IDs.
+
+    Parameters
+    ----------
+    rows: list
+        [{user_name, ...}], user names are 'owner_<id>' or 'user_<id>'
+
+    Returns
+    -------
+    tuple
+
+        (set of data owner IDs, set of data user IDs)
+
+    """
+    owners, users = set(), set()
+    for row in rows:
+        name = row['user_name']
+        if name.startswith(OWNER_PREFIX):
+            owners.add(name[len(OWNER_PREFIX):])
+        elif name.startswith(USER_PREFIX):
+            users.add(name[len(USER_PREFIX):])
+    return owners, users
+
+
+def registered_members(rows):
+    """
+    Index user_registrations rows by user type and by metadata.
+
+    Parameters
+    ----------
+    rows: list
+        [{user_name, user_metadata, ...}]
+
+    Returns
+    -------
+    tuple
+
+        (set of data owner IDs, set of data user IDs,
+         dict (key, value) -> set of user names)
+
+    """
+    owners, users = current_members(rows)
+    by_metadata = {}
+    for row in rows:
+        for key, value in (row.get('user_metadata') or {}).items():
+            try:
+                by_metadata.setdefault((key, value), set()).add(row['user_name'])
+            except TypeError:
+                # lists and objects cannot be matched on
+                continue
+    return owners, users, by_metadata
+
+
+def _num_chunks(n, batch_size):
+    return int(math.ceil(float(n) / batch_size))
+
+
+def _chunks(owners, users, batch_size):
+    owners, users = sorted(owners), sorted(users)
+    while owners or users:
+        chunk = {}
+        if owners:
+            chunk['data_owners'], owners = owners[:batch_size], owners[batch_size:]
+        space = batch_size - len(chunk.get('data_owners', []))
+        if users and space > 0:
+            chunk['data_users'], users = users[:space], users[space:]
+        yield chunk
+
+
+def _metadata_adds(by_metadata, wanted, to_add, batch_size):
+    # greedily pick metadata values whose users are all wanted,
+    # while each one saves at least one call
+    picked = []
+    remaining = set(to_add)
+    while remaining:
+        best, covered = None, set()
+        for pair in sorted(by_metadata, key=repr):
+            names = by_metadata[pair]
+            if names <= wanted and len(names & remaining) > len(covered):
+                best, covered = pair, names & remaining
+        if best is None:
+            break
+        left = len(remaining) - len(covered)
+        if 1 + _num_chunks(left, batch_size) >= _num_chunks(len(remaining), batch_size):
+            break
+        picked.append(best)
+        remaining -= covered
+    return picked, remaining
+
+
+def plan_group_sync(group_name, current, data_owners, data_users, batch_size=1000,
+                    registrations=None):
+    """
+    Work out the group_add_members and group_remove_members calls needed
+    to go from the current to the desired membership.
+
+    Parameters
+    ----------
+    group_name: str
+    current: tuple
+        (data owner IDs, data user IDs), as returned by current_members
+    data_owners: iterable or 'all'
+        desired data owner IDs, or 'all' for all registered data owners
+    data_users: iterable or 'all'
+        desired data user IDs, or 'all' for all registered data users
+    batch_size: int
+        maximum number of members per call
+    registrations: tuple
+        optional, as returned by registered_members, used to add with
+        add_all_owners, add_all_users or metadata where that takes fewer calls
+
+    Returns
+    -------
+    dict
+
+        {add_owners, add_users, remove_owners, remove_users,
+         calls: [(<add, remove>, data)]}
+
+        add_owners and add_users are 'all' when all registered members
+        are added and registrations is not given, so who is not known
+
+    """
+    current_owners, current_users = current
+    all_owners = data_owners == 'all'
+    all_users = data_users == 'all'
+    want_owners = set() if all_owners else set(data_owners)
+    want_users = set() if all_users else set(data_users)
+    add_owners = set() if all_owners else want_owners - current_owners
+    add_users = set() if all_users else want_users - current_users
+    remove_owners = set() if all_owners else current_owners - want_owners
+    remove_users = set() if all_users else current_users - want_users
+    calls = []
+    keep = (current_owners - remove_owners) | (current_users - remove_users)
+    if (remove_owners or remove_users) and not keep:
+        calls.append(('remove', {'group_name': group_name, 'remove_all': True}))
+    else:
+        for chunk in _chunks(remove_owners, remove_users, batch_size):
+            calls.append(('remove', {'group_name': group_name,
+                                     'members': {'memberships': chunk}}))
+    chunk_owners, chunk_users = add_owners, add_users
+    if registrations is not None:
+        registered_owners, registered_users, by_metadata = registrations
+        # everyone registered is wanted, one call adds them all
+        if add_owners and registered_owners and registered_owners <= want_owners:
+            all_owners, chunk_owners = True, set()
+        if add_users and registered_users and registered_users <= want_users:
+            all_users, chunk_users = True, set()
+        wanted = set(OWNER_PREFIX + o for o in (registered_owners if all_owners else want_owners))
+        wanted |= set(USER_PREFIX + u for u in (registered_users if all_users else want_users))
+        to_add = set(OWNER_PREFIX + o for o in chunk_owners) | set(USER_PREFIX + u for u in chunk_users)
+        picked, remaining = _metadata_adds(by_metadata, wanted, to_add, batch_size)
+        for key, value in picked:
+            calls.append(('add', {'group_name': group_name,
+                                  'metadata': {'key': key, 'value': value}}))
+        chunk_owners = set(o for o in chunk_owners if OWNER_PREFIX + o in remaining)
+        chunk_users = set(u for u in chunk_users if USER_PREFIX + u in remaining)
+    if all_owners and all_users:
+        calls.append(('add', {'group_name': group_name, 'add_all': True}))
+    elif all_owners:
+        calls.append(('add', {'group_name': group_name, 'add_all_owners': True}))
+    elif all_users:
+        calls.append(('add', {'group_name': group_name, 'add_all_users': True}))
+    for chunk in _chunks(chunk_owners, chunk_users, batch_size):
+        calls.append(('add', {'group_name': group_name,
+                              'members': {'memberships': chunk}}))
+    # report who add_all_owners and add_all_users add
+    if data_owners == 'all':
+        add_owners = 'all' if registrations is None else registrations[0] - current_owners
+    if data_users == 'all':
+        add_users = 'all' if registrations is None else registrations[1] - current_users
+    return {'add_owners': add_owners, 'add_users': add_users,
+            'remove_owners': remove_owners, 'remove_users': remove_users,
+            'calls': calls}
+
+
+def _listed(members):
+    return members if members == 'all' else sorted(members)
+
+
+def naive_calls(data_owners, data_users, batch_size=1000):
+    """
+    Number of calls to remove all members and add the desired ones back,
+    in batches of batch_size.
+    """
+    listed = sum(0 if m == 'all' else len(set(m)) for m in (data_owners, data_users))
+    adds_all = 1 if 'all' in (data_owners, data_users) else 0
+    return 1 + adds_all + _num_chunks(listed, batch_size)
+
+
+def sync_group_members(client, data, token, batch_size=1000, dry_run=False,
+                       use_registrations=False):
+    """
+    Make a group's membership match a desired set of data owners and users,
+    with as few calls as possible.
+
+    The current members are listed once, bypassing the client's metadata
+    cache, and only the differences are added and removed, in batches.
+    The result is compared to removing all members and adding the desired
+    ones back in batches. calls_saved is negative when the differences
+    take more calls than that, which still leaves unchanged members, and
+    the event log, alone.
+
+    Parameters
+    ----------
+    client: PgNeedToKnowClient
+    data: dict
+        {'group_name': 'group1',
+         'data_owners': ['A', 'B'] or 'all',
+         'data_users': ['X'] or 'all'}
+    token: str
+        JWT, role=admin
+    batch_size: int
+        maximum number of members per call
+    dry_run: bool
+        only compute the calls, do not send them
+    use_registrations: bool
+        also fetch the user registrations, so that members can be added
+        with add_all_owners, add_all_users or by metadata where that takes
+        fewer calls, worth the extra call for large groups
+
+    Returns
+    -------
+    dict
+
+        {group_name, added, removed, calls, naive_calls, calls_saved, failed}
+
+        added lists the data owners and users added, or is 'all' for
+        those added with add_all_owners or add_all_users without
+        use_registrations
+
+    """
+    client._assert_keys_present(['group_name'], data.keys())
+    group_name = data['group_name']
+    data_owners = data.get('data_owners', [])
+    data_users = data.get('data_users', [])
+    # a cached listing could be older than the group
+    client._invalidate('group_members:' + group_name)
+    resp = client.group_list_members({'group_name': group_name}, token)
+    if resp.status_code >= 400:
+        raise Exception('Could not list members of %s: %d %s'
+                        % (group_name, resp.status_code, resp.text))
+    current = current_members(client.json(resp))
+    calls = 1
+    registrations = None
+    if use_registrations:
+        resp = client.get_user_registrations(token)
+        if resp.status_code >= 400:
+            raise Exception('Could not list user registrations: %d %s'
+                            % (resp.status_code, resp.text))
+        registrations = registered_members(client.json(resp))
+        calls += 1
+    plan = plan_group_sync(group_name, current, data_owners, data_users,
+                           batch_size, registrations)
+    failed = []
+    if not dry_run:
+        for kind, call in plan['calls']:
+            if kind == 'add':
+                r = client.group_add_members(call, token)
+            else:
+                r = client.group_remove_members(call, token)
+            if r.status_code >= 400:
+                failed.append({'call': call, 'status_code': r.status_code,
+                               'error': r.text})
+    naive = naive_calls(data_owners, data_users, batch_size)
+    calls += len(plan['calls'])
+    return {'group_name': group_name,
+            'added': {'data_owners': _listed(plan['add_owners']),
+                      'data_users': _listed(plan['add_users'])},
+            'removed': {'data_owners': sorted(plan['remove_owners']),
+                        'data_users': sorted(plan['remove_users'])},
+            'calls': calls,
+            'naive_calls': naive,
+            'calls_saved': naive - calls,
+            'failed': failed}
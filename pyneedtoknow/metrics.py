@@ -0,0 +1,279 @@
+
+import bisect
+import sys
+import threading
+import time
+from collections import namedtuple
+
+try:
+    from urllib.parse import urlsplit
+except ImportError:
+    from urlparse import urlsplit
+
+# bytes_out and bytes_in are sent and received over the wire,
+# the _raw sizes are before compression and after decompression
+RequestEvent = namedtuple('RequestEvent', ['operation', 'method', 'url', 'status_code',
+                                           'elapsed', 'bytes_out', 'bytes_in', 'error',
+                                           'bytes_out_raw', 'bytes_in_raw'])
+RequestEvent.__new__.__defaults__ = (None, None)
+
+# seconds
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+                   0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def operation_codes(cls):
+    """
+    Code objects of the public methods of a client class, for operation_name.
+    """
+    codes = set()
+    for name in dir(cls):
+        if name.startswith('_'):
+            continue
+        code = getattr(getattr(cls, name), '__code__', None)
+        if code is not None:
+            codes.add(code)
+    return frozenset(codes)
+
+
+def operation_name(codes, method, url, depth=2):
+    """
+    Name of the outermost public client method on the stack,
+    e.g. get_event_log_data_access rather than the get_data it calls,
+    or '<METHOD> <path>' if the request is sent from elsewhere,
+    e.g. from a bulk worker thread.
+    """
+    name = None
+    frame = sys._getframe(depth)
+    while frame is not None:
+        if frame.f_code in codes:
+            name = frame.f_code.co_name
+        frame = frame.f_back
+    return name or '%s %s' % (method, urlsplit(url).path)
+
+
+def request_size(data):
+    if data is None:
+        return 0
+    try:
+        return len(data)
+    except TypeError:
+        return None
+
+
+def response_sizes(resp, stream=False):
+    """
+    Returns
+    -------
+    tuple
+
+        (bytes received, bytes after decompression), None if not known
+
+    """
+    length = resp.headers.get('Content-Length')
+    received = int(length) if length else None
+    if stream:
+        return received, None
+    raw = len(resp.content)
+    if received is None or not resp.headers.get('Content-Encoding'):
+        received = raw
+    return received, raw
+
+
+def emit(hooks, event):
+    for hook in hooks:
+        hook(event)
+
+
+def instrument(hooks, operation, method, url, send, kwargs, raw_size=None):
+    """
+    Send a request with send(url, **kwargs) and report a RequestEvent
+    to every hook once it has completed or failed.
+
+    raw_size is the size of the request data before compression.
+    """
+    bytes_out = request_size(kwargs.get('data'))
+    if raw_size is None:
+        raw_size = bytes_out
+    start = time.time()
+    try:
+        resp = send(url, **kwargs)
+    except Exception as e:
+        emit(hooks, RequestEvent(operation, method, url, None, time.time() - start,
+                                 bytes_out, 0, e, raw_size, 0))
+        raise
+    bytes_in, bytes_in_raw = response_sizes(resp, kwargs.get('stream'))
+    emit(hooks, RequestEvent(operation, method, url, resp.status_code,
+                             time.time() - start, bytes_out, bytes_in, None,
+                             raw_size, bytes_in_raw))
+    return resp
+
+
+class Histogram(object):
+
+    """
+    Fixed-bucket histogram.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+    def quantile(self, q):
+        """
+        Upper bound of the bucket holding the q-th quantile,
+        None if it falls in the overflow bucket or nothing was observed.
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return self.buckets[i] if i < len(self.buckets) else None
+        return None
+
+
+class OperationMetrics(object):
+
+    def __init__(self, buckets):
+        self.latency = Histogram(buckets)
+        self.statuses = {}
+        self.errors = 0
+        self.bytes_out = 0
+        self.bytes_in = 0
+        self.bytes_out_saved = 0
+        self.bytes_in_saved = 0
+
+
+class MetricsRegistry(object):
+
+    """
+    Request counts, latency histograms, bytes sent and received, and
+    status codes, per client operation.
+
+    A registry is a hook, it is passed to PgNeedToKnowClient(metrics=...)
+    or added with client.add_hook(registry).
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, prefix='pyneedtoknow'):
+        """
+        Parameters
+        ----------
+        buckets: tuple
+            latency histogram bucket upper bounds, in seconds
+        prefix: str
+            metric name prefix for export_text
+
+        """
+        self.buckets = tuple(buckets)
+        self.prefix = prefix
+        self.operations = {}
+        self._lock = threading.Lock()
+
+
+    def __call__(self, event):
+        with self._lock:
+            metrics = self.operations.get(event.operation)
+            if metrics is None:
+                metrics = self.operations[event.operation] = OperationMetrics(self.buckets)
+            metrics.latency.observe(event.elapsed)
+            if event.error is not None:
+                metrics.errors += 1
+            else:
+                metrics.statuses[event.status_code] = metrics.statuses.get(event.status_code, 0) + 1
+            metrics.bytes_out += event.bytes_out or 0
+            metrics.bytes_in += event.bytes_in or 0
+            if event.bytes_out_raw is not None and event.bytes_out is not None:
+                metrics.bytes_out_saved += event.bytes_out_raw - event.bytes_out
+            if event.bytes_in_raw is not None and event.bytes_in is not None:
+                metrics.bytes_in_saved += event.bytes_in_raw - event.bytes_in
+
+
+    def reset(self):
+        with self._lock:
+            self.operations = {}
+
+
+    def snapshot(self):
+        """
+        Returns
+        -------
+        dict
+
+            operation -> {count, errors, statuses, mean_ms, p50_ms, p95_ms,
+                          p99_ms, bytes_out, bytes_in, bytes_out_saved,
+                          bytes_in_saved}
+
+            percentiles are histogram bucket upper bounds
+
+        """
+        def ms(seconds):
+            return None if seconds is None else seconds * 1000
+        with self._lock:
+            return dict((name, {'count': m.latency.count,
+                                'errors': m.errors,
+                                'statuses': dict(m.statuses),
+                                'mean_ms': ms(m.latency.sum / m.latency.count),
+                                'p50_ms': ms(m.latency.quantile(0.5)),
+                                'p95_ms': ms(m.latency.quantile(0.95)),
+                                'p99_ms': ms(m.latency.quantile(0.99)),
+                                'bytes_out': m.bytes_out,
+                                'bytes_in': m.bytes_in,
+                                'bytes_out_saved': m.bytes_out_saved,
+                                'bytes_in_saved': m.bytes_in_saved})
+                        for name, m in self.operations.items())
+
+
+    def export_text(self):
+        """
+        Metrics in the Prometheus text exposition format.
+        """
+        p = self.prefix
+        lines = ['# HELP %s_request_duration_seconds Request latency.' % p,
+                 '# TYPE %s_request_duration_seconds histogram' % p]
+        requests, errors, sent, received, sent_saved, received_saved = [], [], [], [], [], []
+        with self._lock:
+            for name in sorted(self.operations):
+                m = self.operations[name]
+                label = 'operation="%s"' % name.replace('\\', '\\\\').replace('"', '\\"')
+                cumulative = 0
+                for bound, count in zip(self.buckets + ('+Inf',), m.latency.counts):
+                    cumulative += count
+                    lines.append('%s_request_duration_seconds_bucket{%s,le="%s"} %d'
+                                 % (p, label, bound, cumulative))
+                lines.append('%s_request_duration_seconds_sum{%s} %r' % (p, label, m.latency.sum))
+                lines.append('%s_request_duration_seconds_count{%s} %d' % (p, label, m.latency.count))
+                for status in sorted(m.statuses):
+                    requests.append('%s_requests_total{%s,status="%s"} %d'
+                                    % (p, label, status, m.statuses[status]))
+                errors.append('%s_request_errors_total{%s} %d' % (p, label, m.errors))
+                sent.append('%s_request_bytes_total{%s} %d' % (p, label, m.bytes_out))
+                received.append('%s_response_bytes_total{%s} %d' % (p, label, m.bytes_in))
+                sent_saved.append('%s_request_bytes_saved_total{%s} %d'
+                                  % (p, label, m.bytes_out_saved))
+                received_saved.append('%s_response_bytes_saved_total{%s} %d'
+                                      % (p, label, m.bytes_in_saved))
+        for name, kind, help_text, values in [
+                ('requests_total', 'counter', 'Completed requests by status code.', requests),
+                ('request_errors_total', 'counter', 'Requests that raised an exception.', errors),
+                ('request_bytes_total', 'counter', 'Request body bytes sent.', sent),
+                ('response_bytes_total', 'counter', 'Response body bytes received.', received),
+                ('request_bytes_saved_total', 'counter',
+                 'Request body bytes saved by compression.', sent_saved),
+                ('response_bytes_saved_total', 'counter',
+                 'Response body bytes saved by compression.', received_saved)]:
+            lines.append('# HELP %s_%s %s' % (p, name, help_text))
+            lines.append('# TYPE %s_%s %s' % (p, name, kind))
+            lines.extend(values)
+        return '\n'.join(lines) + '\n'
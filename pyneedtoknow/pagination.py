@@ -0,0 +1,121 @@
+
+try:
+    from urllib.parse import quote
+except ImportError:
+    from urllib import quote
+
+
+def page_endpoint(endpoint, limit, offset=None, order=None, keyset=None,
+                  after=None):
+    """
+    Add PostgREST paging parameters to an endpoint.
+
+    Parameters
+    ----------
+    endpoint: str
+        may already have a query string
+    limit: int
+    offset: int
+    order: str
+        column, or PostgREST order clause, e.g. 'id.desc'
+    keyset: str
+        column to page on, rows are ordered by it
+    after: object
+        only return rows with keyset > after
+
+    Returns
+    -------
+    str
+
+    """
+    params = []
+    if keyset:
+        params.append('order=' + quote(keyset + '.asc', safe='.,'))
+        if after is not None:
+            params.append(quote(keyset) + '=gt.' + quote(str(after), safe=''))
+    elif order:
+        params.append('order=' + quote(order, safe='.,'))
+    params.append('limit=%d' % limit)
+    if offset:
+        params.append('offset=%d' % offset)
+    sep = '&' if '?' in endpoint else '?'
+    return endpoint + sep + '&'.join(params)
+
+
+def content_range_total(content_range):
+    """
+    Parameters
+    ----------
+    content_range: str
+        Content-Range header, e.g. '0-24/3573', '*/3573' or '0-24/*'
+
+    Returns
+    -------
+    int or None
+
+        total number of rows, None if the server did not count them
+
+    """
+    if not content_range or '/' not in content_range:
+        return None
+    total = content_range.rsplit('/', 1)[1].strip()
+    return int(total) if total.isdigit() else None
+
+
+def paginate(fetch, endpoint, page_size=1000, order=None, keyset=None,
+             prefetch=False):
+    """
+    Iterate over all rows of an endpoint, one page at a time.
+
+    With keyset, each page starts after the last keyset value seen,
+    which stays fast on large tables, and the column must be unique.
+    Otherwise pages are fetched by offset, ordered by order if given.
+
+    Parameters
+    ----------
+    fetch: callable
+        fetch(endpoint) -> list of rows
+    endpoint: str
+    page_size: int
+    order: str
+    keyset: str
+    prefetch: bool
+        fetch the next page in the background while the
+        current one is being consumed
+
+    Returns
+    -------
+    generator of dict
+
+    """
+    def next_endpoint(page, offset):
+        if len(page) < page_size:
+            return None
+        if keyset:
+            return page_endpoint(endpoint, page_size, keyset=keyset,
+                                 after=page[-1][keyset])
+        return page_endpoint(endpoint, page_size, offset=offset, order=order)
+
+    executor = None
+    if prefetch:
+        # imported here, concurrent.futures takes milliseconds to import
+        from concurrent.futures import ThreadPoolExecutor
+        executor = ThreadPoolExecutor(max_workers=1)
+    try:
+        page = fetch(page_endpoint(endpoint, page_size, order=order,
+                                   keyset=keyset))
+        offset = len(page)
+        while True:
+            path = next_endpoint(page, offset)
+            future = None
+            if path and executor:
+                future = executor.submit(fetch, path)
+            for row in page:
+                yield row
+            if not path:
+                return
+            page = future.result() if future else fetch(path)
+            offset += len(page)
+    finally:
+        if executor:
+            executor.shutdown(wait=False)
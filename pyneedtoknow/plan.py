@@ -0,0 +1,299 @@
+
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from .bulk import send_one
+
+# satisfied: error status codes that count as success, e.g. 409 for
+# something that already exists, so the steps depending on it still run
+Step = namedtuple('Step', ['name', 'deps', 'func', 'satisfied'])
+Step.__new__.__defaults__ = ((),)
+
+StepResult = namedtuple('StepResult', ['name', 'ok', 'status_code', 'error',
+                                       'started', 'elapsed', 'skipped'])
+
+
+class PlanResult(object):
+
+    """
+    Outcome and timing of every step of an applied plan.
+    """
+
+    def __init__(self, steps, elapsed, depth):
+        self.steps = steps
+        self.elapsed = elapsed
+        self.depth = depth
+        self.succeeded = sum(1 for s in steps if s.ok)
+        self.skipped = sum(1 for s in steps if s.skipped)
+        self.failed = len(steps) - self.succeeded - self.skipped
+
+
+    def failures(self):
+        return [s for s in self.steps if not s.ok and not s.skipped]
+
+
+    def summary(self):
+        """
+        Returns
+        -------
+        dict
+
+            {steps, succeeded, failed, skipped, depth, elapsed}
+
+        """
+        return {'steps': len(self.steps), 'succeeded': self.succeeded,
+                'failed': self.failed, 'skipped': self.skipped,
+                'depth': self.depth, 'elapsed': self.elapsed}
+
+
+    def __repr__(self):
+        return ('<PlanResult steps=%d succeeded=%d failed=%d skipped=%d '
+                'depth=%d elapsed=%.3fs>' % (len(self.steps), self.succeeded,
+                                             self.failed, self.skipped,
+                                             self.depth, self.elapsed))
+
+
+def graph_depth(steps):
+    """
+    Number of steps on the longest dependency chain.
+    """
+    waiting = dict((s.name, len(s.deps)) for s in steps)
+    dependents = dict((s.name, []) for s in steps)
+    for step in steps:
+        for dep in step.deps:
+            dependents[dep].append(step.name)
+    level = [n for n, count in waiting.items() if not count]
+    depth = 0
+    done = 0
+    while level:
+        depth += 1
+        done += len(level)
+        next_level = []
+        for name in level:
+            for child in dependents[name]:
+                waiting[child] -= 1
+                if not waiting[child]:
+                    next_level.append(child)
+        level = next_level
+    if done != len(steps):
+        raise Exception('Dependency cycle between steps')
+    return depth
+
+
+def _run_step(step, limiter=None):
+    started = time.time()
+    ok, status_code, error, elapsed = send_one(step.func, limiter, step.satisfied)
+    return StepResult(step.name, ok, status_code, error, started, elapsed, False)
+
+
+def run_graph(steps, max_workers=8, limiter=None):
+    """
+    Run steps as soon as all their dependencies have succeeded,
+    with at most max_workers steps at a time.
+
+    Steps that depend on a failed step are skipped.
+
+    Parameters
+    ----------
+    steps: list
+        of Step(name, deps, func), func() -> requests.Response
+    max_workers: int
+    limiter: concurrency.AdaptiveLimiter
+        optional, decides how many steps run at a time instead of max_workers
+
+    Returns
+    -------
+    PlanResult
+
+    """
+    by_name = dict((s.name, s) for s in steps)
+    for step in steps:
+        for dep in step.deps:
+            if dep not in by_name:
+                raise Exception('Step %s depends on unknown step %s' % (step.name, dep))
+    depth = graph_depth(steps)
+    waiting = dict((s.name, set(s.deps)) for s in steps)
+    dependents = dict((s.name, []) for s in steps)
+    for step in steps:
+        for dep in step.deps:
+            dependents[dep].append(step.name)
+    results = {}
+    start = time.time()
+
+    def skip(name, reason):
+        for child in dependents[name]:
+            if child not in results:
+                results[child] = StepResult(child, False, None, reason,
+                                            None, 0.0, True)
+                waiting.pop(child, None)
+                skip(child, reason)
+
+    if limiter is not None:
+        max_workers = limiter.max_limit
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        running = {}
+        while waiting or running:
+            for name in [n for n, deps in waiting.items() if not deps]:
+                del waiting[name]
+                if limiter is not None:
+                    limiter.acquire()
+                running[executor.submit(_run_step, by_name[name], limiter)] = name
+            done, _ = wait(list(running.keys()), return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                result = future.result()
+                results[name] = result
+                if result.ok:
+                    for child in dependents[name]:
+                        if child in waiting:
+                            waiting[child].discard(name)
+                else:
+                    skip(name, 'dependency %s failed' % name)
+    return PlanResult([results[s.name] for s in steps], time.time() - start, depth)
+
+
+class AccessPlan(object):
+
+    """
+    Desired state of tables, users, groups, memberships and table grants.
+
+    Applying a plan runs every call as soon as what it depends on exists,
+    e.g. a grant once both its table and its group have been created, and
+    independent calls concurrently, so the time taken grows with the depth
+    of the dependency graph rather than the number of calls. Tables, users
+    and groups that already exist count as created, so a plan can be
+    applied again, or on top of part of it, and reaches the same state.
+
+        plan = AccessPlan(
+            tables=[TABLES['t1'], TABLES['t2']],
+            data_owners=['A', 'B', 'C', 'D', 'E', 'F'],
+            data_users=['X', 'Y', 'Z'],
+            groups={
+                'group1': {'data_users': ['X', 'Y'],
+                           'data_owners': ['A', 'B', 'C', 'D']},
+                'group2': {'data_users': ['Z'], 'all_owners': True}},
+            grants=[('t1', 'group1', 'select'), ('t1', 'group2', 'select'),
+                    ('t2', 'group2', 'select')])
+        result = plan.apply(client, admin_token)
+
+    """
+
+    def __init__(self, tables=None, data_owners=None, data_users=None,
+                 groups=None, grants=None, table_type='mac'):
+        """
+        Parameters
+        ----------
+        tables: list
+            table definitions, as for table_create
+        data_owners: list or dict
+            IDs, or ID -> user_metadata
+        data_users: list or dict
+            IDs, or ID -> user_metadata
+        groups: dict
+            group_name -> {'group_metadata': {}, 'data_owners': [],
+                           'data_users': [], 'all_owners': bool,
+                           'all_users': bool}
+        grants: list
+            of (table_name, group_name, grant_type)
+        table_type: str
+
+        """
+        self.tables = list(tables or [])
+        self.data_owners = self._with_metadata(data_owners)
+        self.data_users = self._with_metadata(data_users)
+        self.groups = dict(groups or {})
+        self.grants = list(grants or [])
+        self.table_type = table_type
+
+
+    def _with_metadata(self, users):
+        if isinstance(users, dict):
+            return dict(users)
+        return dict((u, {}) for u in users or [])
+
+
+    def steps(self, client, token):
+        """
+        Parameters
+        ----------
+        client: PgNeedToKnowClient
+        token: str
+            JWT, role=admin
+
+        Returns
+        -------
+        list of Step
+
+        """
+        steps = []
+        def add(name, deps, func, *args):
+            steps.append(Step(name, list(deps), lambda: func(*args)))
+        def create(name, deps, func, *args):
+            # already created, e.g. by an earlier apply, is as good as created
+            steps.append(Step(name, list(deps), lambda: func(*args), (409,)))
+        for table in self.tables:
+            create('table:' + table['table_name'], [], client.table_create,
+                {'definition': table, 'type': self.table_type}, token)
+        for user_type, prefix, users in [('data_owner', 'owner:', self.data_owners),
+                                         ('data_user', 'user:', self.data_users)]:
+            for user_id in sorted(users):
+                create(prefix + user_id, [], client.user_register,
+                    {'user_id': user_id, 'user_type': user_type,
+                     'user_metadata': users[user_id]})
+        for group_name in sorted(self.groups):
+            group = self.groups[group_name]
+            create('group:' + group_name, [], client.group_create,
+                {'group_name': group_name,
+                 'group_metadata': group.get('group_metadata', {})}, token)
+            owners = [o for o in group.get('data_owners', []) if o in self.data_owners]
+            users = [u for u in group.get('data_users', []) if u in self.data_users]
+            memberships = {}
+            if group.get('data_owners'):
+                memberships['data_owners'] = list(group['data_owners'])
+            if group.get('data_users'):
+                memberships['data_users'] = list(group['data_users'])
+            if memberships:
+                deps = ['group:' + group_name] + ['owner:' + o for o in owners] \
+                    + ['user:' + u for u in users]
+                add('members:' + group_name, deps, client.group_add_members,
+                    {'group_name': group_name,
+                     'members': {'memberships': memberships}}, token)
+            for key, prefix, registered in [('all_owners', 'owner:', self.data_owners),
+                                             ('all_users', 'user:', self.data_users)]:
+                if group.get(key):
+                    deps = ['group:' + group_name] + [prefix + u for u in sorted(registered)]
+                    add('%s:%s' % (key, group_name), deps, client.group_add_members,
+                        {'group_name': group_name, 'add_' + key: True}, token)
+        for table_name, group_name, grant_type in self.grants:
+            # the group or table may already exist on the server
+            deps = []
+            if group_name in self.groups:
+                deps.append('group:' + group_name)
+            if any(t['table_name'] == table_name for t in self.tables):
+                deps.append('table:' + table_name)
+            add('grant:%s:%s:%s' % (table_name, group_name, grant_type), deps,
+                client.table_group_access_grant,
+                {'table_name': table_name, 'group_name': group_name,
+                 'grant_type': grant_type}, token)
+        return steps
+
+
+    def apply(self, client, token, max_workers=8):
+        """
+        Parameters
+        ----------
+        client: PgNeedToKnowClient
+        token: str
+            JWT, role=admin
+        max_workers: int
+            maximum number of calls in flight, unless the
+            client has a concurrency limiter
+
+        Returns
+        -------
+        PlanResult
+
+        """
+        return run_graph(self.steps(client, token), max_workers,
+                         getattr(client, 'limiter', None))
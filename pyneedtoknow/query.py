@@ -0,0 +1,255 @@
+
+import datetime
+
+try:
+    from urllib.parse import quote
+except ImportError:
+    from urllib import quote
+
+OPERATORS = ['eq', 'neq', 'gt', 'gte', 'lt', 'lte', 'like', 'ilike', 'in', 'is']
+
+# characters with a meaning inside PostgREST's in.(...) lists
+RESERVED = ',.:()" \\'
+
+
+def format_value(value):
+    """
+    Parameters
+    ----------
+    value: None, bool, number, str, date or datetime
+
+    Returns
+    -------
+    str
+
+        value as PostgREST parses it in a filter
+
+    """
+    if value is None:
+        return 'null'
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    return str(value)
+
+
+def _list_item(value):
+    text = format_value(value)
+    if any(c in RESERVED for c in text):
+        return '"%s"' % text.replace('\\', '\\\\').replace('"', '\\"')
+    return text
+
+
+def _quote(text):
+    return quote(text, safe=',()*')
+
+
+class Query(object):
+
+    """
+    Projection, filters, ordering and limits for reading or updating a
+    table or view, sent as PostgREST query parameters so that only the
+    rows and columns needed are returned.
+
+        q = (Query('t1').select('name', 'age')
+                        .gte('age', 18).in_('country', ['NO', 'SE'])
+                        .order('age', desc=True).limit(100))
+        rows = client.json(client.get_data(token, q))
+        client.patch_data({'age': 30}, token, Query('t1').eq('row_originator', 'user_X'))
+
+    Each method returns a new Query, so a base query can be shared.
+    """
+
+    def __init__(self, table):
+        """
+        Parameters
+        ----------
+        table: str
+            table or view name, or endpoint, e.g. 't1' or '/t1'
+
+        """
+        self.endpoint = table if table.startswith('/') else '/' + table
+        self.columns = []
+        self.filters = []
+        self.ordering = []
+        self.limit_rows = None
+        self.offset_rows = None
+
+
+    def _copy(self):
+        query = Query(self.endpoint)
+        query.columns = list(self.columns)
+        query.filters = list(self.filters)
+        query.ordering = list(self.ordering)
+        query.limit_rows = self.limit_rows
+        query.offset_rows = self.offset_rows
+        return query
+
+
+    def select(self, *columns):
+        """
+        Only return these columns.
+        """
+        query = self._copy()
+        query.columns.extend(columns)
+        return query
+
+
+    def filter(self, column, operator, value, negate=False):
+        """
+        Parameters
+        ----------
+        column: str
+        operator: str
+            <eq, neq, gt, gte, lt, lte, like, ilike, in, is>
+        value: object
+            a list for in, None, True or False for is,
+            '*' is the wildcard for like and ilike
+        negate: bool
+            only return rows that do not match
+
+        Returns
+        -------
+        Query
+
+        """
+        if operator not in OPERATORS:
+            raise Exception('Unknown operator: %s, use one of %s' % (operator, OPERATORS))
+        if operator == 'in':
+            if isinstance(value, (str, bytes)) or not hasattr(value, '__iter__'):
+                raise Exception('in needs a list of values')
+            text = '(' + ','.join(_list_item(v) for v in value) + ')'
+        elif operator == 'is':
+            if value not in (None, True, False):
+                raise Exception('is needs None, True or False')
+            text = format_value(value)
+        else:
+            if value is None:
+                raise Exception('Use is_ to filter on null')
+            text = format_value(value)
+        query = self._copy()
+        query.filters.append((column, ('not.' if negate else '') + operator + '.' + text))
+        return query
+
+
+    def eq(self, column, value):
+        return self.filter(column, 'eq', value)
+
+
+    def neq(self, column, value):
+        return self.filter(column, 'neq', value)
+
+
+    def gt(self, column, value):
+        return self.filter(column, 'gt', value)
+
+
+    def gte(self, column, value):
+        return self.filter(column, 'gte', value)
+
+
+    def lt(self, column, value):
+        return self.filter(column, 'lt', value)
+
+
+    def lte(self, column, value):
+        return self.filter(column, 'lte', value)
+
+
+    def like(self, column, pattern):
+        return self.filter(column, 'like', pattern)
+
+
+    def ilike(self, column, pattern):
+        return self.filter(column, 'ilike', pattern)
+
+
+    def in_(self, column, values):
+        return self.filter(column, 'in', values)
+
+
+    def is_(self, column, value):
+        return self.filter(column, 'is', value)
+
+
+    def order(self, column, desc=False, nulls=None):
+        """
+        Parameters
+        ----------
+        column: str
+        desc: bool
+        nulls: str
+            optional, <first, last>
+
+        Returns
+        -------
+        Query
+
+        """
+        clause = column + ('.desc' if desc else '.asc')
+        if nulls:
+            if nulls not in ('first', 'last'):
+                raise Exception('nulls must be first or last')
+            clause += '.nulls' + nulls
+        query = self._copy()
+        query.ordering.append(clause)
+        return query
+
+
+    def limit(self, rows):
+        query = self._copy()
+        query.limit_rows = int(rows)
+        return query
+
+
+    def offset(self, rows):
+        query = self._copy()
+        query.offset_rows = int(rows)
+        return query
+
+
+    def params(self):
+        """
+        Returns
+        -------
+        list
+
+            of (name, value) query parameters, not URL encoded
+
+        """
+        params = []
+        if self.columns:
+            params.append(('select', ','.join(self.columns)))
+        params.extend(self.filters)
+        if self.ordering:
+            params.append(('order', ','.join(self.ordering)))
+        if self.limit_rows is not None:
+            params.append(('limit', str(self.limit_rows)))
+        if self.offset_rows is not None:
+            params.append(('offset', str(self.offset_rows)))
+        return params
+
+
+    def path(self):
+        """
+        Returns
+        -------
+        str
+
+            endpoint with the URL encoded query string, e.g.
+            '/t1?select=name,age&age=gte.18&order=age.desc&limit=100'
+
+        """
+        params = self.params()
+        if not params:
+            return self.endpoint
+        return self.endpoint + '?' + '&'.join(_quote(k) + '=' + _quote(v) for k, v in params)
+
+
+    def __str__(self):
+        return self.path()
+
+
+    def __repr__(self):
+        return '<Query %s>' % self.path()
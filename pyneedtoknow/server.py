@@ -0,0 +1,858 @@
+
+"""
+In-process stand-in for a pg-need-to-know REST API.
+
+Implements the RPC and view endpoints used by PgNeedToKnowClient, and
+PostgREST style table endpoints, with in-memory state and the same access
+rules: data owners only see their own rows, data users only see rows of
+owners in groups with a grant on the table, and admins see no data.
+Latency, bandwidth limits and errors can be injected, to benchmark and
+tune the client without a database:
+
+    with StandInServer(latency=0.005, error_rate=0.01) as server:
+        c = PgNeedToKnowClient(url=server.url)
+
+or from the command line:
+
+    python -m pyneedtoknow.server --port 3000 --latency 0.005
+
+"""
+
+import base64
+import copy
+import datetime
+import hashlib
+import hmac
+import json
+import random
+import re
+import threading
+import time
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import parse_qsl, unquote, urlsplit
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urllib import unquote
+    from urlparse import parse_qsl, urlsplit
+
+import click
+
+from .compression import compress, decompress
+
+RESERVED_PARAMS = ['select', 'order', 'limit', 'offset', 'columns', 'on_conflict']
+SYSTEM_COLUMNS = ['row_id', 'row_owner', 'row_originator']
+EVENT_LOGS = ['event_log_user_group_removals', 'event_log_user_data_deletions',
+              'event_log_data_access', 'event_log_access_control',
+              'event_log_data_updates']
+
+
+class ApiError(Exception):
+
+    def __init__(self, status, message):
+        super(ApiError, self).__init__(message)
+        self.status = status
+        self.message = message
+
+
+def _now():
+    return datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S.%f+00:00')
+
+
+def _b64(data):
+    return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+
+def _unb64(data):
+    return base64.urlsafe_b64decode((data + '=' * (-len(data) % 4)).encode('ascii'))
+
+
+def _like(pattern, case_insensitive=False):
+    regex = '^' + '.*'.join(re.escape(p) for p in pattern.split('*')) + '$'
+    return re.compile(regex, re.IGNORECASE if case_insensitive else 0)
+
+
+def _coerce(value, sample):
+    if isinstance(sample, bool):
+        return value == 'true'
+    if isinstance(sample, (int, float)):
+        try:
+            return float(value)
+        except ValueError:
+            return value
+    return value
+
+
+def _matches(row_value, op, value):
+    if op == 'is':
+        return {'null': None, 'true': True, 'false': False}[value] is row_value
+    if row_value is None:
+        return False
+    if op == 'in':
+        items = [v.strip().strip('"') for v in value.strip('()').split(',')]
+        return any(row_value == _coerce(v, row_value) for v in items)
+    if op in ('like', 'ilike'):
+        return bool(_like(value, op == 'ilike').match(str(row_value)))
+    value = _coerce(value, row_value)
+    try:
+        return {'eq': row_value == value, 'neq': row_value != value,
+                'gt': row_value > value, 'gte': row_value >= value,
+                'lt': row_value < value, 'lte': row_value <= value}[op]
+    except KeyError:
+        raise ApiError(400, 'unknown operator: %s' % op)
+    except TypeError:
+        return False
+
+
+def filter_rows(rows, params):
+    """
+    Apply PostgREST style column filters, e.g. age=gt.18 or name=not.eq.A
+    """
+    for column, expression in params:
+        if column in RESERVED_PARAMS:
+            continue
+        negate = expression.startswith('not.')
+        if negate:
+            expression = expression[4:]
+        if '.' not in expression:
+            raise ApiError(400, 'invalid filter: %s=%s' % (column, expression))
+        op, value = expression.split('.', 1)
+        rows = [r for r in rows if _matches(r.get(column), op, value) != negate]
+    return rows
+
+
+def order_rows(rows, order):
+    for clause in reversed(order.split(',')):
+        parts = clause.split('.')
+        column = parts[0]
+        descending = 'desc' in parts[1:]
+        present = [r for r in rows if r.get(column) is not None]
+        missing = [r for r in rows if r.get(column) is None]
+        present.sort(key=lambda r: r[column], reverse=descending)
+        rows = present + missing
+    return rows
+
+
+def query_rows(rows, params, headers):
+    """
+    Filter, order, page and project rows as PostgREST would.
+
+    Returns
+    -------
+    tuple
+
+        (rows, offset, total before paging)
+
+    """
+    query = dict(params)
+    rows = filter_rows(rows, params)
+    if query.get('order'):
+        rows = order_rows(rows, query['order'])
+    total = len(rows)
+    offset = int(query.get('offset', 0))
+    limit = int(query['limit']) if 'limit' in query else None
+    range_header = headers.get('Range')
+    if range_header and re.match(r'^\d+-\d*$', range_header):
+        first, last = range_header.split('-')
+        offset = int(first)
+        if last:
+            limit = int(last) - offset + 1 if limit is None else min(limit, int(last) - offset + 1)
+    rows = rows[offset:] if limit is None else rows[offset:offset + limit]
+    select = query.get('select')
+    if select and select != '*':
+        columns = [c.strip() for c in select.split(',')]
+        rows = [dict((c, r.get(c)) for c in columns) for r in rows]
+    return rows, offset, total
+
+
+class State(object):
+
+    """
+    In-memory tables, users, groups and event logs.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.users = {}
+        self.tables = {}
+        self.groups = {}
+        self.logs = dict((name, []) for name in EVENT_LOGS)
+        self.next_row_id = 1
+        self.next_event_id = 1
+
+
+    def log_access_control(self, event_type, group_name, target):
+        self.logs['event_log_access_control'].append(
+            {'id': self.next_event_id, 'event_time': _now(),
+             'event_type': event_type, 'group_name': group_name,
+             'target': target})
+        self.next_event_id += 1
+
+
+    def user_name(self, user_id, user_type):
+        prefix = {'data_owner': 'owner_', 'data_user': 'user_'}.get(user_type)
+        if not prefix:
+            raise ApiError(400, 'unknown user_type: %s' % user_type)
+        return prefix + user_id
+
+
+    def group(self, name):
+        if name not in self.groups:
+            raise ApiError(400, 'group does not exist: %s' % name)
+        return self.groups[name]
+
+
+    def table(self, name):
+        if name not in self.tables:
+            raise ApiError(404, 'relation does not exist: %s' % name)
+        return self.tables[name]
+
+
+    def select_members(self, data):
+        """
+        User names selected by a group_add_members/group_remove_members payload.
+        """
+        if 'members' in data:
+            memberships = data['members'].get('memberships', data['members'])
+            names = []
+            for key, user_type in [('data_owners', 'data_owner'), ('data_users', 'data_user')]:
+                for user_id in memberships.get(key, []):
+                    name = self.user_name(user_id, user_type)
+                    if name not in self.users:
+                        raise ApiError(400, 'user not registered: %s' % name)
+                    names.append(name)
+            return names
+        if 'metadata' in data:
+            key, value = data['metadata']['key'], data['metadata']['value']
+            return [n for n, u in self.users.items()
+                    if u['user_metadata'].get(key) == value]
+        if data.get('add_all') or data.get('remove_all'):
+            return list(self.users.keys())
+        if data.get('add_all_owners'):
+            return [n for n in self.users if n.startswith('owner_')]
+        if data.get('add_all_users'):
+            return [n for n in self.users if n.startswith('user_')]
+        raise ApiError(400, 'Could not match keys to a method')
+
+
+    def owners_with_grant(self, table_name, user_name, grant_type):
+        """
+        Data owners whose rows user_name can access through a group grant,
+        or None if no group of user_name has such a grant.
+        """
+        table = self.table(table_name)
+        owners = None
+        for group_name, types in table['grants'].items():
+            group = self.groups.get(group_name)
+            if grant_type in types and group and user_name in group['members']:
+                owners = (owners or set()) | set(
+                    m for m in group['members'] if m.startswith('owner_'))
+        return owners
+
+
+class StandInServer(object):
+
+    """
+    Threaded HTTP server with the pg-need-to-know API and in-memory state.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, jitter=0.0,
+                 tail_latency=0.0, tail_rate=0.0, bandwidth=None,
+                 error_rate=0.0, error_status=503, token_ttl=3600,
+                 secret='pyneedtoknow-stand-in', seed=None,
+                 compression_min_size=1024):
+        """
+        Parameters
+        ----------
+        host: str
+        port: int
+            0 to pick a free port
+        latency: float
+            seconds added to every response
+        jitter: float
+            up to this many seconds added at random
+        tail_latency: float
+            seconds added to a tail_rate fraction of responses,
+            e.g. to mimic a slow worker
+        tail_rate: float
+        bandwidth: int
+            optional, bytes per second responses are sent at
+        error_rate: float
+            fraction of requests answered with error_status
+        error_status: int
+        token_ttl: int
+            seconds until issued tokens expire
+        secret: str
+            JWT signing secret
+        seed: int
+            optional, seed for latency and error injection
+        compression_min_size: int
+            gzip or deflate responses of at least this many bytes, if the
+            client accepts it, None to never compress
+
+        """
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.tail_latency = tail_latency
+        self.tail_rate = tail_rate
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.token_ttl = token_ttl
+        self.secret = secret.encode('utf-8')
+        self.compression_min_size = compression_min_size
+        self.state = State()
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._httpd = None
+        self._thread = None
+        self.requests = 0
+        self.injected_errors = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+
+    @property
+    def url(self):
+        return 'http://%s:%d' % (self.host, self.port)
+
+
+    def start(self):
+        self._httpd = _HTTPServer((self.host, self.port), _Handler)
+        self._httpd.standin = self
+        self.port = self._httpd.server_address[1]
+        self._thread = threading.Thread(target=self._httpd.serve_forever,
+                                        kwargs={'poll_interval': 0.05},
+                                        name='pyneedtoknow-stand-in')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+
+    def stop(self):
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._thread.join()
+            self._httpd = None
+
+
+    def __enter__(self):
+        return self.start()
+
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+    def reset(self):
+        """
+        Drop all state.
+        """
+        self.state = State()
+
+
+    def stats(self):
+        """
+        Returns
+        -------
+        dict
+
+            {requests, injected_errors, bytes_in, bytes_out}
+
+        """
+        with self._stats_lock:
+            return {'requests': self.requests,
+                    'injected_errors': self.injected_errors,
+                    'bytes_in': self.bytes_in, 'bytes_out': self.bytes_out}
+
+
+    def _count(self, **kwargs):
+        with self._stats_lock:
+            for key, value in kwargs.items():
+                setattr(self, key, getattr(self, key) + value)
+
+
+    def delay(self):
+        with self._random_lock:
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            if self.tail_rate and self._random.random() < self.tail_rate:
+                delay += self.tail_latency
+            fail = self.error_rate and self._random.random() < self.error_rate
+        return delay, fail
+
+
+    def issue_token(self, role):
+        header = _b64(json.dumps({'alg': 'HS256', 'typ': 'JWT'}).encode('utf-8'))
+        claims = _b64(json.dumps({'role': role, 'exp': int(time.time()) + self.token_ttl}).encode('utf-8'))
+        signing_input = (header + '.' + claims).encode('ascii')
+        signature = _b64(hmac.new(self.secret, signing_input, hashlib.sha256).digest())
+        return header + '.' + claims + '.' + signature
+
+
+    def verify_token(self, token):
+        try:
+            header, claims, signature = token.split('.')
+        except ValueError:
+            raise ApiError(401, 'invalid JWT')
+        expected = _b64(hmac.new(self.secret, (header + '.' + claims).encode('ascii'),
+                                 hashlib.sha256).digest())
+        if not hmac.compare_digest(expected, signature):
+            raise ApiError(401, 'invalid JWT signature')
+        claims = json.loads(_unb64(claims).decode('utf-8'))
+        if claims.get('exp', 0) < time.time():
+            raise ApiError(401, 'JWT expired')
+        return claims['role']
+
+
+    # request handling, returns (status, body, extra headers)
+
+    def handle(self, method, path, params, headers, body):
+        auth = headers.get('Authorization', '')
+        role = self.verify_token(auth[len('Bearer '):]) if auth.startswith('Bearer ') else 'anon'
+        state = self.state
+        with state.lock:
+            if path.startswith('/rpc/'):
+                name = path[len('/rpc/'):]
+                func = getattr(self, 'rpc_' + name, None)
+                if func is None:
+                    raise ApiError(404, 'function does not exist: %s' % name)
+                if method == 'POST':
+                    data = json.loads(body.decode('utf-8')) if body else {}
+                else:
+                    data = dict(params)
+                return 200, func(state, role, data), {}
+            name = path.strip('/')
+            if name in ('table_overview', 'user_registrations', 'groups') or name in EVENT_LOGS:
+                if method not in ('GET', 'HEAD'):
+                    raise ApiError(405, 'method not allowed')
+                if role != 'admin':
+                    raise ApiError(403, 'permission denied for view %s' % name)
+                if name in EVENT_LOGS:
+                    rows = copy.deepcopy(state.logs[name])
+                else:
+                    rows = getattr(self, 'view_' + name)(state)
+                return self._read(rows, params, headers)
+            if method in ('GET', 'HEAD'):
+                return self._read(self.table_select(state, role, name), params, headers,
+                                  log_access=(role, name))
+            if method == 'POST':
+                return self.table_insert(state, role, name, body, headers)
+            if method == 'PATCH':
+                return self.table_update(state, role, name, params, body, headers)
+            raise ApiError(405, 'method not allowed')
+
+
+    def _read(self, rows, params, headers, log_access=None):
+        page, offset, total = query_rows(rows, params, headers)
+        if log_access and log_access[0].startswith('user_'):
+            for row in page:
+                if 'row_id' in row:
+                    self.state.logs['event_log_data_access'].append(
+                        {'request_time': _now(), 'row_id': row['row_id'],
+                         'data_user': log_access[0],
+                         'data_owner': row.get('row_owner')})
+        prefer = headers.get('Prefer', '')
+        count = total if 'count=' in prefer else '*'
+        if page:
+            content_range = '%d-%d/%s' % (offset, offset + len(page) - 1, count)
+        else:
+            content_range = '*/%s' % count
+        return 200, page, {'Content-Range': content_range}
+
+
+    def table_select(self, state, role, name):
+        table = state.table(name)
+        if role == 'admin':
+            return []
+        if role.startswith('owner_'):
+            return [dict(r) for r in table['rows'] if r['row_owner'] == role]
+        if role.startswith('user_'):
+            owners = state.owners_with_grant(name, role, 'select')
+            if owners is None:
+                raise ApiError(403, 'permission denied for relation %s' % name)
+            return [dict(r) for r in table['rows'] if r['row_owner'] in owners]
+        raise ApiError(401, 'permission denied for relation %s' % name)
+
+
+    def table_insert(self, state, role, name, body, headers):
+        table = state.table(name)
+        data = json.loads(body.decode('utf-8'))
+        rows = data if isinstance(data, list) else [data]
+        if role.startswith('user_'):
+            if state.owners_with_grant(name, role, 'insert') is None:
+                raise ApiError(403, 'permission denied for relation %s' % name)
+        elif not role.startswith('owner_'):
+            raise ApiError(403, 'permission denied for relation %s' % name)
+        columns = set(c['name'] for c in table['columns'])
+        inserted = []
+        for row in rows:
+            unknown = set(row.keys()) - columns - set(['row_owner'])
+            if unknown:
+                raise ApiError(400, 'column %s does not exist' % sorted(unknown)[0])
+            new = dict((c, row.get(c)) for c in columns)
+            new['row_id'] = state.next_row_id
+            new['row_owner'] = role if role.startswith('owner_') else row.get('row_owner')
+            new['row_originator'] = role
+            state.next_row_id += 1
+            inserted.append(new)
+        table['rows'].extend(inserted)
+        if 'return=representation' in headers.get('Prefer', ''):
+            return 201, inserted, {}
+        return 201, None, {}
+
+
+    def table_update(self, state, role, name, params, body, headers):
+        table = state.table(name)
+        data = json.loads(body.decode('utf-8'))
+        if role.startswith('owner_'):
+            allowed = lambda r: r['row_owner'] == role
+        elif role.startswith('user_'):
+            owners = state.owners_with_grant(name, role, 'update')
+            if owners is None:
+                raise ApiError(403, 'permission denied for relation %s' % name)
+            allowed = lambda r: r['row_originator'] == role or r['row_owner'] in owners
+        else:
+            raise ApiError(403, 'permission denied for relation %s' % name)
+        updated = []
+        for row in filter_rows([r for r in table['rows'] if allowed(r)], params):
+            for column, value in data.items():
+                if column in SYSTEM_COLUMNS:
+                    raise ApiError(400, 'column %s cannot be updated' % column)
+                state.logs['event_log_data_updates'].append(
+                    {'updated_time': _now(), 'updated_by': role, 'table_name': name,
+                     'row_id': row['row_id'], 'column_name': column,
+                     'old_data': row.get(column), 'new_data': value})
+                row[column] = value
+            updated.append(dict(row))
+        if 'return=representation' in headers.get('Prefer', ''):
+            return 200, updated, {}
+        return 204, None, {}
+
+
+    def _require_admin(self, role):
+        if role != 'admin':
+            raise ApiError(403, 'permission denied, admin role required')
+
+
+    def rpc_token(self, state, role, data):
+        token_type = data.get('token_type')
+        if token_type == 'admin':
+            return {'token': self.issue_token('admin')}
+        if token_type not in ('owner', 'user') or not data.get('user_id'):
+            raise ApiError(400, 'unknown token_type or missing user_id')
+        return {'token': self.issue_token(token_type + '_' + data['user_id'])}
+
+
+    def rpc_user_register(self, state, role, data):
+        name = state.user_name(data['user_id'], data['user_type'])
+        if name in state.users:
+            raise ApiError(409, 'user already registered: %s' % name)
+        state.users[name] = {'registration_date': _now(), 'user_id': data['user_id'],
+                             'user_name': name, 'user_type': data['user_type'],
+                             'user_metadata': data.get('user_metadata') or {}}
+        return 'user registered'
+
+
+    def rpc_user_delete(self, state, role, data):
+        self._require_admin(role)
+        name = state.user_name(data['user_id'], data['user_type'])
+        if name not in state.users:
+            raise ApiError(400, 'user does not exist: %s' % name)
+        del state.users[name]
+        for group in state.groups.values():
+            group['members'].discard(name)
+        return 'user deleted'
+
+
+    def rpc_user_delete_data(self, state, role, data):
+        if not (role.startswith('owner_') or role.startswith('user_')):
+            raise ApiError(403, 'only data owners and users can delete their data')
+        key = 'row_owner' if role.startswith('owner_') else 'row_originator'
+        for table in state.tables.values():
+            table['rows'] = [r for r in table['rows'] if r[key] != role]
+        state.logs['event_log_user_data_deletions'].append(
+            {'user_name': role, 'request_date': _now()})
+        return 'data deleted'
+
+
+    def rpc_user_groups(self, state, role, data):
+        if role == 'admin':
+            name = state.user_name(data['user_id'], data['user_type'])
+        elif role.startswith('owner_') or role.startswith('user_'):
+            name = role
+        else:
+            raise ApiError(403, 'permission denied')
+        return [{'group_name': g, 'group_metadata': group['metadata']}
+                for g, group in sorted(state.groups.items()) if name in group['members']]
+
+
+    def rpc_user_group_remove(self, state, role, data):
+        group = state.group(data['group_name'])
+        if role not in group['members']:
+            raise ApiError(400, '%s is not a member of %s' % (role, data['group_name']))
+        group['members'].discard(role)
+        state.logs['event_log_user_group_removals'].append(
+            {'removal_date': _now(), 'user_name': role, 'group_name': data['group_name']})
+        return 'removed from group'
+
+
+    def rpc_table_create(self, state, role, data):
+        self._require_admin(role)
+        definition = data['definition']
+        name = definition['table_name']
+        if name in state.tables:
+            raise ApiError(409, 'relation already exists: %s' % name)
+        state.tables[name] = {'columns': [dict(c) for c in definition['columns']],
+                              'description': definition.get('description'),
+                              'rows': [], 'grants': {}}
+        return 'table created'
+
+
+    def rpc_table_describe(self, state, role, data):
+        self._require_admin(role)
+        state.table(data['table_name'])['description'] = data['table_description']
+        return 'table described'
+
+
+    def rpc_table_describe_columns(self, state, role, data):
+        self._require_admin(role)
+        columns = dict((c['name'], c) for c in state.table(data['table_name'])['columns'])
+        for description in data['column_descriptions']:
+            if description['name'] not in columns:
+                raise ApiError(400, 'column does not exist: %s' % description['name'])
+            columns[description['name']]['description'] = description['description']
+        return 'columns described'
+
+
+    def rpc_table_metadata(self, state, role, data):
+        if role == 'anon':
+            raise ApiError(401, 'permission denied')
+        name = data['table_name']
+        table = state.table(name)
+        return [{'table_name': name, 'table_description': table['description'],
+                 'column_name': c['name'], 'column_type': c.get('type'),
+                 'column_description': c.get('description')}
+                for c in table['columns']]
+
+
+    def _grant(self, state, role, data, revoke):
+        self._require_admin(role)
+        table = state.table(data['table_name'])
+        state.group(data['group_name'])
+        grant_type = data['grant_type']
+        if grant_type not in ('select', 'insert', 'update'):
+            raise ApiError(400, 'unknown grant_type: %s' % grant_type)
+        grants = table['grants'].setdefault(data['group_name'], set())
+        if revoke:
+            grants.discard(grant_type)
+        else:
+            grants.add(grant_type)
+        state.log_access_control('table_grant_%s_%s' % ('revoke' if revoke else 'add', grant_type),
+                                 data['group_name'], data['table_name'])
+        return 'grant revoked' if revoke else 'grant added'
+
+
+    def rpc_table_group_access_grant(self, state, role, data):
+        return self._grant(state, role, data, False)
+
+
+    def rpc_table_group_access_revoke(self, state, role, data):
+        return self._grant(state, role, data, True)
+
+
+    def rpc_group_create(self, state, role, data):
+        self._require_admin(role)
+        if data['group_name'] in state.groups:
+            raise ApiError(409, 'group already exists: %s' % data['group_name'])
+        state.groups[data['group_name']] = {'metadata': data.get('group_metadata') or {},
+                                            'members': set()}
+        state.log_access_control('group_create', data['group_name'], None)
+        return 'group created'
+
+
+    def rpc_group_delete(self, state, role, data):
+        self._require_admin(role)
+        group = state.group(data['group_name'])
+        if group['members']:
+            raise ApiError(400, 'group has members: %s' % data['group_name'])
+        del state.groups[data['group_name']]
+        for table in state.tables.values():
+            table['grants'].pop(data['group_name'], None)
+        state.log_access_control('group_delete', data['group_name'], None)
+        return 'group deleted'
+
+
+    def rpc_group_add_members(self, state, role, data):
+        self._require_admin(role)
+        group = state.group(data['group_name'])
+        for name in state.select_members(data):
+            if name not in group['members']:
+                group['members'].add(name)
+                state.log_access_control('group_member_add', data['group_name'], name)
+        return 'members added'
+
+
+    def rpc_group_remove_members(self, state, role, data):
+        self._require_admin(role)
+        group = state.group(data['group_name'])
+        for name in state.select_members(data):
+            if name in group['members']:
+                group['members'].discard(name)
+                state.log_access_control('group_member_remove', data['group_name'], name)
+        return 'members removed'
+
+
+    def rpc_group_list_members(self, state, role, data):
+        self._require_admin(role)
+        group = state.group(data['group_name'])
+        return [{'group_name': data['group_name'], 'user_name': m}
+                for m in sorted(group['members'])]
+
+
+    def view_table_overview(self, state):
+        return [{'table_name': name, 'table_description': t['description'],
+                 'groups_with_access': sorted(g for g, types in t['grants'].items() if types)}
+                for name, t in sorted(state.tables.items())]
+
+
+    def view_user_registrations(self, state):
+        return [copy.deepcopy(u) for n, u in sorted(state.users.items())]
+
+
+    def view_groups(self, state):
+        return [{'group_name': g, 'group_metadata': group['metadata']}
+                for g, group in sorted(state.groups.items())]
+
+
+class _HTTPServer(ThreadingMixIn, HTTPServer):
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+
+    def _dispatch(self, method):
+        standin = self.server.standin
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        standin._count(requests=1, bytes_in=length)
+        encoding = self.headers.get('Content-Encoding')
+        delay, fail = standin.delay()
+        if delay:
+            time.sleep(delay)
+        extra = {}
+        if fail:
+            standin._count(injected_errors=1)
+            status, payload = standin.error_status, {'message': 'injected error'}
+        else:
+            url = urlsplit(self.path)
+            params = parse_qsl(url.query, keep_blank_values=True)
+            try:
+                if encoding:
+                    try:
+                        body = decompress(body, encoding)
+                    except Exception:
+                        raise ApiError(415, 'cannot decode %s request body' % encoding)
+                status, payload, extra = standin.handle(method, unquote(url.path), params,
+                                                        self.headers, body)
+            except ApiError as e:
+                status, payload = e.status, {'message': e.message}
+            except (KeyError, ValueError, TypeError) as e:
+                status, payload = 400, {'message': 'bad request: %r' % e}
+        data = b'' if payload is None else json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        for key, value in extra.items():
+            self.send_header(key, value)
+        if data:
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            accepted = self.headers.get('Accept-Encoding', '')
+            if standin.compression_min_size is not None and len(data) >= standin.compression_min_size:
+                for encoding in ['gzip', 'deflate']:
+                    if encoding in accepted:
+                        data = compress(data, encoding)
+                        self.send_header('Content-Encoding', encoding)
+                        break
+        self.send_header('Content-Length', str(len(data)))
+        if self.close_connection:
+            # let clients know not to re-use the connection
+            self.send_header('Connection', 'close')
+        self.end_headers()
+        if method != 'HEAD' and data:
+            self._write(data, standin.bandwidth)
+            standin._count(bytes_out=len(data))
+
+
+    def _write(self, data, bandwidth):
+        if not bandwidth:
+            self.wfile.write(data)
+            return
+        chunk = max(int(bandwidth / 50), 1)
+        for i in range(0, len(data), chunk):
+            self.wfile.write(data[i:i + chunk])
+            time.sleep(len(data[i:i + chunk]) / float(bandwidth))
+
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+
+    def do_HEAD(self):
+        self._dispatch('HEAD')
+
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+
+    def do_PATCH(self):
+        self._dispatch('PATCH')
+
+
+    def do_DELETE(self):
+        self._dispatch('DELETE')
+
+
+@click.command()
+@click.option('--host', default='127.0.0.1')
+@click.option('--port', default=3000)
+@click.option('--latency', default=0.0)
+@click.option('--jitter', default=0.0)
+@click.option('--tail-latency', default=0.0)
+@click.option('--tail-rate', default=0.0)
+@click.option('--bandwidth', default=None, type=int)
+@click.option('--error-rate', default=0.0)
+@click.option('--error-status', default=503)
+@click.option('--seed', default=None, type=int)
+@click.option('--compression-min-size', default=1024, type=int)
+def main(host, port, latency, jitter, tail_latency, tail_rate, bandwidth,
+         error_rate, error_status, seed, compression_min_size):
+    server = StandInServer(host=host, port=port, latency=latency, jitter=jitter,
+                           tail_latency=tail_latency, tail_rate=tail_rate,
+                           bandwidth=bandwidth, error_rate=error_rate,
+                           error_status=error_status, seed=seed,
+                           compression_min_size=compression_min_size).start()
+    click.echo('pg-need-to-know stand-in listening on %s' % server.url)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
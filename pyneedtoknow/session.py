@@ -0,0 +1,149 @@
+
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .compression import ACCEPT_ENCODING
+
+
+class HttpSession(object):
+
+    """
+    Thread-safe, pooled HTTP session used by PgNeedToKnowClient.
+
+    All requests share one requests.Session, so TCP (and TLS) connections
+    are kept alive and re-used between calls instead of being opened for
+    every request.
+    """
+
+    def __init__(self, pool_connections=10, pool_maxsize=10, pool_block=False,
+                 keep_alive=True, max_retries=0, timeout=None):
+        """
+        Parameters
+        ----------
+        pool_connections: int
+            number of per-host connection pools to keep
+        pool_maxsize: int
+            maximum number of connections kept open per host
+        pool_block: bool
+            if True, never open more than pool_maxsize connections per host,
+            callers wait for a free connection instead
+        keep_alive: bool
+            if False, send 'Connection: close' and disable connection re-use
+        max_retries: int
+            connection-level retries, passed on to the HTTPAdapter
+        timeout: float or tuple
+            optional, seconds, or (connect, read) seconds
+
+        """
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.pool_block = pool_block
+        self.keep_alive = keep_alive
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._session = None
+        self._closed = False
+        self._num_requests = 0
+        self._num_connections = 0
+
+
+    def _get_session(self):
+        with self._lock:
+            if self._closed:
+                raise Exception('Session is closed')
+            if self._session is None:
+                self._session = self._create_session()
+            return self._session
+
+
+    def _create_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.pool_connections,
+                              pool_maxsize=self.pool_maxsize,
+                              pool_block=self.pool_block,
+                              max_retries=self.max_retries)
+        # keep counts from pools that are evicted or closed
+        pools = adapter.poolmanager.pools
+        dispose = pools.dispose_func
+        def _dispose(pool):
+            self._record_pool(pool)
+            if dispose:
+                dispose(pool)
+        pools.dispose_func = _dispose
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        # responses are decoded transparently, also when streamed
+        session.headers['Accept-Encoding'] = ACCEPT_ENCODING
+        if not self.keep_alive:
+            session.headers['Connection'] = 'close'
+        self._adapter = adapter
+        return session
+
+
+    def _record_pool(self, pool):
+        self._num_requests += pool.num_requests
+        self._num_connections += pool.num_connections
+
+
+    def request(self, method, url, **kwargs):
+        if self.timeout is not None:
+            kwargs.setdefault('timeout', self.timeout)
+        return self._get_session().request(method, url, **kwargs)
+
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+
+    def patch(self, url, **kwargs):
+        return self.request('PATCH', url, **kwargs)
+
+
+    def stats(self):
+        """
+        Returns
+        -------
+        dict
+
+            {requests, connections, reused_connections}
+
+        """
+        num_requests = self._num_requests
+        num_connections = self._num_connections
+        with self._lock:
+            if self._session is not None:
+                pools = self._adapter.poolmanager.pools
+                for key in pools.keys():
+                    pool = pools.get(key)
+                    if pool is not None:
+                        num_requests += pool.num_requests
+                        num_connections += pool.num_connections
+        if not self.keep_alive:
+            # urllib3 re-opens closed connections in place, without counting them
+            num_connections = num_requests
+        return {'requests': num_requests,
+                'connections': num_connections,
+                'reused_connections': max(num_requests - num_connections, 0)}
+
+
+    def close(self):
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+            self._closed = True
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.close()
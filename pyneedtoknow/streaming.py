@@ -0,0 +1,82 @@
+
+import codecs
+import json
+
+WHITESPACE = ' \t\n\r'
+DELIMITERS = WHITESPACE + ',]'
+
+
+def iter_json_array(chunks, decoder=None):
+    """
+    Incrementally decode a top-level JSON array, yielding its elements.
+
+    Only the current, partially received, element is held in memory,
+    so memory use is bounded by the chunk and row size, not the size
+    of the whole document.
+
+    Parameters
+    ----------
+    chunks: iterable
+        of bytes, e.g. requests.Response.iter_content(65536)
+    decoder: json.JSONDecoder
+
+    Returns
+    -------
+    generator
+
+    """
+    decoder = decoder or json.JSONDecoder()
+    text = codecs.getincrementaldecoder('utf-8')()
+    buf = ''
+    pos = 0
+    started = False
+    finished = False
+    eof = False
+    chunks = iter(chunks)
+    while True:
+        if not eof:
+            try:
+                chunk = next(chunks)
+                buf = buf[pos:] + text.decode(chunk)
+            except StopIteration:
+                buf = buf[pos:] + text.decode(b'', final=True)
+                eof = True
+            pos = 0
+        while True:
+            while pos < len(buf) and buf[pos] in WHITESPACE:
+                pos += 1
+            if pos == len(buf):
+                break
+            if finished:
+                raise ValueError('Unexpected data after JSON array')
+            if not started:
+                if buf[pos] != '[':
+                    raise ValueError('Expected a JSON array')
+                started = True
+                pos += 1
+                continue
+            if buf[pos] == ']':
+                finished = True
+                pos += 1
+                continue
+            if buf[pos] == ',':
+                pos += 1
+                continue
+            try:
+                value, end = decoder.raw_decode(buf, pos)
+            except ValueError:
+                if eof:
+                    raise
+                break
+            # a number may continue in the next chunk, e.g. '15' of '1500.0'
+            if end == len(buf) or buf[end] not in DELIMITERS:
+                if not eof:
+                    break
+                if end < len(buf):
+                    raise ValueError('Invalid JSON array')
+            pos = end
+            yield value
+        if eof:
+            if not finished:
+                raise ValueError('Incomplete JSON array')
+            return
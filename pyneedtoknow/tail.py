@@ -0,0 +1,249 @@
+
+import hashlib
+import json
+import os
+import threading
+
+try:
+    from urllib.parse import quote
+except ImportError:
+    from urllib import quote
+
+# event log -> column rows are ordered by
+EVENT_LOG_CURSORS = {
+    'event_log_access_control': 'id',
+    'event_log_data_access': 'request_time',
+    'event_log_data_updates': 'updated_time',
+    'event_log_user_group_removals': 'removal_date',
+    'event_log_user_data_deletions': 'request_date',
+}
+
+# event log -> columns that order rows with the same cursor value
+EVENT_LOG_TIEBREAKERS = {
+    'event_log_access_control': [],
+    'event_log_data_access': ['row_id', 'data_user', 'data_owner'],
+    'event_log_data_updates': ['table_name', 'row_id', 'column_name', 'updated_by'],
+    'event_log_user_group_removals': ['user_name', 'group_name'],
+    'event_log_user_data_deletions': ['user_name'],
+}
+
+
+class MemoryCheckpointStore(object):
+
+    """
+    Keeps checkpoints for the lifetime of the process.
+    """
+
+    def __init__(self):
+        self._checkpoints = {}
+
+
+    def load(self, name):
+        return self._checkpoints.get(name)
+
+
+    def save(self, name, checkpoint):
+        self._checkpoints[name] = checkpoint
+
+
+class FileCheckpointStore(object):
+
+    """
+    Keeps checkpoints in a JSON file, replaced atomically on every save,
+    so a restarted process resumes where the last one stopped.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            with open(path) as f:
+                self._checkpoints = json.load(f)
+        except (IOError, OSError):
+            self._checkpoints = {}
+
+
+    def load(self, name):
+        with self._lock:
+            return self._checkpoints.get(name)
+
+
+    def save(self, name, checkpoint):
+        with self._lock:
+            self._checkpoints[name] = checkpoint
+            tmp = self.path + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(self._checkpoints, f)
+            getattr(os, 'replace', os.rename)(tmp, self.path)
+
+
+def _fingerprint(row):
+    return hashlib.sha1(json.dumps(row, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class EventLogTail(object):
+
+    """
+    Incrementally read new rows from the event log views.
+
+    For each log the last seen cursor value is remembered, and only rows
+    from that value on are requested. Cursor columns such as timestamps
+    need not be unique: rows at the last cursor value that were already
+    returned are remembered and skipped. A checkpoint only moves past a row
+    once the consumer asks for the next one, so after a restart rows are
+    returned at least once.
+
+    Pages are requested by cursor value rather than by offset into the
+    whole log, ordered by the cursor and the EVENT_LOG_TIEBREAKERS columns,
+    so rows sharing a timestamp across a page boundary, or rows added while
+    paging, are neither skipped nor repeated.
+    """
+
+    def __init__(self, client, token, logs=None, store=None, page_size=1000,
+                 checkpoint_every=1000):
+        """
+        Parameters
+        ----------
+        client: PgNeedToKnowClient
+        token: str or callable
+            admin JWT, or a function returning one, called for every poll
+        logs: list
+            event log names, keys of EVENT_LOG_CURSORS, default all
+        store: checkpoint store
+            MemoryCheckpointStore (default), FileCheckpointStore, or any
+            object with load(name) and save(name, checkpoint)
+        page_size: int
+            number of rows per request
+        checkpoint_every: int
+            save the checkpoint after this many rows, and at the end of a poll
+
+        """
+        self.client = client
+        self.token = token
+        self.logs = logs or sorted(EVENT_LOG_CURSORS.keys())
+        for log in self.logs:
+            if log not in EVENT_LOG_CURSORS:
+                raise Exception('Unknown event log: %s' % log)
+        self.store = store or MemoryCheckpointStore()
+        self.page_size = page_size
+        self.checkpoint_every = checkpoint_every
+
+
+    def _token(self):
+        return self.token() if callable(self.token) else self.token
+
+
+    def checkpoint(self, log):
+        """
+        Returns
+        -------
+        dict or None
+
+            {value, seen}, the last cursor value and fingerprints
+            of the rows returned with that value
+
+        """
+        return self.store.load(log)
+
+
+    def reset(self, log):
+        self.store.save(log, None)
+
+
+    def _page(self, log, token, value, offset):
+        column = EVENT_LOG_CURSORS[log]
+        order = ','.join(c + '.asc' for c in [column] + EVENT_LOG_TIEBREAKERS[log])
+        endpoint = self.client.api_endpoints[log] + '?'
+        if value is not None:
+            endpoint += '%s=gte.%s&' % (column, quote(str(value), safe=''))
+        endpoint += 'order=%s&limit=%d' % (order, self.page_size)
+        if offset:
+            endpoint += '&offset=%d' % offset
+        resp = self.client.get_data(token, endpoint)
+        if resp.status_code >= 400:
+            raise Exception('Could not fetch %s: %d %s'
+                            % (endpoint, resp.status_code, resp.text))
+        return self.client.json(resp)
+
+
+    def poll(self, log):
+        """
+        Fetch rows added to one event log since the last checkpoint.
+
+        Parameters
+        ----------
+        log: str
+
+        Returns
+        -------
+        generator of dict
+
+        """
+        column = EVENT_LOG_CURSORS[log]
+        checkpoint = self.store.load(log)
+        if checkpoint:
+            value, seen = checkpoint['value'], set(checkpoint['seen'])
+        else:
+            value, seen = None, set()
+        token = self._token()
+        # rows at value come first in a page, in a fixed order,
+        # the ones already returned are skipped with the offset
+        offset = len(seen)
+        unsaved = 0
+        try:
+            while True:
+                page = self._page(log, token, value, offset)
+                for row in page:
+                    if row[column] != value:
+                        value, seen, offset = row[column], set(), 0
+                    offset += 1
+                    fingerprint = _fingerprint(row)
+                    if fingerprint in seen:
+                        continue
+                    yield row
+                    seen.add(fingerprint)
+                    unsaved += 1
+                    if unsaved >= self.checkpoint_every:
+                        self.store.save(log, {'value': value, 'seen': sorted(seen)})
+                        unsaved = 0
+                if len(page) < self.page_size:
+                    break
+        finally:
+            if unsaved:
+                self.store.save(log, {'value': value, 'seen': sorted(seen)})
+
+
+    def poll_all(self):
+        """
+        Fetch new rows from all logs.
+
+        Returns
+        -------
+        generator of (log, row)
+
+        """
+        for log in self.logs:
+            for row in self.poll(log):
+                yield log, row
+
+
+    def follow(self, interval=300, stop=None):
+        """
+        Poll all logs forever, sleeping interval seconds between polls.
+
+        Parameters
+        ----------
+        interval: int
+        stop: threading.Event
+            optional, set it to stop following
+
+        Returns
+        -------
+        generator of (log, row)
+
+        """
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            for log, row in self.poll_all():
+                yield log, row
+            stop.wait(interval)
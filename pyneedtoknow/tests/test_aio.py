@@ -0,0 +1,51 @@
+
+import asyncio
+import unittest
+
+from ..aio import UNSUPPORTED, AsyncPgNeedToKnowClient
+from ..server import StandInServer
+
+
+class TestAsyncClient(unittest.TestCase):
+
+
+    def test_single_requests(self):
+        async def run(url):
+            async with AsyncPgNeedToKnowClient(url=url) as c:
+                users = [{'user_id': str(i), 'user_type': 'data_owner',
+                          'user_metadata': {}} for i in range(5)]
+                resps = await asyncio.gather(*[c.user_register(u) for u in users])
+                token = await c.token(token_type='admin')
+                registrations = c.json(await c.get_user_registrations(token))
+                return [r.status_code for r in resps], registrations
+        with StandInServer() as server:
+            codes, registrations = asyncio.run(run(server.url))
+        self.assertTrue(all(code < 400 for code in codes))
+        self.assertEqual(len(registrations), 5)
+
+
+    def test_plain_with_raises(self):
+        async def run():
+            c = AsyncPgNeedToKnowClient()
+            try:
+                with self.assertRaises(TypeError) as e:
+                    with c:
+                        pass
+                self.assertTrue('async with' in str(e.exception))
+            finally:
+                await c.close()
+        asyncio.run(run())
+
+
+    def test_unsupported_methods_raise(self):
+        async def run():
+            c = AsyncPgNeedToKnowClient()
+            try:
+                for name in UNSUPPORTED:
+                    with self.assertRaises(Exception) as e:
+                        getattr(c, name)([], 'token', '/t1')
+                    self.assertTrue('not supported on the async client' in str(e.exception))
+            finally:
+                await c.close()
+        self.assertEqual(len(UNSUPPORTED), 24)
+        asyncio.run(run())
@@ -0,0 +1,35 @@
+
+import unittest
+
+from ..bench import compare, measure, percentile
+
+
+class TestBench(unittest.TestCase):
+
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 95), 95)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([3], 99), 3)
+        self.assertEqual(percentile([], 50), None)
+
+
+    def test_measure(self):
+        def func(i):
+            if i % 10 == 0:
+                raise Exception('failed')
+        result = measure(func, 50, 4)
+        self.assertEqual(result['count'], 50)
+        self.assertEqual(result['errors'], 5)
+        self.assertTrue(result['p50_ms'] <= result['p95_ms'] <= result['p99_ms'])
+
+
+    def test_compare(self):
+        old = {'results': [{'operation': 'token', 'concurrency': 1, 'payload_bytes': None,
+                            'p95_ms': 10.0, 'cpu_ms_per_call': 1.0, 'rps': 100.0}]}
+        new = {'results': [{'operation': 'token', 'concurrency': 1, 'payload_bytes': None,
+                            'p95_ms': 10.5, 'cpu_ms_per_call': 2.0, 'rps': 80.0}]}
+        rows = dict((r['metric'], r['regression']) for r in compare(old, new, 0.1))
+        self.assertEqual(rows, {'p95_ms': False, 'cpu_ms_per_call': True, 'rps': True})
@@ -0,0 +1,90 @@
+
+import json
+import threading
+import time
+import unittest
+
+from ..bulk import batches, run_many
+
+
+class FakeResponse(object):
+
+    def __init__(self, status_code, text=''):
+        self.status_code = status_code
+        self.text = text
+
+
+class TestRunMany(unittest.TestCase):
+
+
+    def test_results_in_order_and_failures_recorded(self):
+        def func(i):
+            if i == 3:
+                raise ValueError('boom')
+            if i == 5:
+                return FakeResponse(409, 'conflict')
+            return FakeResponse(200)
+        result = run_many(func, range(10), max_workers=4)
+        self.assertEqual([r.index for r in result.items], list(range(10)))
+        self.assertEqual(result.succeeded, 8)
+        self.assertEqual(result.failed, 2)
+        failures = result.failures()
+        self.assertEqual(failures[0].error, 'boom')
+        self.assertEqual(failures[1].status_code, 409)
+        self.assertEqual(failures[1].error, 'conflict')
+
+
+    def test_result_without_status_code_fails(self):
+        result = run_many(lambda i: None, range(2))
+        self.assertEqual(result.failed, 2)
+        self.assertTrue('no response' in result.failures()[0].error)
+
+
+    def test_bounded_parallelism(self):
+        lock = threading.Lock()
+        state = {'in_flight': 0, 'max': 0}
+        def func(i):
+            with lock:
+                state['in_flight'] += 1
+                state['max'] = max(state['max'], state['in_flight'])
+            time.sleep(0.005)
+            with lock:
+                state['in_flight'] -= 1
+            return FakeResponse(200)
+        result = run_many(func, (i for i in range(50)), max_workers=3)
+        self.assertEqual(result.succeeded, 50)
+        self.assertTrue(state['max'] <= 3)
+
+
+    def test_progress(self):
+        seen = []
+        run_many(lambda i: FakeResponse(200), [1, 2, 3],
+                 progress=lambda done, total, r: seen.append((done, total)))
+        self.assertEqual(sorted(seen), [(1, 3), (2, 3), (3, 3)])
+        seen = []
+        run_many(lambda i: FakeResponse(200), iter([1, 2]),
+                 progress=lambda done, total, r: seen.append(total))
+        self.assertEqual(seen, [None, None])
+
+
+class TestBatches(unittest.TestCase):
+
+
+    def test_split_by_rows(self):
+        out = list(batches(({'i': i} for i in range(7)), max_rows=3))
+        self.assertEqual([(b.offset, len(b)) for b in out], [(0, 3), (3, 3), (6, 1)])
+        self.assertEqual(json.loads(out[0].body()), [{'i': 0}, {'i': 1}, {'i': 2}])
+
+
+    def test_split_by_bytes(self):
+        rows = [{'x': 'a' * 10}] * 5
+        size = len(json.dumps(rows[0]))
+        out = list(batches(rows, max_rows=100, max_bytes=2 * size + 3))
+        self.assertEqual([len(b) for b in out], [2, 2, 1])
+        for b in out:
+            self.assertTrue(len(b.body()) <= 2 * size + 3)
+
+
+    def test_oversized_row(self):
+        out = list(batches([{'x': 'a' * 100}, {'x': 1}], max_bytes=10))
+        self.assertEqual([len(b) for b in out], [1, 1])
@@ -0,0 +1,109 @@
+
+import time
+import unittest
+
+from ..cache import TTLCache
+from ..client import PgNeedToKnowClient
+
+
+class FakeResponse(object):
+
+    def __init__(self, status_code=200, text='[]'):
+        self.status_code = status_code
+        self.text = text
+
+
+class FakeSession(object):
+
+    def __init__(self):
+        self.calls = []
+
+    def get(self, url, **kwargs):
+        self.calls.append(('GET', url))
+        return FakeResponse()
+
+    def post(self, url, **kwargs):
+        self.calls.append(('POST', url))
+        return FakeResponse()
+
+    def close(self):
+        pass
+
+
+class TestTTLCache(unittest.TestCase):
+
+
+    def test_ttl(self):
+        cache = TTLCache(ttl=0.01)
+        cache.put('k', 1)
+        self.assertEqual(cache.get('k'), 1)
+        time.sleep(0.02)
+        self.assertRaises(KeyError, cache.get, 'k')
+
+
+    def test_lru(self):
+        cache = TTLCache(maxsize=2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a')
+        cache.put('c', 3)
+        self.assertRaises(KeyError, cache.get, 'b')
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+
+    def test_invalidate_by_tag(self):
+        cache = TTLCache()
+        cache.put('m1', 1, ['group_members', 'group_members:g1'])
+        cache.put('m2', 2, ['group_members', 'group_members:g2'])
+        cache.invalidate('group_members:g1')
+        self.assertRaises(KeyError, cache.get, 'm1')
+        self.assertEqual(cache.get('m2'), 2)
+        cache.invalidate('group_members')
+        self.assertRaises(KeyError, cache.get, 'm2')
+
+
+    def test_stale_put_is_dropped(self):
+        cache = TTLCache()
+        generation = cache.generation
+        cache.invalidate('groups')
+        cache.put('groups', 1, ['groups'], generation)
+        self.assertRaises(KeyError, cache.get, 'groups')
+
+
+class TestClientMetadataCache(unittest.TestCase):
+
+
+    def setUp(self):
+        self.session = FakeSession()
+        self.ntkc = PgNeedToKnowClient(session=self.session, metadata_cache=True)
+
+
+    def test_reads_are_cached(self):
+        for i in range(3):
+            self.ntkc.get_groups('token')
+            self.ntkc.table_metadata({'table_name': 't1'}, 'token')
+            self.ntkc.group_list_members({'group_name': 'group1'}, 'token')
+        self.assertEqual(len(self.session.calls), 3)
+        self.assertEqual(self.ntkc.metadata_cache.stats()['hits'], 6)
+
+
+    def test_writes_invalidate(self):
+        self.ntkc.group_list_members({'group_name': 'group1'}, 'token')
+        self.ntkc.group_list_members({'group_name': 'group2'}, 'token')
+        self.ntkc.table_metadata({'table_name': 't1'}, 'token')
+        self.ntkc.group_add_members({'group_name': 'group1', 'add_all': True}, 'token')
+        self.ntkc.table_describe_columns({'table_name': 't1', 'column_descriptions': []}, 'token')
+        del self.session.calls[:]
+        self.ntkc.group_list_members({'group_name': 'group1'}, 'token')
+        self.ntkc.group_list_members({'group_name': 'group2'}, 'token')
+        self.ntkc.table_metadata({'table_name': 't1'}, 'token')
+        self.assertEqual([c[1] for c in self.session.calls],
+                         ['http://localhost:3000/rpc/group_list_members',
+                          'http://localhost:3000/rpc/table_metadata?table_name=t1'])
+
+
+    def test_errors_are_not_cached(self):
+        self.session.get = lambda url, **kwargs: FakeResponse(403)
+        self.ntkc.get_groups('token')
+        self.assertEqual(self.ntkc.metadata_cache.stats()['size'], 0)
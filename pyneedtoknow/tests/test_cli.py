@@ -0,0 +1,99 @@
+
+import contextlib
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from click.testing import CliRunner
+
+from ..cli import main, print_stats
+from ..metrics import MetricsRegistry, RequestEvent
+from ..server import StandInServer
+
+
+class TestCli(unittest.TestCase):
+
+
+    def setUp(self):
+        self.server = StandInServer().start()
+        self.runner = CliRunner()
+        self.tmp = tempfile.mkdtemp()
+
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.tmp)
+
+
+    def invoke(self, *args, **kwargs):
+        return self.runner.invoke(main, ['--url', self.server.url] + list(args), **kwargs)
+
+
+    def test_token(self):
+        result = self.invoke('token')
+        self.assertEqual(result.exit_code, 0)
+        self.assertEqual(result.output.count('.'), 2)
+        self.assertNotEqual(self.invoke('token', '--type', 'owner').exit_code, 0)
+
+
+    def test_register_from_stdin(self):
+        users = 'A\nB\n\n{"user_id": "X", "user_type": "data_user", "user_metadata": {}}\n'
+        result = self.invoke('--stats', 'register', '-', '--concurrency', '4', input=users)
+        self.assertEqual(result.exit_code, 0)
+        self.assertEqual(json.loads(result.output.splitlines()[0])['succeeded'], 3)
+        self.assertTrue('requests=3' in result.output)
+        result = self.invoke('register', '-', input='A\n')
+        self.assertEqual(result.exit_code, 1)
+        result = self.invoke('--adaptive', '8', '--stats', 'register', '-', input='C\nD\n')
+        self.assertEqual(result.exit_code, 0)
+        self.assertTrue('limit=' in result.output)
+
+
+    def test_apply_grant_and_dump_logs(self):
+        plan = {'tables': [{'table_name': 't1', 'description': 'people',
+                            'columns': [{'name': 'age', 'type': 'int', 'description': 'a'}]}],
+                'data_owners': ['A', 'B'], 'data_users': ['X'],
+                'groups': {'group1': {'data_owners': ['A'], 'data_users': ['X']}},
+                'grants': [['t1', 'group1', 'select']]}
+        path = os.path.join(self.tmp, 'plan.json')
+        with open(path, 'w') as f:
+            json.dump(plan, f)
+        self.assertEqual(self.invoke('apply', path).exit_code, 0)
+        self.assertEqual(self.invoke('revoke', 't1', 'group1', 'select').exit_code, 0)
+        self.assertEqual(self.invoke('grant', 't1', 'group1', 'select').exit_code, 0)
+        groups = json.loads(self.invoke('groups').output)
+        self.assertEqual([g['group_name'] for g in groups], ['group1'])
+        checkpoints = os.path.join(self.tmp, 'checkpoints.json')
+        result = self.invoke('dump-logs', '--log', 'event_log_access_control',
+                             '--checkpoints', checkpoints)
+        self.assertEqual(result.exit_code, 0)
+        self.assertTrue(len(result.output.splitlines()) > 0)
+        result = self.invoke('dump-logs', '--log', 'event_log_access_control',
+                             '--checkpoints', checkpoints)
+        self.assertEqual(result.output, '')
+
+
+    def test_stats_with_slow_requests(self):
+        metrics = MetricsRegistry(buckets=(0.01, 0.1))
+        metrics(RequestEvent('token', 'POST', '/rpc/token', 200, 0.5, 0, 0, None, 0, 0))
+        self.assertEqual(metrics.snapshot()['token']['p95_ms'], None)
+        err = io.StringIO()
+        with contextlib.redirect_stderr(err):
+            print_stats(metrics.snapshot(), 1.0)
+        self.assertTrue('p95<=         -' in err.getvalue(), err.getvalue())
+
+
+    def test_client_import_is_light(self):
+        code = ('import sys; import pyneedtoknow.client; '
+                'print(" ".join(m for m in ["concurrent.futures", "csv", "orjson", '
+                '"http.client", "pyneedtoknow.bulk", "pyneedtoknow.tail"] '
+                'if m in sys.modules))')
+        out = subprocess.check_output([sys.executable, '-c', code],
+                                      cwd=os.path.dirname(os.path.dirname(os.path.dirname(
+                                          os.path.abspath(__file__)))))
+        self.assertEqual(out.decode().strip(), '')
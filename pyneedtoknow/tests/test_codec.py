@@ -0,0 +1,66 @@
+
+import json
+import unittest
+
+from ..bench import NullSession, overhead
+from ..bulk import batches
+from ..client import PgNeedToKnowClient
+from ..codec import JsonCodec, available_codecs, create_codec, default_codec
+
+
+class TestCodecs(unittest.TestCase):
+
+
+    def codecs(self):
+        return available_codecs()
+
+
+    def test_round_trip(self):
+        data = [{'name': u'åsa', 'age': 75, 'tags': [1.5, None, True]}]
+        for codec in self.codecs():
+            encoded = codec.dumps(data)
+            self.assertTrue(isinstance(encoded, bytes))
+            self.assertEqual(json.loads(encoded.decode('utf-8')), data)
+            self.assertEqual(codec.loads(encoded), data)
+            self.assertEqual(codec.loads(encoded.decode('utf-8')), data)
+
+
+    def test_default(self):
+        self.assertEqual(default_codec().name, 'json')
+        self.assertEqual(PgNeedToKnowClient().codec.name, 'json')
+        self.assertEqual(create_codec('json').name, 'json')
+        codec = JsonCodec()
+        self.assertTrue(create_codec(codec) is codec)
+        self.assertRaises(Exception, create_codec, 'yaml')
+        if len(self.codecs()) > 1:
+            self.assertEqual(PgNeedToKnowClient(codec='orjson').codec.name, 'orjson')
+
+
+    def test_bytes_batches(self):
+        rows = [{'i': i} for i in range(5)]
+        bodies = [b.body() for b in batches(rows, max_rows=2, encode=JsonCodec().dumps)]
+        self.assertEqual(bodies[0], b'[{"i":0},{"i":1}]')
+        self.assertEqual(sum(len(json.loads(b.decode('utf-8'))) for b in bodies), 5)
+
+
+class TestClientCodec(unittest.TestCase):
+
+
+    def test_json_and_templates(self):
+        session = NullSession(b'[{"row_id": 1}]')
+        calls = []
+        session.post = lambda url, **kwargs: calls.append((url, kwargs)) or session.resp
+        ntkc = PgNeedToKnowClient(session=session, codec=JsonCodec())
+        ntkc.user_register({'user_id': 'A', 'user_type': 'data_owner', 'user_metadata': {}})
+        ntkc.post_data({'age': 1}, 'token', '/t1')
+        ntkc.post_data({'age': 2}, 'token', '/t1')
+        self.assertEqual(calls[0][0], 'http://localhost:3000/rpc/user_register')
+        self.assertEqual(calls[1][1]['data'], b'{"age":1}')
+        self.assertTrue(calls[1][1]['headers'] is calls[2][1]['headers'])
+        self.assertEqual(calls[1][1]['headers']['Authorization'], 'Bearer token')
+        self.assertEqual(ntkc.json(ntkc.get_data('token', '/t1')), [{'row_id': 1}])
+
+
+    def test_overhead(self):
+        results = overhead(n=50, rows=10)
+        self.assertTrue(set(['before', 'json']) <= set(results))
@@ -0,0 +1,52 @@
+
+import json
+import unittest
+
+from ..client import PgNeedToKnowClient
+from ..compression import compress, compress_request, decompress
+from ..server import StandInServer
+
+T1 = {'table_name': 't1', 'columns': [{'name': 'payload', 'type': 'text'}],
+      'description': 'compressible'}
+
+
+class TestCompression(unittest.TestCase):
+
+
+    def test_round_trip(self):
+        body = json.dumps([{'payload': 'x' * 100}] * 100)
+        for encoding in ['gzip', 'deflate']:
+            compressed = compress(body, encoding, level=9)
+            self.assertTrue(len(compressed) < len(body) / 10)
+            self.assertEqual(decompress(compressed, encoding), body.encode('utf-8'))
+
+
+    def test_min_size(self):
+        kwargs = {'headers': {'Content-Type': 'application/json'}, 'data': '{}'}
+        self.assertTrue(compress_request(kwargs, min_size=10) is kwargs)
+        compressed = compress_request(kwargs, 'deflate', min_size=1)
+        self.assertEqual(compressed['headers']['Content-Encoding'], 'deflate')
+        self.assertTrue('Content-Encoding' not in kwargs['headers'])
+
+
+class TestClientCompression(unittest.TestCase):
+
+
+    def test_bytes_saved(self):
+        with StandInServer() as server:
+            with PgNeedToKnowClient(url=server.url, compression='gzip',
+                                    metrics=True) as ntkc:
+                admin = ntkc.token(token_type='admin')
+                ntkc.table_create({'definition': T1, 'type': 'mac'}, admin)
+                ntkc.user_register({'user_id': 'A', 'user_type': 'data_owner',
+                                    'user_metadata': {}})
+                owner = ntkc.token(user_id='A', token_type='owner')
+                rows = [{'payload': 'x' * 100} for i in range(100)]
+                result = ntkc.post_data_many(rows, owner, '/t1')
+                self.assertEqual(result.failed, 0)
+                self.assertEqual(len(json.loads(ntkc.get_data(owner, '/t1').text)), 100)
+                self.assertEqual(len(list(ntkc.stream_data(owner, '/t1', chunk_size=64))), 100)
+                metrics = ntkc.metrics.snapshot()
+                self.assertTrue(metrics['POST /t1']['bytes_out_saved'] > 10000)
+                self.assertTrue(metrics['get_data']['bytes_in_saved'] > 10000)
+                self.assertTrue(server.stats()['bytes_in'] < 2000)
@@ -0,0 +1,207 @@
+
+import threading
+import time
+import unittest
+
+from ..bulk import run_many
+from ..client import PgNeedToKnowClient
+from ..concurrency import AdaptiveLimiter, overloaded
+from ..plan import Step, run_graph
+
+
+class FakeResponse(object):
+
+    def __init__(self, status_code, text=''):
+        self.status_code = status_code
+        self.text = text
+
+
+class KneeServer(object):
+
+    """
+    Latency grows once more than knee requests are in flight,
+    and requests fail with 503 above twice that.
+    """
+
+    def __init__(self, knee, latency=0.002):
+        self.knee = knee
+        self.latency = latency
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+
+    def __call__(self, item):
+        with self.lock:
+            self.in_flight += 1
+            n = self.in_flight
+            self.max_in_flight = max(self.max_in_flight, n)
+        try:
+            if n > self.knee * 2:
+                return FakeResponse(503, 'overloaded')
+            time.sleep(self.latency * max(1.0, float(n) / self.knee))
+            return FakeResponse(200)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+
+class TestAdaptiveLimiter(unittest.TestCase):
+
+
+    def test_overloaded(self):
+        self.assertTrue(overloaded(503))
+        self.assertTrue(overloaded(429))
+        self.assertTrue(overloaded(None, error=True))
+        self.assertFalse(overloaded(409))
+        self.assertFalse(overloaded(200))
+        self.assertFalse(overloaded(None))
+
+
+    def test_increase_when_limit_is_used(self):
+        limiter = AdaptiveLimiter(initial=2, max_limit=4)
+        for i in range(40):
+            n = limiter.limit
+            for j in range(n):
+                limiter.acquire()
+            for j in range(n):
+                limiter.release(0.01)
+            if limiter.limit == 4:
+                break
+        self.assertEqual(limiter.limit, 4)
+        self.assertEqual([h['reason'] for h in limiter.history()],
+                         ['initial', 'increase', 'increase'])
+        # never above max_limit
+        for i in range(20):
+            for j in range(4):
+                limiter.acquire()
+            for j in range(4):
+                limiter.release(0.01)
+        self.assertEqual(limiter.limit, 4)
+        self.assertEqual(limiter.increases, 2)
+
+
+    def test_no_increase_when_idle(self):
+        limiter = AdaptiveLimiter(initial=4)
+        for i in range(50):
+            limiter.acquire()
+            limiter.release(0.01)
+        self.assertEqual(limiter.limit, 4)
+
+
+    def test_decrease_once_per_round_trip(self):
+        limiter = AdaptiveLimiter(initial=20, decrease=0.5)
+        for i in range(10):
+            limiter.acquire()
+        limiter.release(0.05)
+        for i in range(9):
+            limiter.release(0.05, 503)
+        self.assertEqual(limiter.limit, 10)
+        self.assertEqual(limiter.decreases, 1)
+        self.assertEqual(limiter.history()[-1]['reason'], 'error')
+        time.sleep(0.06)
+        limiter.acquire()
+        limiter.release(0.05, error=True)
+        self.assertEqual(limiter.limit, 5)
+
+
+    def test_decrease_on_latency(self):
+        limiter = AdaptiveLimiter(initial=10, decrease=0.5, smoothing=1.0)
+        limiter.acquire()
+        limiter.release(0.001)
+        limiter.acquire()
+        limiter.release(0.01)
+        self.assertEqual(limiter.limit, 5)
+        self.assertEqual(limiter.history()[-1]['reason'], 'latency')
+
+
+    def test_min_limit(self):
+        limiter = AdaptiveLimiter(initial=2, min_limit=2)
+        limiter.acquire()
+        limiter.release(0.0, 503)
+        self.assertEqual(limiter.limit, 2)
+        self.assertEqual(limiter.decreases, 0)
+
+
+    def test_slot(self):
+        limiter = AdaptiveLimiter(initial=10, decrease=0.5)
+        with limiter.slot() as slot:
+            self.assertEqual(limiter.in_flight, 1)
+            slot.status_code = 200
+        self.assertEqual(limiter.limit, 10)
+        with self.assertRaises(ValueError):
+            with limiter.slot():
+                raise ValueError('boom')
+        self.assertEqual(limiter.in_flight, 0)
+        self.assertEqual(limiter.limit, 5)
+        stats = limiter.stats()
+        self.assertEqual(stats['completed'], 2)
+        self.assertEqual(stats['decreases'], 1)
+
+
+    def test_try_acquire(self):
+        limiter = AdaptiveLimiter(initial=1, max_limit=1)
+        self.assertTrue(limiter.try_acquire())
+        self.assertFalse(limiter.try_acquire())
+        self.assertEqual(limiter.in_flight, 1)
+        limiter.release(0.01)
+        self.assertTrue(limiter.try_acquire())
+
+
+    def test_acquire_blocks_at_limit(self):
+        limiter = AdaptiveLimiter(initial=1, max_limit=1)
+        limiter.acquire()
+        acquired = []
+        thread = threading.Thread(target=lambda: acquired.append(limiter.acquire()))
+        thread.start()
+        time.sleep(0.02)
+        self.assertEqual(acquired, [])
+        limiter.release(0.01)
+        thread.join(1)
+        self.assertEqual(len(acquired), 1)
+
+
+class TestAdaptiveBulk(unittest.TestCase):
+
+
+    def test_run_many_finds_knee(self):
+        server = KneeServer(knee=8)
+        limiter = AdaptiveLimiter(initial=2, max_limit=64)
+        result = run_many(server, range(2000), limiter=limiter)
+        self.assertEqual(result.succeeded + result.failed, 2000)
+        self.assertTrue(limiter.increases > 0)
+        self.assertTrue(limiter.decreases > 0)
+        self.assertTrue(server.max_in_flight < 64)
+        # settles around the knee rather than at max_limit
+        recent = [h['limit'] for h in limiter.history()[-10:]]
+        self.assertTrue(max(recent) <= 32, recent)
+        self.assertEqual(limiter.in_flight, 0)
+
+
+    def test_run_graph(self):
+        limiter = AdaptiveLimiter(initial=2, max_limit=2)
+        server = KneeServer(knee=100)
+        steps = [Step('a%d' % i, [], lambda: server(None)) for i in range(10)]
+        steps.append(Step('b', ['a%d' % i for i in range(10)], lambda: server(None)))
+        result = run_graph(steps, max_workers=8, limiter=limiter)
+        self.assertEqual(result.succeeded, 11)
+        self.assertTrue(server.max_in_flight <= 2)
+        self.assertEqual(limiter.stats()['completed'], 11)
+
+
+    def test_client_shares_limiter(self):
+        from ..server import StandInServer
+        limiter = AdaptiveLimiter(initial=4, max_limit=16)
+        with StandInServer(latency=0.002, error_rate=0.2, seed=1) as server:
+            with PgNeedToKnowClient(url=server.url, concurrency=limiter) as c:
+                users = [{'user_id': str(i), 'user_type': 'data_owner',
+                          'user_metadata': {}} for i in range(100)]
+                result = c.user_register_many(users)
+                self.assertEqual(result.succeeded + result.failed, 100)
+                self.assertTrue(result.failed > 0)
+                self.assertTrue(limiter.decreases > 0)
+                self.assertEqual(limiter.stats()['completed'], 100)
+        with PgNeedToKnowClient(concurrency=True) as c:
+            self.assertTrue(isinstance(c.limiter, AdaptiveLimiter))
+        with PgNeedToKnowClient() as c:
+            self.assertEqual(c.limiter, None)
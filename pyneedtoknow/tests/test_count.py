@@ -0,0 +1,90 @@
+
+import unittest
+
+from ..client import PgNeedToKnowClient
+from ..query import Query
+from ..server import StandInServer
+from ..pagination import content_range_total
+from ..transport import create_session
+
+TABLE = {'table_name': 't1', 'description': 'people',
+         'columns': [{'name': 'age', 'type': 'int', 'description': 'a'}]}
+
+
+class NoCountSession(object):
+
+    """
+    Drops Prefer headers, like a server that does not count rows.
+    """
+
+    def __init__(self):
+        self.session = create_session('http.client')
+        self.requests = []
+
+    def _send(self, method, url, headers=None, **kwargs):
+        self.requests.append(url)
+        headers = dict((k, v) for k, v in (headers or {}).items() if k != 'Prefer')
+        return self.session.request(method, url, headers=headers, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self._send('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self._send('POST', url, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+class TestCount(unittest.TestCase):
+
+
+    def setUp(self):
+        self.server = StandInServer().start()
+        self.client = PgNeedToKnowClient(url=self.server.url)
+        self.admin = self.client.token(token_type='admin')
+        self.client.table_create({'definition': TABLE, 'type': 'mac'}, self.admin)
+        for user_id in ['A', 'B', 'C']:
+            self.client.user_register({'user_id': user_id, 'user_type': 'data_owner',
+                                       'user_metadata': {}})
+        self.owner = self.client.token(user_id='A', token_type='owner')
+        self.client.post_data_many([{'age': i} for i in range(50)], self.owner, '/t1')
+        self.client.group_create({'group_name': 'g1', 'group_metadata': {}}, self.admin)
+        self.client.group_add_members({'group_name': 'g1', 'add_all_owners': True}, self.admin)
+
+
+    def tearDown(self):
+        self.client.close()
+        self.server.stop()
+
+
+    def test_content_range_total(self):
+        self.assertEqual(content_range_total('0-24/3573'), 3573)
+        self.assertEqual(content_range_total('*/0'), 0)
+        self.assertEqual(content_range_total('0-24/*'), None)
+        self.assertEqual(content_range_total(None), None)
+
+
+    def test_counts(self):
+        self.assertEqual(self.client.count(self.owner, '/t1'), 50)
+        self.assertEqual(self.client.count(self.owner, Query('t1').gte('age', 40)), 10)
+        self.assertEqual(self.client.count(self.owner, '/t1?age=lt.5', count='planned'), 5)
+        self.assertEqual(self.client.count_user_registrations(self.admin), 3)
+        self.assertEqual(self.client.count_event_log('event_log_access_control', self.admin),
+                         len(self.client.json(self.client.get_event_log_access_control(self.admin))))
+        self.assertEqual(self.client.count_group_members({'group_name': 'g1'}, self.admin), 3)
+        self.assertRaises(Exception, self.client.count, self.owner, '/t1', count='roughly')
+        self.assertRaises(Exception, self.client.count, self.owner, '/t2')
+
+
+    def test_no_rows_are_downloaded(self):
+        before = self.server.stats()['bytes_out']
+        self.assertEqual(self.client.count(self.owner, '/t1'), 50)
+        self.assertTrue(self.server.stats()['bytes_out'] - before <= len('[]'))
+
+
+    def test_falls_back_to_streaming(self):
+        session = NoCountSession()
+        with PgNeedToKnowClient(url=self.server.url, session=session) as client:
+            self.assertEqual(client.count(self.owner, '/t1?age=gte.10'), 40)
+            self.assertEqual(len(session.requests), 2)
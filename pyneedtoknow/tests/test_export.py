@@ -0,0 +1,149 @@
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from ..client import PgNeedToKnowClient
+from ..export import numpy, pyarrow, to_columns
+from ..server import StandInServer
+
+TABLE = {'table_name': 't1', 'description': 'people',
+         'columns': [{'name': 'name', 'type': 'text', 'description': 'n'},
+                     {'name': 'age', 'type': 'int', 'description': 'a'},
+                     {'name': 'score', 'type': 'real', 'description': 's'},
+                     {'name': 'active', 'type': 'boolean', 'description': 'b'}]}
+
+ROWS = [{'row_id': 1, 'name': 'a', 'age': 30, 'score': 1.5, 'active': True, 'extra': {'k': 1}},
+        {'row_id': 2, 'name': None, 'age': None, 'score': 2, 'active': None, 'extra': None},
+        {'row_id': 3, 'name': u'\xe9', 'age': 41, 'score': None, 'active': False, 'extra': [1]}]
+
+TYPES = {'name': 'text', 'age': 'int', 'score': 'real', 'active': 'boolean'}
+
+
+class TestColumns(unittest.TestCase):
+
+
+    def test_buffers(self):
+        table = to_columns(ROWS, TYPES)
+        self.assertEqual(table.num_rows, 3)
+        self.assertEqual(table.names, ['row_id', 'name', 'age', 'score', 'active', 'extra'])
+        self.assertEqual([table[n].kind for n in table.names],
+                         ['int', 'string', 'int', 'float', 'bool', 'string'])
+        self.assertEqual(table['age'].values.tolist(), [30, 0, 41])
+        self.assertEqual(list(table['name'].strings()), ['a', None, u'\xe9'])
+        self.assertEqual(list(table['extra'].strings()), ['{"k": 1}', None, '[1]'])
+        self.assertEqual(table['age'].null_count, 1)
+
+
+    def test_inference_and_promotion(self):
+        table = to_columns([{'a': None, 'b': 1}, {'a': 1, 'b': 2.5, 'c': 'x'},
+                            {'a': 'x', 'b': None}])
+        self.assertEqual(table['a'].kind, 'string')
+        self.assertEqual(list(table['a'].strings()), [None, '1', 'x'])
+        self.assertEqual(table['b'].kind, 'float')
+        self.assertEqual(table['b'].values.tolist(), [1.0, 2.5, 0.0])
+        self.assertEqual(list(table['c'].strings()), [None, 'x', None])
+
+
+    def test_bool_and_int_inference(self):
+        table = to_columns([{'a': 1, 'b': True, 'c': True}, {'a': True, 'b': 2, 'c': 1.5}])
+        self.assertEqual(table['a'].kind, 'int')
+        self.assertEqual(table['a'].values.tolist(), [1, 1])
+        self.assertEqual(table['b'].kind, 'int')
+        self.assertEqual(table['b'].values.tolist(), [1, 2])
+        self.assertEqual(table['c'].kind, 'float')
+        self.assertEqual(table['c'].values.tolist(), [1.0, 1.5])
+
+
+    def test_declared_types_are_kept(self):
+        types = {'age': 'int', 'score': 'real', 'active': 'boolean', 'name': 'text'}
+        table = to_columns([{'age': True, 'score': 1, 'active': 1, 'name': 5},
+                            {'age': 2.0, 'score': 'NaN', 'active': 0, 'name': True}], types)
+        self.assertEqual([table[n].kind for n in ['age', 'score', 'active', 'name']],
+                         ['int', 'float', 'bool', 'string'])
+        self.assertEqual(table['age'].values.tolist(), [1, 2])
+        self.assertEqual(table['score'].values[0], 1.0)
+        self.assertTrue(table['score'].values[1] != table['score'].values[1])
+        self.assertEqual(table['active'].values.tolist(), [1, 0])
+        self.assertEqual(list(table['name'].strings()), ['5', 'true'])
+
+
+    def test_declared_type_mismatch(self):
+        for column_type, value in [('int', 'x'), ('int', 2.5), ('int', float('nan')),
+                                   ('real', 'x'), ('real', [1]), ('boolean', 2),
+                                   ('boolean', 'true')]:
+            with self.assertRaises(Exception) as e:
+                to_columns([{'a': value}], {'a': column_type})
+            self.assertTrue('Column a is' in str(e.exception), column_type)
+
+
+    @unittest.skipIf(numpy is None, 'numpy is not installed')
+    def test_numpy(self):
+        arrays = to_columns(ROWS, TYPES).to_numpy()
+        self.assertEqual(arrays['row_id'].dtype, numpy.int64)
+        self.assertEqual(arrays['age'].dtype, numpy.int64)
+        self.assertEqual(arrays['age'].mask.tolist(), [False, True, False])
+        self.assertEqual(arrays['active'].dtype, numpy.bool_)
+        self.assertEqual(arrays['name'].tolist(), ['a', None, u'\xe9'])
+
+
+    @unittest.skipIf(pyarrow is None, 'pyarrow is not installed')
+    def test_arrow(self):
+        arrow = to_columns(ROWS, TYPES).to_arrow()
+        self.assertEqual(str(arrow.schema.field('age').type), 'int64')
+        self.assertEqual(str(arrow.schema.field('active').type), 'bool')
+        rows = arrow.to_pylist()
+        self.assertEqual(rows[0]['extra'], '{"k": 1}')
+        self.assertEqual(rows[1], {'row_id': 2, 'name': None, 'age': None, 'score': 2.0,
+                                   'active': None, 'extra': None})
+        self.assertEqual(rows[2]['active'], False)
+
+
+class TestClientExport(unittest.TestCase):
+
+
+    def setUp(self):
+        self.server = StandInServer().start()
+        self.client = PgNeedToKnowClient(url=self.server.url)
+        self.admin = self.client.token(token_type='admin')
+        self.client.table_create({'definition': TABLE, 'type': 'mac'}, self.admin)
+        self.client.user_register({'user_id': 'A', 'user_type': 'data_owner',
+                                   'user_metadata': {}})
+        self.owner = self.client.token(user_id='A', token_type='owner')
+        self.client.post_data_many([{'name': 'n%d' % i, 'age': i, 'score': i / 2.0,
+                                     'active': i % 2 == 0} for i in range(100)],
+                                   self.owner, '/t1')
+        self.tmp = tempfile.mkdtemp()
+
+
+    def tearDown(self):
+        self.client.close()
+        self.server.stop()
+        shutil.rmtree(self.tmp)
+
+
+    def test_export_table(self):
+        table = self.client.export_table('t1', self.owner)
+        self.assertEqual(table.num_rows, 100)
+        self.assertEqual(table['age'].kind, 'int')
+        self.assertEqual(table['score'].kind, 'float')
+        self.assertEqual(table['row_owner'].kind, 'string')
+        self.assertEqual(sum(table['age'].values), sum(range(100)))
+        filtered = self.client.export_table('t1', self.owner, endpoint='/t1?age=lt.10')
+        self.assertEqual(filtered.num_rows, 10)
+
+
+    def test_export_event_log(self):
+        self.client.group_create({'group_name': 'g1', 'group_metadata': {}}, self.admin)
+        table = self.client.export_event_log('event_log_access_control', self.admin)
+        self.assertTrue(table.num_rows > 0)
+        self.assertEqual(table['id'].kind, 'int')
+
+
+    @unittest.skipIf(pyarrow is None, 'pyarrow is not installed')
+    def test_write_parquet(self):
+        from pyarrow import parquet
+        path = os.path.join(self.tmp, 't1.parquet')
+        self.client.export_table('t1', self.owner, path=path)
+        self.assertEqual(parquet.read_table(path).num_rows, 100)
@@ -0,0 +1,134 @@
+
+import threading
+import time
+import unittest
+
+from ..client import PgNeedToKnowClient
+from ..hedge import Hedger
+from ..server import StandInServer
+
+
+class SlowFirstCall(object):
+
+    def __init__(self, slow=0.5):
+        self.slow = slow
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, value):
+        with self.lock:
+            self.calls += 1
+            n = self.calls
+        if n == 1:
+            time.sleep(self.slow)
+        return (n, value)
+
+
+class TestHedger(unittest.TestCase):
+
+
+    def test_hedge_wins(self):
+        hedger = Hedger(delay=0.01, max_extra=1)
+        func = SlowFirstCall()
+        start = time.time()
+        self.assertEqual(hedger.call(func, 'x'), (2, 'x'))
+        self.assertTrue(time.time() - start < 0.4)
+        self.assertEqual(hedger.stats()['fired'], 1)
+        self.assertEqual(hedger.stats()['won'], 1)
+        hedger.close()
+
+
+    def test_hedges_take_limiter_slots(self):
+        from ..concurrency import AdaptiveLimiter
+        hedger = Hedger(delay=0.01, max_extra=1)
+        limiter = AdaptiveLimiter(initial=1, max_limit=1)
+        self.assertEqual(hedger.wrap(SlowFirstCall(), limiter)('x'), (2, 'x'))
+        self.assertEqual(limiter.stats()['completed'], 1)
+        self.assertEqual(limiter.in_flight, 0)
+        # no free slot, the call is not hedged
+        limiter.acquire()
+        self.assertEqual(hedger.wrap(SlowFirstCall(0.05), limiter)('y'), (1, 'y'))
+        limiter.release(0.01)
+        stats = hedger.stats()
+        self.assertEqual((stats['fired'], stats['limited']), (1, 1))
+        self.assertEqual(limiter.in_flight, 0)
+        hedger.close()
+
+
+    def test_extra_load_is_capped(self):
+        hedger = Hedger(delay=0.0, max_extra=0.1)
+        for i in range(20):
+            hedger.call(time.sleep, 0.002)
+        self.assertEqual(hedger.stats()['fired'], 2)
+        hedger.close()
+
+
+    def test_delay_follows_latencies(self):
+        hedger = Hedger(percentile=50, min_samples=10, max_extra=0)
+        for i in range(20):
+            hedger.call(time.sleep, 0.01)
+        self.assertTrue(0.01 <= hedger.delay() < 0.05)
+        hedger.close()
+
+
+    def test_no_hedges_when_backlogged(self):
+        hedger = Hedger(delay=0.0, max_extra=1, max_workers=1)
+        thread = threading.Thread(target=hedger.call, args=(time.sleep, 0.2))
+        thread.start()
+        time.sleep(0.05)
+        # all workers busy, runs in this thread
+        self.assertEqual(hedger.call(lambda: threading.current_thread()),
+                         threading.current_thread())
+        thread.join()
+        stats = hedger.stats()
+        self.assertEqual(stats['backlogged'], 1)
+        self.assertEqual(stats['fired'], 0)
+        hedger.close()
+
+
+    def test_delay_excludes_queue_time(self):
+        hedger = Hedger(delay=0.05, max_extra=1, max_workers=2)
+        latencies = []
+        def call():
+            start = time.time()
+            hedger.call(time.sleep, 0.02)
+            latencies.append(time.time() - start)
+        threads = [threading.Thread(target=call) for i in range(6)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        # every call took less than the delay once started
+        self.assertEqual(hedger.stats()['fired'], 0)
+        self.assertTrue(all(l < 0.02 * 6 for l in latencies))
+        hedger.close()
+
+
+class TestClientHedging(unittest.TestCase):
+
+
+    def test_shared_hedger_is_not_closed(self):
+        hedger = Hedger(delay=0.05)
+        with PgNeedToKnowClient(hedging=hedger):
+            pass
+        self.assertEqual(hedger.call(lambda: 1), 1)
+        hedger.close()
+        client = PgNeedToKnowClient(hedging=True)
+        client.close()
+        self.assertRaises(RuntimeError, client.hedger.call, lambda: 1)
+
+
+    def test_only_gets_are_hedged(self):
+        with StandInServer(tail_latency=0.3, tail_rate=0.3, seed=3) as server:
+            with PgNeedToKnowClient(url=server.url,
+                                    hedging=Hedger(delay=0.05, max_extra=1)) as ntkc:
+                admin = ntkc.token(token_type='admin')
+                for i in range(10):
+                    ntkc.user_register({'user_id': str(i), 'user_type': 'data_owner',
+                                        'user_metadata': {}})
+                self.assertEqual(server.stats()['requests'], ntkc.hedging_stats()['fired'] + 11)
+                start = time.time()
+                for i in range(10):
+                    self.assertEqual(ntkc.get_groups(admin).status_code, 200)
+                self.assertTrue(time.time() - start < 1.0)
+                self.assertTrue(ntkc.hedging_stats()['won'] > 0)
@@ -0,0 +1,141 @@
+
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from ..client import PgNeedToKnowClient
+from ..ingest import RecordReader, coercer
+from ..server import StandInServer
+
+TABLE = {'table_name': 't1', 'description': 'people',
+         'columns': [{'name': 'name', 'type': 'text', 'description': 'n'},
+                     {'name': 'age', 'type': 'int', 'description': 'a'},
+                     {'name': 'score', 'type': 'double precision', 'description': 's'},
+                     {'name': 'active', 'type': 'boolean', 'description': 'b'}]}
+
+
+class Crash(Exception):
+    pass
+
+
+class TestReading(unittest.TestCase):
+
+
+    def test_coercer(self):
+        coerce = coercer({'name': 'text', 'age': 'int', 'score': 'numeric(5)',
+                          'active': 'boolean', 'tags': 'jsonb'})
+        row = coerce({'name': '', 'age': '42', 'active': 'f', 'tags': '["a"]',
+                      'score': '1.5'})
+        self.assertEqual(row, {'name': '', 'age': 42, 'active': False,
+                               'tags': ['a'], 'score': '1.5'})
+        self.assertEqual(coerce({'age': ' '})['age'], None)
+        self.assertEqual(coerce({'age': 7})['age'], 7)
+        self.assertRaises(ValueError, coerce, {'age': 'old'})
+
+
+    def test_coercer_blanks(self):
+        coerce = coercer({'d': 'date', 'n': 'numeric(10, 2)', 'ts': 'timestamp with time zone',
+                          'u': 'uuid', 'name': 'character varying(20)', 'c': 'char(1)'})
+        row = coerce({'d': '', 'n': ' ', 'ts': '', 'u': '', 'name': '', 'c': ' '})
+        self.assertEqual(row, {'d': None, 'n': None, 'ts': None, 'u': None,
+                               'name': '', 'c': ' '})
+        row = coerce({'d': '2020-01-01', 'n': '1.50', 'ts': '2020-01-01T00:00:00Z'})
+        self.assertEqual(row, {'d': '2020-01-01', 'n': '1.50', 'ts': '2020-01-01T00:00:00Z'})
+
+
+    def test_csv_offsets_resume(self):
+        data = b'\xef\xbb\xbfowner,name\nA,"two\nlines"\nB,b\n\nC,c\n'
+        reader = RecordReader(io.BytesIO(data), 'csv')
+        rows = iter(reader)
+        self.assertEqual(next(rows), {'owner': 'A', 'name': 'two\nlines'})
+        offset, fieldnames = reader.offset, reader.fieldnames
+        resumed = RecordReader(io.BytesIO(data), 'csv', offset, fieldnames)
+        self.assertEqual([r['owner'] for r in resumed], ['B', 'C'])
+        self.assertEqual(resumed.offset, len(data))
+
+
+    def test_ndjson(self):
+        data = b'{"owner": "A", "age": 1}\n\n{"owner": "B", "age": 2}\n'
+        reader = RecordReader(io.BytesIO(data), 'ndjson')
+        self.assertEqual([r['age'] for r in reader], [1, 2])
+
+
+class TestIngest(unittest.TestCase):
+
+
+    def setUp(self):
+        self.server = StandInServer().start()
+        self.client = PgNeedToKnowClient(url=self.server.url)
+        self.admin = self.client.token(token_type='admin')
+        self.client.table_create({'definition': TABLE, 'type': 'mac'}, self.admin)
+        self.owners = ['A', 'B', 'C']
+        for owner in self.owners:
+            self.client.user_register({'user_id': owner, 'user_type': 'data_owner',
+                                       'user_metadata': {}})
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'rows.csv')
+        with open(self.path, 'w') as f:
+            f.write('owner,name,age,score,active\n')
+            for i in range(30):
+                f.write('%s,name%d,%d,%d.5,%s\n' % (self.owners[i % 3], i, i, i, i % 2 == 0))
+            f.write('A,bad,old,1,true\n')
+            f.write(',nobody,1,1,true\n')
+
+
+    def tearDown(self):
+        self.client.close()
+        self.server.stop()
+        shutil.rmtree(self.tmp)
+
+
+    def rows(self, owner):
+        token = self.client.token(user_id=owner, token_type='owner')
+        return self.client.json(self.client.get_data(token, '/t1'))
+
+
+    def test_ingest_coerces_and_groups_by_owner(self):
+        rejects = os.path.join(self.tmp, 'rejects.ndjson')
+        result = self.client.ingest(self.path, 't1', self.admin, segment_rows=8,
+                                    batch_size=2, max_workers=4, rejects=rejects)
+        self.assertEqual(result.rows_read, 32)
+        self.assertEqual(result.rows_sent, 30)
+        self.assertEqual(result.rows_invalid, 2)
+        self.assertEqual(result.rows_failed, 0)
+        # table metadata, then one token per owner, however many segments they appear in
+        self.assertEqual(self.server.stats()['requests'], 5 + 1 + 3 + result.batches)
+        rows = self.rows('A')
+        self.assertEqual(len(rows), 10)
+        self.assertTrue(all(isinstance(r['age'], int) for r in rows))
+        self.assertTrue(all(isinstance(r['active'], bool) for r in rows))
+        self.assertTrue(0.5 in [r['score'] for r in rows])
+        with open(rejects) as f:
+            self.assertEqual([json.loads(l)['name'] for l in f], ['bad', 'nobody'])
+
+
+    def test_resume_after_crash(self):
+        checkpoints = os.path.join(self.tmp, 'checkpoints.json')
+        segments = []
+        def crash(summary):
+            segments.append(summary)
+            if len(segments) == 2:
+                raise Crash()
+        self.assertRaises(Crash, self.client.ingest, self.path, 't1', self.admin,
+                          segment_rows=10, checkpoints=checkpoints, progress=crash)
+        self.assertEqual(segments[-1]['rows_read'], 20)
+        result = self.client.ingest(self.path, 't1', self.admin, segment_rows=10,
+                                    checkpoints=checkpoints)
+        self.assertEqual(result.rows_read, 32)
+        self.assertEqual(result.resumed_from, segments[-1]['offset'])
+        self.assertEqual(sum(len(self.rows(o)) for o in self.owners), 30)
+        again = self.client.ingest(self.path, 't1', self.admin, checkpoints=checkpoints)
+        self.assertEqual(again.rows_read, 32)
+        self.assertEqual(sum(len(self.rows(o)) for o in self.owners), 30)
+
+
+    def test_failed_batches(self):
+        result = self.client.ingest(self.path, 't1', self.admin, endpoint='/t2')
+        self.assertEqual(result.rows_failed, 30)
+        self.assertEqual(len(result.failures), 3)
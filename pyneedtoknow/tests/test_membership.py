@@ -0,0 +1,149 @@
+
+import json
+import unittest
+
+from ..membership import current_members, naive_calls, plan_group_sync, sync_group_members
+
+
+class FakeResponse(object):
+
+    def __init__(self, status_code=200, text='[]'):
+        self.status_code = status_code
+        self.text = text
+
+
+class FakeClient(object):
+
+    def __init__(self, members, registrations=None):
+        self.members = members
+        self.registrations = registrations or []
+        self.calls = []
+        self.invalidated = []
+
+    def _invalidate(self, *tags):
+        self.invalidated.extend(tags)
+
+    def get_user_registrations(self, token):
+        self.calls.append(('registrations', None))
+        return FakeResponse(text=json.dumps(self.registrations))
+
+    def _assert_keys_present(self, required_keys, existing_keys):
+        for k in required_keys:
+            assert k in existing_keys
+
+    def json(self, resp):
+        return json.loads(resp.text)
+
+    def group_list_members(self, data, token):
+        self.calls.append(('list', data))
+        return FakeResponse(text=json.dumps([{'group_name': data['group_name'], 'user_name': m}
+                                             for m in self.members]))
+
+    def group_add_members(self, data, token):
+        self.calls.append(('add', data))
+        return FakeResponse()
+
+    def group_remove_members(self, data, token):
+        self.calls.append(('remove', data))
+        return FakeResponse()
+
+
+class TestGroupSync(unittest.TestCase):
+
+
+    def test_current_members(self):
+        rows = [{'user_name': 'owner_A'}, {'user_name': 'user_X'}, {'user_name': 'owner_user_B'}]
+        self.assertEqual(current_members(rows), ({'A', 'user_B'}, {'X'}))
+
+
+    def test_only_differences(self):
+        client = FakeClient(['owner_A', 'owner_B', 'user_X'])
+        result = sync_group_members(client, {'group_name': 'group1',
+                                             'data_owners': ['A', 'C', 'D'],
+                                             'data_users': ['X', 'Y']}, 'token')
+        self.assertEqual(client.calls[1:], [
+            ('remove', {'group_name': 'group1', 'members': {'memberships': {'data_owners': ['B']}}}),
+            ('add', {'group_name': 'group1', 'members': {'memberships': {'data_owners': ['C', 'D'],
+                                                                        'data_users': ['Y']}}})])
+        self.assertEqual(result['added'], {'data_owners': ['C', 'D'], 'data_users': ['Y']})
+        # remove_all and one batched add would have been one call less
+        self.assertEqual(result['calls'], 3)
+        self.assertEqual(result['naive_calls'], 2)
+        self.assertEqual(result['calls_saved'], -1)
+        self.assertEqual(client.invalidated, ['group_members:group1'])
+
+
+    def test_naive_calls(self):
+        self.assertEqual(naive_calls([str(i) for i in range(5)], ['u1', 'u2'], 3), 4)
+        self.assertEqual(naive_calls('all', ['u1'], 1000), 3)
+        self.assertEqual(naive_calls('all', 'all'), 2)
+        self.assertEqual(naive_calls([], []), 1)
+
+
+    def test_use_registrations(self):
+        def registration(name, metadata):
+            return {'user_name': name, 'user_metadata': metadata}
+        owners = [registration('owner_%d' % i, {'country': 'NO' if i < 6 else 'SE'})
+                  for i in range(8)]
+        users = [registration('user_X', {'country': 'NO'}),
+                 registration('user_Y', {'country': 'DK'})]
+        client = FakeClient(['owner_7'], owners + users)
+        result = sync_group_members(client, {'group_name': 'group1',
+                                             'data_owners': [str(i) for i in range(6)] + ['7'],
+                                             'data_users': ['X']},
+                                    'token', batch_size=2, use_registrations=True)
+        # the NO owners and user X by metadata, instead of 4 batches
+        self.assertEqual(client.calls[1:], [
+            ('registrations', None),
+            ('add', {'group_name': 'group1', 'metadata': {'key': 'country', 'value': 'NO'}})])
+        self.assertEqual(result['added'], {'data_owners': [str(i) for i in range(6)],
+                                           'data_users': ['X']})
+        self.assertEqual(result['calls'], 3)
+        self.assertEqual(result['naive_calls'], 5)
+        # all registered owners wanted
+        client = FakeClient([], owners + users)
+        sync_group_members(client, {'group_name': 'group1',
+                                    'data_owners': [str(i) for i in range(8)]},
+                           'token', use_registrations=True)
+        self.assertEqual(client.calls[-1], ('add', {'group_name': 'group1',
+                                                    'add_all_owners': True}))
+
+
+    def test_in_sync(self):
+        client = FakeClient(['owner_A', 'user_X'])
+        result = sync_group_members(client, {'group_name': 'group1', 'data_owners': ['A'],
+                                             'data_users': ['X']}, 'token')
+        self.assertEqual(len(client.calls), 1)
+        self.assertEqual(result['calls'], 1)
+
+
+    def test_remove_all_and_add_all(self):
+        plan = plan_group_sync('group1', ({'A'}, {'X'}), 'all', [])
+        self.assertEqual(plan['calls'], [
+            ('remove', {'group_name': 'group1', 'members': {'memberships': {'data_users': ['X']}}}),
+            ('add', {'group_name': 'group1', 'add_all_owners': True})])
+        plan = plan_group_sync('group1', ({'A'}, {'X'}), ['B'], [])
+        self.assertEqual(plan['calls'][0], ('remove', {'group_name': 'group1', 'remove_all': True}))
+
+
+    def test_report_add_all(self):
+        client = FakeClient(['owner_A'])
+        result = sync_group_members(client, {'group_name': 'group1', 'data_owners': 'all',
+                                             'data_users': 'all'}, 'token', dry_run=True)
+        self.assertEqual(result['added'], {'data_owners': 'all', 'data_users': 'all'})
+        self.assertEqual(len(client.calls), 1)
+        registrations = [{'user_name': n, 'user_metadata': {}}
+                         for n in ['owner_A', 'owner_B', 'user_X']]
+        client = FakeClient(['owner_A'], registrations)
+        result = sync_group_members(client, {'group_name': 'group1', 'data_owners': 'all'},
+                                    'token', use_registrations=True)
+        self.assertEqual(result['added'], {'data_owners': ['B'], 'data_users': []})
+        self.assertEqual(client.calls[-1], ('add', {'group_name': 'group1',
+                                                    'add_all_owners': True}))
+
+
+    def test_batches(self):
+        plan = plan_group_sync('group1', (set(), set()), [str(i) for i in range(5)],
+                               ['u1', 'u2'], batch_size=3)
+        sizes = [sum(len(v) for v in c[1]['members']['memberships'].values()) for c in plan['calls']]
+        self.assertEqual(sizes, [3, 3, 1])
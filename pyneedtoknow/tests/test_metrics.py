@@ -0,0 +1,66 @@
+
+import unittest
+
+from ..client import PgNeedToKnowClient
+from ..metrics import Histogram, MetricsRegistry, RequestEvent
+from ..server import StandInServer
+
+
+class TestHistogram(unittest.TestCase):
+
+
+    def test_quantile(self):
+        h = Histogram(buckets=(0.01, 0.1, 1.0))
+        for value in [0.005] * 90 + [0.05] * 9 + [5.0]:
+            h.observe(value)
+        self.assertEqual(h.quantile(0.5), 0.01)
+        self.assertEqual(h.quantile(0.95), 0.1)
+        self.assertEqual(h.quantile(1.0), None)
+        self.assertEqual(h.counts, [90, 9, 0, 1])
+
+
+class TestClientMetrics(unittest.TestCase):
+
+
+    def setUp(self):
+        self.server = StandInServer().start()
+        self.events = []
+        self.ntkc = PgNeedToKnowClient(url=self.server.url, metrics=True,
+                                       hooks=[self.events.append])
+
+
+    def tearDown(self):
+        self.ntkc.close()
+        self.server.stop()
+
+
+    def test_operations(self):
+        admin = self.ntkc.token(token_type='admin')
+        self.ntkc.user_register({'user_id': 'A', 'user_type': 'data_owner', 'user_metadata': {}})
+        self.ntkc.user_register({'user_id': 'A', 'user_type': 'data_owner', 'user_metadata': {}})
+        self.ntkc.get_event_log_data_access(admin)
+        self.ntkc.user_register_many([{'user_id': 'B', 'user_type': 'data_owner',
+                                       'user_metadata': {}}])
+        snapshot = self.ntkc.metrics.snapshot()
+        self.assertEqual(sorted(snapshot), ['get_event_log_data_access', 'token', 'user_register'])
+        self.assertEqual(snapshot['user_register']['statuses'], {200: 2, 409: 1})
+        self.assertTrue(snapshot['user_register']['bytes_out'] > 0)
+        self.assertTrue(snapshot['token']['bytes_in'] > 0)
+        self.assertEqual(len(self.events), 5)
+        text = self.ntkc.metrics.export_text()
+        self.assertTrue('pyneedtoknow_requests_total{operation="user_register",status="409"} 1' in text)
+        self.assertTrue('pyneedtoknow_request_duration_seconds_count{operation="token"} 1' in text)
+
+
+    def test_remove_hook(self):
+        self.ntkc.remove_hook(self.events.append)
+        self.ntkc.remove_hook(self.ntkc.metrics)
+        self.ntkc.token(token_type='admin')
+        self.assertEqual(self.events, [])
+        self.assertEqual(self.ntkc.metrics.snapshot(), {})
+
+
+    def test_errors(self):
+        registry = MetricsRegistry()
+        registry(RequestEvent('get_data', 'GET', '/t1', None, 0.1, 0, 0, IOError()))
+        self.assertEqual(registry.snapshot()['get_data']['errors'], 1)
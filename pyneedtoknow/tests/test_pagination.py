@@ -0,0 +1,111 @@
+
+import json
+import random
+import time
+import unittest
+
+try:
+    from urllib.parse import parse_qsl, urlsplit
+except ImportError:
+    from urlparse import parse_qsl, urlsplit
+
+from ..client import PgNeedToKnowClient
+from ..pagination import page_endpoint, paginate
+from ..server import query_rows
+from ..transport import Response
+
+ROWS = [{'id': i, 'name': 'row%d' % i} for i in range(1, 26)]
+
+
+def fake_fetch(calls):
+    def fetch(endpoint):
+        calls.append(endpoint)
+        params = dict(parse_qsl(urlsplit(endpoint).query))
+        rows = ROWS
+        if 'id' in params:
+            rows = [r for r in rows if r['id'] > int(params['id'].split('.')[1])]
+        offset = int(params.get('offset', 0))
+        return rows[offset:offset + int(params['limit'])]
+    return fetch
+
+
+class TestPagination(unittest.TestCase):
+
+
+    def test_page_endpoint(self):
+        self.assertEqual(page_endpoint('/t1', 10), '/t1?limit=10')
+        self.assertEqual(page_endpoint('/t1?age=gt.1', 10, offset=20, order='age.desc'),
+                         '/t1?age=gt.1&order=age.desc&limit=10&offset=20')
+        self.assertEqual(page_endpoint('/t1', 10, keyset='id', after=5),
+                         '/t1?order=id.asc&id=gt.5&limit=10')
+
+
+    def test_offset_pages(self):
+        calls = []
+        rows = list(paginate(fake_fetch(calls), '/t1', page_size=10, order='id'))
+        self.assertEqual(rows, ROWS)
+        self.assertEqual(len(calls), 3)
+
+
+    def test_keyset_pages(self):
+        calls = []
+        rows = list(paginate(fake_fetch(calls), '/t1', page_size=5, keyset='id'))
+        self.assertEqual(rows, ROWS)
+        # the last, empty, page confirms the end
+        self.assertEqual(len(calls), 6)
+        self.assertTrue(calls[-1].endswith('id=gt.25&limit=5'))
+
+
+    def test_prefetch(self):
+        calls = []
+        pages = paginate(fake_fetch(calls), '/t1', page_size=10, prefetch=True)
+        self.assertEqual(next(pages), ROWS[0])
+        # the second page is requested before the first is consumed
+        for i in range(100):
+            if len(calls) == 2:
+                break
+            time.sleep(0.01)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(list(pages), ROWS[1:])
+
+
+class ShuffledTiesSession(object):
+
+    """
+    Returns rows with equal sort keys in a different order on every
+    request, as Postgres may.
+    """
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.random = random.Random(1)
+
+    def get(self, url, headers=None, **kwargs):
+        rows = list(self.rows)
+        self.random.shuffle(rows)
+        page, _, _ = query_rows(rows, parse_qsl(urlsplit(url).query), headers or {})
+        return Response(200, {'Content-Type': 'application/json'},
+                        json.dumps(page).encode('utf-8'))
+
+    def close(self):
+        pass
+
+
+class TestTiedRows(unittest.TestCase):
+
+
+    def test_event_log_pages_with_tied_timestamps(self):
+        # every row of one read shares its request_time
+        rows = [{'request_time': '2020-01-0%dT00:00:00' % (i // 10 + 1), 'row_id': i,
+                 'data_user': 'user_X', 'data_owner': 'owner_A'} for i in range(30)]
+        c = PgNeedToKnowClient(session=ShuffledTiesSession(rows))
+        paged = list(c.iter_event_log_data_access('token', page_size=4))
+        self.assertEqual(sorted(r['row_id'] for r in paged), list(range(30)))
+
+
+    def test_registrations_with_tied_dates(self):
+        rows = [{'registration_date': '2020-01-01', 'user_name': 'owner_%02d' % i,
+                 'user_type': 'data_owner'} for i in range(20)]
+        c = PgNeedToKnowClient(session=ShuffledTiesSession(rows))
+        paged = list(c.iter_user_registrations('token', page_size=3))
+        self.assertEqual([r['user_name'] for r in paged], sorted(r['user_name'] for r in rows))
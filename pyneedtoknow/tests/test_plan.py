@@ -0,0 +1,132 @@
+
+import threading
+import time
+import unittest
+
+from ..plan import AccessPlan, Step, graph_depth, run_graph
+
+
+class FakeResponse(object):
+
+    def __init__(self, status_code=200, text=''):
+        self.status_code = status_code
+        self.text = text
+
+
+class FakeClient(object):
+
+    def __init__(self, fail=()):
+        self.lock = threading.Lock()
+        self.done = []
+        self.fail = fail
+
+    def _call(self, name):
+        time.sleep(0.01)
+        with self.lock:
+            self.done.append(name)
+        return FakeResponse(500 if name in self.fail else 200)
+
+    def table_create(self, data, token):
+        return self._call('table:' + data['definition']['table_name'])
+
+    def user_register(self, data):
+        return self._call(data['user_type'] + ':' + data['user_id'])
+
+    def group_create(self, data, token):
+        return self._call('group:' + data['group_name'])
+
+    def group_add_members(self, data, token):
+        return self._call('members:' + data['group_name'])
+
+    def table_group_access_grant(self, data, token):
+        return self._call('grant:%(table_name)s:%(group_name)s' % data)
+
+
+def readme_plan():
+    return AccessPlan(
+        tables=[{'table_name': 't1', 'columns': []}, {'table_name': 't2', 'columns': []}],
+        data_owners=['A', 'B', 'C', 'D', 'E', 'F'],
+        data_users=['X', 'Y', 'Z'],
+        groups={'group1': {'data_users': ['X', 'Y'], 'data_owners': ['A', 'B', 'C', 'D']},
+                'group2': {'data_users': ['Z'], 'all_owners': True}},
+        grants=[('t1', 'group1', 'select'), ('t1', 'group2', 'select'),
+                ('t2', 'group2', 'select')])
+
+
+class TestAccessPlan(unittest.TestCase):
+
+
+    def test_apply_in_dependency_order(self):
+        client = FakeClient()
+        result = readme_plan().apply(client, 'token', max_workers=32)
+        self.assertEqual(result.failed, 0)
+        self.assertEqual(len(result.steps), 19)
+        self.assertEqual(result.depth, 2)
+        done = client.done
+        for grant, table, group in [('grant:t1:group1', 'table:t1', 'group:group1'),
+                                    ('grant:t2:group2', 'table:t2', 'group:group2')]:
+            self.assertTrue(done.index(grant) > done.index(table))
+            self.assertTrue(done.index(grant) > done.index(group))
+        # 19 steps of 10ms, in two levels
+        self.assertTrue(result.elapsed < 0.15)
+
+
+    def test_failed_dependency_skips_dependents(self):
+        client = FakeClient(fail=['group:group2'])
+        result = readme_plan().apply(client, 'token')
+        skipped = sorted(s.name for s in result.steps if s.skipped)
+        self.assertEqual(skipped, ['all_owners:group2', 'grant:t1:group2:select',
+                                   'grant:t2:group2:select', 'members:group2'])
+        self.assertEqual(result.failed, 1)
+
+
+    def test_apply_twice(self):
+        from ..client import PgNeedToKnowClient
+        from ..server import StandInServer
+        plan = AccessPlan(
+            tables=[{'table_name': 't1', 'description': 'people',
+                     'columns': [{'name': 'age', 'type': 'int', 'description': 'a'}]}],
+            data_owners=['A', 'B'], data_users=['X'],
+            groups={'g1': {'data_owners': ['A'], 'data_users': ['X']},
+                    'g2': {'all_owners': True}},
+            grants=[('t1', 'g1', 'select')])
+        def state(c, admin):
+            return [sorted(m['user_name'] for m in c.json(
+                        c.group_list_members({'group_name': g}, admin))) for g in ['g1', 'g2']]
+        with StandInServer() as server:
+            with PgNeedToKnowClient(url=server.url) as c:
+                admin = c.token(token_type='admin')
+                # owner A exists before the plan is first applied
+                c.user_register({'user_id': 'A', 'user_type': 'data_owner',
+                                 'user_metadata': {}})
+                first = plan.apply(c, admin)
+                self.assertEqual((first.failed, first.skipped), (0, 0))
+                expected = [['owner_A', 'user_X'], ['owner_A', 'owner_B']]
+                self.assertEqual(state(c, admin), expected)
+                second = plan.apply(c, admin)
+                self.assertEqual((second.failed, second.skipped), (0, 0))
+                self.assertEqual(dict((s.name, s.status_code) for s in second.steps)['group:g1'],
+                                 409)
+                self.assertEqual(state(c, admin), expected)
+
+
+    def test_grant_to_existing_group_and_table(self):
+        plan = AccessPlan(tables=[{'table_name': 't1', 'columns': []}],
+                          grants=[('t1', 'existing', 'select'), ('t0', 'existing', 'select')])
+        steps = dict((s.name, s.deps) for s in plan.steps(FakeClient(), 'token'))
+        self.assertEqual(steps['grant:t1:existing:select'], ['table:t1'])
+        self.assertEqual(steps['grant:t0:existing:select'], [])
+        result = plan.apply(FakeClient(), 'token')
+        self.assertEqual(result.succeeded, 3)
+
+
+    def test_result_without_status_code_fails(self):
+        result = run_graph([Step('a', [], lambda: None), Step('b', ['a'], lambda: None)])
+        self.assertEqual(result.failed, 1)
+        self.assertEqual(result.skipped, 1)
+
+
+    def test_cycle(self):
+        steps = [Step('a', ['b'], None), Step('b', ['a'], None)]
+        self.assertRaises(Exception, graph_depth, steps)
+        self.assertRaises(Exception, run_graph, steps)
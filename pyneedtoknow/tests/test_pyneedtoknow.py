@@ -71,13 +71,17 @@ class TestNtkHttpApi(unittest.TestCase):
     # eventually into own class
 
     def register_many(self, n, user_type):
-        for i in range(n):
-            self.ntkc.user_register({'user_id': str(i), 'user_type': user_type, 'user_metadata': {}})
+        users = ({'user_id': str(i), 'user_type': user_type, 'user_metadata': {}} for i in range(n))
+        result = self.ntkc.user_register_many(users)
+        self.assertEqual(result.failed, 0)
+        self.assertEqual(result.succeeded, n)
 
 
     def delete_many(self, n, user_type, token):
-        for i in range(n):
-            self.ntkc.user_delete({'user_id': str(i), 'user_type': user_type}, token)
+        users = ({'user_id': str(i), 'user_type': user_type} for i in range(n))
+        result = self.ntkc.user_delete_many(users, token)
+        self.assertEqual(result.failed, 0)
+        self.assertEqual(result.succeeded, n)
 
 
     def test_A_user_register(self):
@@ -318,6 +322,15 @@ class TestNtkHttpApi(unittest.TestCase):
             self.assertTrue(len(json.loads(resp.text)) > 0)
 
 
+    def test_P_connection_reuse(self):
+        before = self.ntkc.connection_stats()
+        for i in range(5):
+            self.ntkc.token(token_type='admin')
+        after = self.ntkc.connection_stats()
+        self.assertEqual(after['requests'] - before['requests'], 5)
+        self.assertTrue(after['reused_connections'] - before['reused_connections'] >= 4)
+
+
     def test_Y_group_delete(self):
         token = self.ntkc.token(token_type='admin')
         resp1 = self.ntkc.group_delete({'group_name': 'group1'}, token)
@@ -377,6 +390,7 @@ def main(correctness, scalability, url):
         'test_M_get_user_registrations',
         'test_N_get_groups',
         'test_O_event_log_tables',
+        'test_P_connection_reuse',
         'test_Y_group_delete',
         'test_Z_user_delete',
     ]
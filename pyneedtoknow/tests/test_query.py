@@ -0,0 +1,70 @@
+
+import datetime
+import unittest
+
+from ..client import PgNeedToKnowClient
+from ..query import Query
+from ..server import StandInServer
+
+TABLE = {'table_name': 't1', 'description': 'people',
+         'columns': [{'name': 'name', 'type': 'text', 'description': 'n'},
+                     {'name': 'age', 'type': 'int', 'description': 'a'},
+                     {'name': 'country', 'type': 'text', 'description': 'c'}]}
+
+
+class TestQuery(unittest.TestCase):
+
+
+    def test_path(self):
+        q = (Query('t1').select('name', 'age').gte('age', 18)
+             .in_('country', ['NO', 'a,b', 'say "hi"']).is_('name', None)
+             .order('age', desc=True, nulls='last').order('name').limit(10).offset(20))
+        self.assertEqual(q.path(), '/t1?select=name,age&age=gte.18'
+                         '&country=in.(NO,%22a,b%22,%22say%20%5C%22hi%5C%22%22)'
+                         '&name=is.null&order=age.desc.nullslast,name.asc&limit=10&offset=20')
+        self.assertEqual(str(Query('/t1')), '/t1')
+
+
+    def test_values_are_encoded(self):
+        q = Query('t1').eq('name', 'a&b=c').like('country', 'N*').neq('age', True)
+        self.assertEqual(q.path(), '/t1?name=eq.a%26b%3Dc&country=like.N*&age=neq.true')
+        q = Query('t1').filter('age', 'eq', 3, negate=True).lt('name', datetime.date(2020, 1, 2))
+        self.assertEqual(q.path(), '/t1?age=not.eq.3&name=lt.2020-01-02')
+
+
+    def test_immutable(self):
+        base = Query('t1').select('name')
+        adults = base.gte('age', 18)
+        self.assertEqual(base.path(), '/t1?select=name')
+        self.assertEqual(adults.path(), '/t1?select=name&age=gte.18')
+
+
+    def test_invalid(self):
+        self.assertRaises(Exception, Query('t1').filter, 'age', 'between', 1)
+        self.assertRaises(Exception, Query('t1').in_, 'age', 'abc')
+        self.assertRaises(Exception, Query('t1').is_, 'age', 3)
+        self.assertRaises(Exception, Query('t1').eq, 'age', None)
+
+
+class TestClientQuery(unittest.TestCase):
+
+
+    def test_get_and_patch(self):
+        with StandInServer() as server:
+            with PgNeedToKnowClient(url=server.url) as c:
+                admin = c.token(token_type='admin')
+                c.table_create({'definition': TABLE, 'type': 'mac'}, admin)
+                c.user_register({'user_id': 'A', 'user_type': 'data_owner',
+                                 'user_metadata': {}})
+                token = c.token(user_id='A', token_type='owner')
+                c.post_data_many([{'name': 'n%d' % i, 'age': i, 'country': ['NO', 'SE', 'DK'][i % 3]}
+                                  for i in range(30)], token, '/t1')
+                q = Query('t1').select('name', 'age').gte('age', 10).in_('country', ['NO', 'SE'])
+                rows = c.json(c.get_data(token, q.order('age', desc=True).limit(3)))
+                self.assertEqual(rows, [{'name': 'n28', 'age': 28}, {'name': 'n27', 'age': 27},
+                                        {'name': 'n25', 'age': 25}])
+                self.assertEqual(len(list(c.iter_data(token, q, page_size=4, order='age'))), 13)
+                self.assertEqual(c.patch_data({'country': 'FI'}, token,
+                                              Query('t1').lt('age', 5)).status_code, 204)
+                rows = c.json(c.get_data(token, Query('t1').select('country').eq('country', 'FI')))
+                self.assertEqual(len(rows), 5)
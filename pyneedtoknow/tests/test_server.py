@@ -0,0 +1,92 @@
+
+import json
+import time
+import unittest
+
+from ..client import PgNeedToKnowClient
+from ..server import StandInServer, query_rows
+
+T1 = {'table_name': 't1',
+      'columns': [{'name': 'name', 'type': 'text'}, {'name': 'age', 'type': 'int'}],
+      'description': 'people'}
+
+
+class TestQueryRows(unittest.TestCase):
+
+
+    def test_filter_order_page_select(self):
+        rows = [{'id': i, 'name': n} for i, n in enumerate('abcde')]
+        params = [('id', 'gte.1'), ('name', 'not.eq.c'), ('order', 'id.desc'),
+                  ('limit', '2'), ('offset', '1'), ('select', 'name')]
+        page, offset, total = query_rows(rows, params, {})
+        self.assertEqual(page, [{'name': 'd'}, {'name': 'b'}])
+        self.assertEqual((offset, total), (1, 3))
+
+
+    def test_in_like_is(self):
+        rows = [{'n': 'anna'}, {'n': 'bo'}, {'n': None}]
+        self.assertEqual(len(query_rows(rows, [('n', 'in.(anna,bo)')], {})[0]), 2)
+        self.assertEqual(query_rows(rows, [('n', 'like.an*')], {})[0], [{'n': 'anna'}])
+        self.assertEqual(query_rows(rows, [('n', 'is.null')], {})[0], [{'n': None}])
+
+
+class TestStandInServer(unittest.TestCase):
+
+
+    def setUp(self):
+        self.server = StandInServer(seed=1).start()
+        self.ntkc = PgNeedToKnowClient(url=self.server.url)
+        self.admin = self.ntkc.token(token_type='admin')
+        self.ntkc.table_create({'definition': T1, 'type': 'mac'}, self.admin)
+        for user_id, user_type in [('A', 'data_owner'), ('B', 'data_owner'), ('X', 'data_user')]:
+            self.ntkc.user_register({'user_id': user_id, 'user_type': user_type,
+                                     'user_metadata': {}})
+        self.owner_a = self.ntkc.token(user_id='A', token_type='owner')
+        self.owner_b = self.ntkc.token(user_id='B', token_type='owner')
+        self.user_x = self.ntkc.token(user_id='X', token_type='user')
+        self.ntkc.post_data({'name': 'A', 'age': 75}, self.owner_a, '/t1')
+        self.ntkc.post_data({'name': 'B', 'age': 35}, self.owner_b, '/t1')
+
+
+    def tearDown(self):
+        self.ntkc.close()
+        self.server.stop()
+
+
+    def test_access_rules(self):
+        rows = json.loads(self.ntkc.get_data(self.owner_a, '/t1').text)
+        self.assertEqual([r['row_owner'] for r in rows], ['owner_A'])
+        self.assertEqual(self.ntkc.get_data(self.user_x, '/t1').status_code, 403)
+        self.assertEqual(json.loads(self.ntkc.get_data(self.admin, '/t1').text), [])
+        self.ntkc.group_create({'group_name': 'g1', 'group_metadata': {}}, self.admin)
+        self.ntkc.group_add_members({'group_name': 'g1', 'add_all': True}, self.admin)
+        self.ntkc.table_group_access_grant({'table_name': 't1', 'group_name': 'g1',
+                                            'grant_type': 'select'}, self.admin)
+        resp = self.ntkc.get_data(self.user_x, '/t1?age=gt.50')
+        self.assertEqual([r['name'] for r in json.loads(resp.text)], ['A'])
+        log = json.loads(self.ntkc.get_event_log_data_access(self.admin).text)
+        self.assertEqual(log[0]['data_user'], 'user_X')
+
+
+    def test_iter_data(self):
+        self.ntkc.post_data_many([{'name': str(i), 'age': i} for i in range(25)],
+                                 self.owner_a, '/t1', batch_size=10)
+        rows = list(self.ntkc.iter_data(self.owner_a, '/t1', page_size=10, order='age'))
+        self.assertEqual(len(rows), 26)
+
+
+    def test_expired_token(self):
+        self.server.token_ttl = -1
+        token = self.ntkc.token(user_id='A', token_type='owner')
+        self.assertEqual(self.ntkc.get_data(token, '/t1').status_code, 401)
+
+
+    def test_injected_latency_and_errors(self):
+        self.server.latency = 0.05
+        start = time.time()
+        self.ntkc.get_data(self.owner_a, '/t1')
+        self.assertTrue(time.time() - start >= 0.05)
+        self.server.latency = 0
+        self.server.error_rate = 1.0
+        self.assertEqual(self.ntkc.get_data(self.owner_a, '/t1').status_code, 503)
+        self.assertEqual(self.server.stats()['injected_errors'], 1)
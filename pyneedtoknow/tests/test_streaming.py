@@ -0,0 +1,44 @@
+
+# -*- coding: utf-8 -*-
+
+import json
+import unittest
+
+from ..streaming import iter_json_array
+
+ROWS = [{'id': 1, 'name': u'Åsa', 'tags': ['a', 'b]'], 'meta': {'x': None}},
+        {'id': 22, 'name': 'B, "quoted"', 'tags': [], 'meta': {}},
+        12345,
+        'text',
+        1.5e3]
+
+
+def split(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+class TestIterJsonArray(unittest.TestCase):
+
+
+    def test_all_chunk_sizes(self):
+        data = json.dumps(ROWS, indent=1, ensure_ascii=False).encode('utf-8')
+        for size in range(1, len(data) + 1):
+            self.assertEqual(list(iter_json_array(split(data, size))), ROWS)
+
+
+    def test_empty_array(self):
+        self.assertEqual(list(iter_json_array([b' [', b' ] '])), [])
+
+
+    def test_is_incremental(self):
+        def chunks():
+            yield b'[{"a": 1}, {"a"'
+            raise RuntimeError('not read yet')
+        rows = iter_json_array(chunks())
+        self.assertEqual(next(rows), {'a': 1})
+
+
+    def test_invalid(self):
+        for data in [b'{"a": 1}', b'[{"a": 1}', b'[1] 2', b'[{"a": }]']:
+            with self.assertRaises(ValueError):
+                list(iter_json_array(split(data, 3)))
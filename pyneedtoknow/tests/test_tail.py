@@ -0,0 +1,98 @@
+
+import os
+import shutil
+import tempfile
+import unittest
+
+try:
+    from urllib.parse import parse_qsl, urlsplit
+except ImportError:
+    from urlparse import parse_qsl, urlsplit
+
+from ..server import query_rows
+from ..tail import EventLogTail, FileCheckpointStore
+
+
+class FakeResponse(object):
+
+    def __init__(self, rows):
+        self.status_code = 200
+        self.rows = rows
+
+
+class FakeClient(object):
+
+    api_endpoints = {'event_log_data_access': '/event_log_data_access'}
+
+    def __init__(self):
+        self.rows = []
+        self.endpoints = []
+
+    def get_data(self, token, endpoint):
+        self.endpoints.append(endpoint)
+        page, _, _ = query_rows(self.rows, parse_qsl(urlsplit(endpoint).query), {})
+        return FakeResponse(page)
+
+    def json(self, resp):
+        return resp.rows
+
+
+def access(time, row_id):
+    return {'request_time': time, 'row_id': row_id, 'data_user': 'user_X',
+            'data_owner': 'owner_A'}
+
+
+class TestEventLogTail(unittest.TestCase):
+
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'checkpoints.json')
+        self.client = FakeClient()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def tail(self):
+        return EventLogTail(self.client, 'token', ['event_log_data_access'],
+                            FileCheckpointStore(self.path))
+
+
+    def test_only_new_rows(self):
+        self.client.rows = [access('2017-01-01T10:00:00', 1),
+                            access('2017-01-01T10:00:01', 2)]
+        tail = self.tail()
+        self.assertEqual(len(list(tail.poll('event_log_data_access'))), 2)
+        self.assertEqual(list(tail.poll('event_log_data_access')), [])
+        self.assertTrue('request_time=gte.2017-01-01T10%3A00%3A01&' in self.client.endpoints[-1])
+        # a row with the same time as the checkpoint, and a later one
+        self.client.rows.append(access('2017-01-01T10:00:01', 3))
+        self.client.rows.append(access('2017-01-01T10:00:02', 4))
+        rows = list(tail.poll('event_log_data_access'))
+        self.assertEqual([r['row_id'] for r in rows], [3, 4])
+
+
+    def test_resume_after_restart(self):
+        self.client.rows = [access('2017-01-01T10:00:0%d' % i, i) for i in range(5)]
+        rows = self.tail().poll('event_log_data_access')
+        next(rows)
+        next(rows)
+        # stop while the second row is being processed
+        rows.close()
+        rows = list(self.tail().poll('event_log_data_access'))
+        self.assertEqual([r['row_id'] for r in rows], [1, 2, 3, 4])
+
+
+    def test_shared_timestamps_across_pages(self):
+        times = ['2017-01-01T10:00:00'] * 5 + ['2017-01-01T10:00:01'] * 3
+        self.client.rows = [access(t, i) for i, t in enumerate(times)]
+        tail = EventLogTail(self.client, 'token', ['event_log_data_access'],
+                            FileCheckpointStore(self.path), page_size=2)
+        rows = tail.poll('event_log_data_access')
+        ids = [next(rows)['row_id'] for i in range(3)]
+        # added while paging, at a timestamp already being paged through
+        self.client.rows.append(access('2017-01-01T10:00:01', 8))
+        ids.extend(r['row_id'] for r in rows)
+        self.assertEqual(sorted(ids), list(range(9)))
+        self.assertEqual(len(ids), 9)
+        self.assertEqual(list(tail.poll('event_log_data_access')), [])
@@ -0,0 +1,162 @@
+
+import base64
+import json
+import threading
+import time
+import unittest
+
+from ..tokens import TokenCache, TokenPrefetcher, TokenResult, jwt_expiry
+
+
+def make_jwt(exp):
+    def enc(d):
+        return base64.urlsafe_b64encode(json.dumps(d).encode('utf-8')).decode('ascii').rstrip('=')
+    return '.'.join([enc({'alg': 'HS256'}), enc({'role': 'admin', 'exp': exp}), 'sig'])
+
+
+class TestTokenCache(unittest.TestCase):
+
+
+    def setUp(self):
+        self.calls = []
+        self.exp = time.time() + 3600
+
+    def fetch(self, user_id, token_type):
+        self.calls.append((user_id, token_type))
+        return make_jwt(self.exp)
+
+
+    def test_jwt_expiry(self):
+        self.assertEqual(jwt_expiry(make_jwt(1234)), 1234)
+        self.assertEqual(jwt_expiry('not-a-jwt'), None)
+
+
+    def test_cache_hit(self):
+        cache = TokenCache()
+        for i in range(3):
+            cache.get('A', 'owner', self.fetch)
+        cache.get('B', 'owner', self.fetch)
+        self.assertEqual(self.calls, [('A', 'owner'), ('B', 'owner')])
+        self.assertEqual(cache.stats()['hits'], 2)
+
+
+    def test_expired_token_is_refetched(self):
+        cache = TokenCache(min_validity=5)
+        self.exp = time.time() + 1
+        cache.get('A', 'owner', self.fetch)
+        cache.get('A', 'owner', self.fetch)
+        self.assertEqual(len(self.calls), 2)
+
+
+    def test_lru_eviction(self):
+        cache = TokenCache(maxsize=2)
+        cache.get('A', 'owner', self.fetch)
+        cache.get('B', 'owner', self.fetch)
+        cache.get('A', 'owner', self.fetch)
+        cache.get('C', 'owner', self.fetch)
+        cache.get('A', 'owner', self.fetch)
+        cache.get('B', 'owner', self.fetch)
+        self.assertEqual([c[0] for c in self.calls], ['A', 'B', 'C', 'B'])
+        self.assertEqual(cache.stats()['evictions'], 2)
+
+
+    def test_background_refresh(self):
+        cache = TokenCache(refresh_before=60)
+        self.exp = time.time() + 30
+        first = cache.get('A', 'owner', self.fetch)
+        self.exp = time.time() + 3600
+        # still valid, returned without waiting while a refresh runs
+        self.assertEqual(cache.get('A', 'owner', self.fetch), first)
+        cache.close()
+        self.assertEqual(len(self.calls), 2)
+        self.assertEqual(cache.stats()['refreshes'], 1)
+        self.assertNotEqual(cache.get('A', 'owner', self.fetch), first)
+        self.assertEqual(len(self.calls), 2)
+
+
+    def test_threads(self):
+        cache = TokenCache(maxsize=50)
+        def work():
+            for i in range(200):
+                cache.get(str(i % 100), 'owner', self.fetch)
+        threads = [threading.Thread(target=work) for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertTrue(cache.stats()['size'] <= 50)
+
+
+class TestTokenPrefetcher(unittest.TestCase):
+
+
+    def test_order_errors_and_lookahead(self):
+        started = []
+        lock = threading.Lock()
+        def fetch(user_id, token_type):
+            with lock:
+                started.append(user_id)
+            if user_id == 3:
+                raise Exception('no such user')
+            time.sleep(0.01)
+            return 'token-%s-%s' % (user_id, token_type)
+        prefetcher = TokenPrefetcher(fetch, ((i, 'owner') for i in range(40)),
+                                     max_workers=4, lookahead=8)
+        results = []
+        for result in prefetcher:
+            # tokens beyond the look-ahead window are not requested
+            self.assertTrue(len(started) <= result.user_id + 1 + 8)
+            results.append(result)
+        self.assertEqual([r.user_id for r in results], list(range(40)))
+        self.assertEqual(results[0], TokenResult(0, 'owner', 'token-0-owner', None))
+        self.assertEqual(results[3].token, None)
+        self.assertEqual(results[3].error, 'no such user')
+        self.assertEqual(prefetcher.stats()['fetched'], 40)
+        self.assertEqual(prefetcher.stats()['failed'], 1)
+
+
+    def test_consumer_does_not_wait(self):
+        def fetch(user_id, token_type):
+            time.sleep(0.01)
+            return 'token'
+        prefetcher = TokenPrefetcher(fetch, ((i, 'owner') for i in range(50)),
+                                     max_workers=8, lookahead=16)
+        for result in prefetcher:
+            # work on each user takes as long as fetching a token
+            time.sleep(0.01)
+        self.assertTrue(prefetcher.stats()['waits'] <= 3)
+
+
+    def test_client_delete_data_many(self):
+        from ..client import PgNeedToKnowClient
+        from ..server import StandInServer
+        with StandInServer() as server:
+            with PgNeedToKnowClient(url=server.url) as c:
+                for i in range(20):
+                    c.user_register({'user_id': str(i), 'user_type': 'data_owner',
+                                     'user_metadata': {}})
+                # '1' twice, each deletion has its own prefetched token
+                result = c.user_delete_data_many([str(i) for i in range(20)] + ['1'],
+                                                 max_workers=4)
+                self.assertEqual(result.succeeded, 21)
+                self.assertEqual([i.item for i in result.items][:3], ['0', '1', '2'])
+
+
+    def test_token_requests_take_limiter_slots(self):
+        from ..client import PgNeedToKnowClient
+        from ..concurrency import AdaptiveLimiter
+        from ..server import StandInServer
+        limiter = AdaptiveLimiter(initial=2, max_limit=4)
+        with StandInServer() as server:
+            with PgNeedToKnowClient(url=server.url, concurrency=limiter) as c:
+                for i in range(10):
+                    c.user_register({'user_id': str(i), 'user_type': 'data_owner',
+                                     'user_metadata': {}})
+                result = c.user_delete_data_many([str(i) for i in range(10)] + ['1'])
+                self.assertEqual(result.succeeded, 11)
+                # one sample per token request and one per deletion
+                self.assertEqual(limiter.stats()['completed'], 22)
+                tokens = list(c.prefetch_tokens([('1', 'owner'), ('2', 'owner')]))
+                self.assertEqual(len(tokens), 2)
+                self.assertEqual(limiter.stats()['completed'], 24)
+                self.assertEqual(limiter.in_flight, 0)
@@ -0,0 +1,188 @@
+
+import json
+import socket
+import threading
+import time
+import unittest
+
+from ..client import PgNeedToKnowClient
+from ..server import StandInServer
+from ..transport import TRANSPORTS, HttpClientSession, create_session
+
+T1 = {'table_name': 't1', 'columns': [{'name': 'payload', 'type': 'text'}],
+      'description': 'transport test'}
+
+
+class TestTransports(unittest.TestCase):
+
+
+    def setUp(self):
+        self.server = StandInServer(compression_min_size=100).start()
+
+
+    def tearDown(self):
+        self.server.stop()
+
+
+    def test_same_behaviour(self):
+        for transport in sorted(TRANSPORTS):
+            self.server.reset()
+            with PgNeedToKnowClient(url=self.server.url, transport=transport) as ntkc:
+                admin = ntkc.token(token_type='admin')
+                self.assertEqual(ntkc.table_create({'definition': T1, 'type': 'mac'},
+                                                   admin).status_code, 200)
+                ntkc.user_register({'user_id': 'A', 'user_type': 'data_owner',
+                                    'user_metadata': {}})
+                owner = ntkc.token(user_id='A', token_type='owner')
+                rows = [{'payload': 'x' * 50} for i in range(50)]
+                self.assertEqual(ntkc.post_data_many(rows, owner, '/t1').failed, 0)
+                resp = ntkc.get_data(owner, '/t1')
+                self.assertEqual(resp.headers.get('content-encoding'), 'gzip')
+                self.assertEqual(len(json.loads(resp.text)), 50)
+                self.assertEqual(len(ntkc.json(resp)), 50)
+                self.assertEqual(len(list(ntkc.stream_data(owner, '/t1', chunk_size=100))), 50)
+                self.assertEqual(ntkc.get_data(owner, '/nope').status_code, 404)
+                stats = ntkc.connection_stats()
+                self.assertEqual(stats['requests'], 8, transport)
+                self.assertEqual(stats['connections'], 1, transport)
+
+
+    def test_partly_read_stream(self):
+        for transport in sorted(TRANSPORTS):
+            self.server.reset()
+            with PgNeedToKnowClient(url=self.server.url, transport=transport) as ntkc:
+                admin = ntkc.token(token_type='admin')
+                ntkc.table_create({'definition': T1, 'type': 'mac'}, admin)
+                ntkc.user_register({'user_id': 'A', 'user_type': 'data_owner',
+                                    'user_metadata': {}})
+                owner = ntkc.token(user_id='A', token_type='owner')
+                ntkc.post_data_many([{'payload': 'x' * 500}] * 200, owner, '/t1')
+                rows = ntkc.stream_data(owner, '/t1', chunk_size=100)
+                next(rows)
+                rows.close()
+                self.assertEqual(len(ntkc.json(ntkc.get_data(owner, '/t1'))), 200, transport)
+
+
+    def test_timeout(self):
+        self.server.latency = 0.2
+        for transport in sorted(TRANSPORTS):
+            session = create_session(transport, timeout=0.05)
+            self.assertRaises(Exception, session.get, self.server.url + '/groups')
+            resp = session.get(self.server.url + '/groups', timeout=1)
+            self.assertEqual(resp.status_code, 403)
+            session.close()
+
+
+    def test_no_keep_alive(self):
+        for transport in sorted(TRANSPORTS):
+            with PgNeedToKnowClient(url=self.server.url, transport=transport,
+                                    keep_alive=False) as ntkc:
+                for i in range(3):
+                    ntkc.token(token_type='admin')
+                self.assertEqual(ntkc.connection_stats()['connections'], 3, transport)
+
+
+    def test_unknown_transport(self):
+        self.assertRaises(Exception, create_session, 'curl')
+
+
+class OneResponseServer(object):
+
+    """
+    Answers only the first request on each connection, then closes it,
+    either right away or after reading the next request. A body shorter
+    than its Content-Length is left unfinished until then.
+    """
+
+    def __init__(self, read_next=True, body=b'ok'):
+        self.read_next = read_next
+        self.body = body
+        self.received = []
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(5)
+        self.url = 'http://127.0.0.1:%d/' % self.sock.getsockname()[1]
+        thread = threading.Thread(target=self._accept)
+        thread.daemon = True
+        thread.start()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except socket.error:
+                return
+            f = conn.makefile('rb')
+            for answer in [True, False]:
+                if not answer and not self.read_next:
+                    break
+                line = f.readline()
+                if not line:
+                    break
+                length = 0
+                header = f.readline()
+                while header.strip():
+                    name, _, value = header.decode('latin-1').partition(':')
+                    if name.lower() == 'content-length':
+                        length = int(value)
+                    header = f.readline()
+                f.read(length)
+                self.received.append(line.split()[0].decode('ascii'))
+                if answer:
+                    conn.sendall(b'HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\n' + self.body)
+            f.close()
+            conn.close()
+
+    def close(self):
+        self.sock.close()
+
+
+class TestHttpClientRetries(unittest.TestCase):
+
+
+    def test_only_idempotent_requests_are_resent(self):
+        server = OneResponseServer()
+        session = HttpClientSession()
+        try:
+            self.assertEqual(session.get(server.url).status_code, 200)
+            # received, then the connection is closed without an answer
+            self.assertRaises(Exception, session.post, server.url, data='{}')
+            self.assertEqual(server.received, ['GET', 'POST'])
+            self.assertEqual(session.get(server.url).status_code, 200)
+            self.assertEqual(session.get(server.url).status_code, 200)
+            self.assertEqual(server.received, ['GET', 'POST', 'GET', 'GET', 'GET'])
+        finally:
+            session.close()
+            server.close()
+
+
+    def test_closed_idle_connection_is_not_used(self):
+        server = OneResponseServer(read_next=False)
+        session = HttpClientSession()
+        try:
+            self.assertEqual(session.get(server.url).status_code, 200)
+            time.sleep(0.05)
+            self.assertEqual(session.post(server.url, data='{}').status_code, 200)
+            self.assertEqual(server.received, ['GET', 'POST'])
+            self.assertEqual(session.stats()['connections'], 2)
+        finally:
+            session.close()
+            server.close()
+
+
+    def test_failed_body_read_frees_the_connection(self):
+        server = OneResponseServer(read_next=False, body=b'o')
+        session = HttpClientSession(pool_maxsize=1, pool_block=True, timeout=0.3)
+        try:
+            self.assertRaises(Exception, session.get, server.url)
+            server.body = b'ok'
+            # would wait forever for the pool slot of the failed request
+            codes = []
+            thread = threading.Thread(target=lambda: codes.append(session.get(server.url).status_code))
+            thread.daemon = True
+            thread.start()
+            thread.join(2)
+            self.assertEqual(codes, [200])
+        finally:
+            session.close()
+            server.close()
@@ -0,0 +1,290 @@
+
+import base64
+import json
+import threading
+import time
+from collections import OrderedDict, deque, namedtuple
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+
+def jwt_expiry(token):
+    """
+    Read the exp claim from a JWT, without verifying the signature.
+
+    Parameters
+    ----------
+    token: str
+        JWT
+
+    Returns
+    -------
+    float or None
+
+    """
+    try:
+        payload = token.split('.')[1]
+        payload += '=' * (-len(payload) % 4)
+        claims = json.loads(base64.urlsafe_b64decode(payload.encode('ascii')).decode('utf-8'))
+        return float(claims['exp'])
+    except (IndexError, KeyError, TypeError, ValueError):
+        return None
+
+
+class TokenCache(object):
+
+    """
+    Thread-safe LRU cache of JWTs, keyed by (user_id, token_type).
+
+    Tokens are kept until shortly before their exp claim. When a cached token
+    gets within refresh_before seconds of expiry it is still returned, and a
+    new one is fetched by a background thread, so callers only wait on
+    /rpc/token for tokens they have not asked for before, or that have
+    (almost) expired.
+    """
+
+    def __init__(self, maxsize=10000, refresh_before=60, min_validity=5,
+                 default_ttl=300, background_refresh=True):
+        """
+        Parameters
+        ----------
+        maxsize: int
+            maximum number of cached tokens, least recently used are evicted
+        refresh_before: int
+            seconds before expiry at which a background refresh is started
+        min_validity: int
+            cached tokens with less validity left than this are not used
+        default_ttl: int
+            seconds to keep tokens without an exp claim
+        background_refresh: bool
+            if False, tokens are only re-fetched once they are unusable
+
+        """
+        self.maxsize = maxsize
+        self.refresh_before = refresh_before
+        self.min_validity = min_validity
+        self.default_ttl = default_ttl
+        self.background_refresh = background_refresh
+        self._lock = threading.Lock()
+        self._tokens = OrderedDict()
+        self._pending = set()
+        self._queue = queue.Queue()
+        self._worker = None
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.evictions = 0
+
+
+    def get(self, user_id, token_type, fetch):
+        """
+        Parameters
+        ----------
+        user_id: str
+        token_type: str
+        fetch: callable
+            fetch(user_id, token_type) -> token, used on cache misses and refreshes
+
+        Returns
+        -------
+        str
+
+        """
+        key = (user_id, token_type)
+        now = time.time()
+        with self._lock:
+            entry = self._tokens.get(key)
+            if entry is not None and entry[1] - now > self.min_validity:
+                self._tokens[key] = self._tokens.pop(key)
+                self.hits += 1
+                if self.background_refresh and entry[1] - now <= self.refresh_before \
+                        and key not in self._pending:
+                    self._pending.add(key)
+                    self._queue.put((key, fetch))
+                    self._ensure_worker()
+                return entry[0]
+            self.misses += 1
+        token = fetch(user_id, token_type)
+        self.put(user_id, token_type, token)
+        return token
+
+
+    def put(self, user_id, token_type, token):
+        expires = jwt_expiry(token)
+        if expires is None:
+            expires = time.time() + self.default_ttl
+        key = (user_id, token_type)
+        with self._lock:
+            self._tokens.pop(key, None)
+            self._tokens[key] = (token, expires)
+            while len(self._tokens) > self.maxsize:
+                self._tokens.popitem(last=False)
+                self.evictions += 1
+
+
+    def invalidate(self, user_id=None, token_type=None):
+        with self._lock:
+            self._tokens.pop((user_id, token_type), None)
+
+
+    def clear(self):
+        with self._lock:
+            self._tokens.clear()
+
+
+    def stats(self):
+        """
+        Returns
+        -------
+        dict
+
+            {size, hits, misses, refreshes, evictions}
+
+        """
+        with self._lock:
+            return {'size': len(self._tokens), 'hits': self.hits,
+                    'misses': self.misses, 'refreshes': self.refreshes,
+                    'evictions': self.evictions}
+
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._refresh_loop,
+                                            name='pyneedtoknow-token-refresh')
+            self._worker.daemon = True
+            self._worker.start()
+
+
+    def _refresh_loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            key, fetch = item
+            try:
+                token = fetch(key[0], key[1])
+                self.put(key[0], key[1], token)
+                with self._lock:
+                    self.refreshes += 1
+            except Exception:
+                # the token is fetched in the foreground once it is unusable
+                pass
+            finally:
+                with self._lock:
+                    self._pending.discard(key)
+
+
+    def close(self):
+        """
+        Stop the background refresh thread.
+        """
+        with self._lock:
+            worker = self._worker
+            self._worker = None
+        if worker is not None:
+            self._queue.put(None)
+            worker.join()
+
+
+TokenResult = namedtuple('TokenResult', ['user_id', 'token_type', 'token', 'error'])
+
+
+class TokenPrefetcher(object):
+
+    """
+    Fetch the tokens for a stream of (user_id, token_type) pairs concurrently,
+    ahead of the code using them.
+
+    Up to lookahead tokens are requested before they are needed, so while
+    the consumer works on one user the tokens of the next ones are already
+    being fetched. Tokens are returned in the order of the pairs. A failed
+    fetch is returned with its error instead of stopping the iteration.
+
+        for user_id, token_type, token, error in TokenPrefetcher(client.token, pairs):
+            ...
+
+    """
+
+    def __init__(self, fetch, pairs, max_workers=8, lookahead=64):
+        """
+        Parameters
+        ----------
+        fetch: callable
+            fetch(user_id, token_type) -> token, e.g. client.token
+        pairs: iterable
+            of (user_id, token_type), read as tokens are consumed
+        max_workers: int
+            maximum number of token requests in flight
+        lookahead: int
+            maximum number of tokens fetched, or being fetched,
+            but not yet consumed
+
+        """
+        self.fetch = fetch
+        self.pairs = pairs
+        self.max_workers = max_workers
+        self.lookahead = max(lookahead, 1)
+        self._lock = threading.Lock()
+        self.fetched = 0
+        self.failed = 0
+        self.waits = 0
+        self.wait_time = 0.0
+
+
+    def stats(self):
+        """
+        Returns
+        -------
+        dict
+
+            {fetched, failed, waits, wait_time}, waits counts the tokens
+            the consumer asked for before they had been fetched
+
+        """
+        with self._lock:
+            return {'fetched': self.fetched, 'failed': self.failed,
+                    'waits': self.waits, 'wait_time': self.wait_time}
+
+
+    def __iter__(self):
+        # imported here, concurrent.futures takes milliseconds to import
+        from concurrent.futures import ThreadPoolExecutor
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        pairs = iter(self.pairs)
+        pending = deque()
+
+        def fill():
+            while len(pending) < self.lookahead:
+                try:
+                    user_id, token_type = next(pairs)
+                except StopIteration:
+                    return
+                pending.append((user_id, token_type,
+                                executor.submit(self.fetch, user_id, token_type)))
+
+        try:
+            fill()
+            while pending:
+                user_id, token_type, future = pending.popleft()
+                fill()
+                if not future.done():
+                    start = time.time()
+                    future.exception()
+                    with self._lock:
+                        self.waits += 1
+                        self.wait_time += time.time() - start
+                try:
+                    token, error = future.result(), None
+                except Exception as e:
+                    token, error = None, str(e)
+                with self._lock:
+                    self.fetched += 1
+                    self.failed += error is not None
+                yield TokenResult(user_id, token_type, token, error)
+        finally:
+            for _, _, future in pending:
+                future.cancel()
+            executor.shutdown(wait=False)
@@ -0,0 +1,557 @@
+
+"""
+HTTP transports for PgNeedToKnowClient.
+
+All transports have the same interface as session.HttpSession:
+get/post/patch(url, headers=None, data=None, stream=False, timeout=None),
+stats() and close(), the same pooling, keep-alive and timeout options,
+and return responses with status_code, headers, content, text, json(),
+iter_content() and close().
+
+    requests     session.HttpSession, the default
+    urllib3      Urllib3Session, urllib3 connection pools without requests
+    http.client  HttpClientSession, standard library only
+
+"""
+
+import collections
+import json
+import select
+import socket
+import threading
+import zlib
+
+try:
+    from urllib.parse import urlsplit
+except ImportError:
+    from urlparse import urlsplit
+
+from .compression import ACCEPT_ENCODING, decompress
+
+
+def _charset(headers):
+    content_type = headers.get('Content-Type') or ''
+    for part in content_type.split(';')[1:]:
+        key, _, value = part.strip().partition('=')
+        if key.lower() == 'charset' and value:
+            return value.strip('"')
+    return 'utf-8'
+
+
+def _split_timeout(timeout):
+    if isinstance(timeout, tuple):
+        return timeout
+    return timeout, timeout
+
+
+class Response(object):
+
+    """
+    HTTP response with the parts of the requests.Response interface used
+    by PgNeedToKnowClient and its callers.
+
+    Streamed responses are read with iter_content, or in full the first
+    time content is accessed, and hand their connection back when done.
+    """
+
+    def __init__(self, status_code, headers, content=None, chunks=None,
+                 release=None, url=None):
+        """
+        Parameters
+        ----------
+        status_code: int
+        headers: mapping
+            case-insensitive
+        content: bytes
+            decoded body, None for streamed responses
+        chunks: callable
+            chunks(chunk_size) -> iterator of decoded bytes, for streamed responses
+        release: callable
+            optional, called once the body has been read or the response closed
+        url: str
+
+        """
+        self.status_code = status_code
+        self.headers = headers
+        self._content = content
+        self._chunks = chunks
+        self._release = release
+        self.url = url
+        self.encoding = _charset(headers)
+
+
+    @property
+    def content(self):
+        if self._content is None:
+            self._content = b''.join(self._read(65536))
+        return self._content
+
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding, 'replace')
+
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+
+    def json(self):
+        return json.loads(self.text)
+
+
+    def _read(self, chunk_size):
+        try:
+            for chunk in self._chunks(chunk_size):
+                yield chunk
+        finally:
+            self.close()
+
+
+    def iter_content(self, chunk_size=1):
+        if self._content is not None:
+            return (self._content[i:i + chunk_size]
+                    for i in range(0, len(self._content), chunk_size))
+        return self._read(chunk_size)
+
+
+    def close(self):
+        release, self._release = self._release, None
+        if release is not None:
+            release()
+
+
+class Urllib3Session(object):
+
+    """
+    Thread-safe, pooled HTTP session using urllib3 directly, which
+    skips the per-request work requests does on top of it.
+    """
+
+    def __init__(self, pool_connections=10, pool_maxsize=10, pool_block=False,
+                 keep_alive=True, max_retries=0, timeout=None):
+        """
+        Parameters
+        ----------
+        pool_connections: int
+            number of per-host connection pools to keep
+        pool_maxsize: int
+            maximum number of connections kept open per host
+        pool_block: bool
+            if True, never open more than pool_maxsize connections per host
+        keep_alive: bool
+            if False, send 'Connection: close' and disable connection re-use
+        max_retries: int
+            connection-level retries
+        timeout: float or tuple
+            optional, seconds, or (connect, read) seconds
+
+        """
+        # imported here, it takes tens of milliseconds
+        try:
+            import urllib3
+        except ImportError:
+            raise Exception('urllib3 is required for Urllib3Session')
+        self._urllib3 = urllib3
+        self.keep_alive = keep_alive
+        self.timeout = timeout
+        self.headers = {'Accept-Encoding': ACCEPT_ENCODING}
+        if not keep_alive:
+            self.headers['Connection'] = 'close'
+        self._manager = urllib3.PoolManager(num_pools=pool_connections,
+                                            maxsize=pool_maxsize, block=pool_block,
+                                            retries=urllib3.Retry(total=max_retries,
+                                                                  read=0, redirect=0,
+                                                                  status=0),
+                                            headers=self.headers)
+        self._closed = False
+        self._lock = threading.Lock()
+        self._num_requests = 0
+        self._num_connections = 0
+        # keep counts from pools that are evicted or closed
+        pools = self._manager.pools
+        dispose = pools.dispose_func
+        def _dispose(pool):
+            self._record_pool(pool)
+            if dispose:
+                dispose(pool)
+        pools.dispose_func = _dispose
+
+
+    def _record_pool(self, pool):
+        self._num_requests += pool.num_requests
+        self._num_connections += pool.num_connections
+
+
+    def request(self, method, url, headers=None, data=None, stream=False, timeout=None):
+        if self._closed:
+            raise Exception('Session is closed')
+        if headers:
+            merged = dict(self.headers)
+            merged.update(headers)
+            headers = merged
+        connect, read = _split_timeout(timeout if timeout is not None else self.timeout)
+        resp = self._manager.request(method, url, body=data, headers=headers,
+                                     timeout=self._urllib3.Timeout(connect=connect, read=read),
+                                     preload_content=not stream, decode_content=True)
+        if not stream:
+            return Response(resp.status, resp.headers, resp.data, url=url)
+        def release():
+            # urllib3 hands the connection back once the body is fully read,
+            # otherwise it is closed, since it cannot be re-used
+            resp.close()
+            resp.release_conn()
+        return Response(resp.status, resp.headers,
+                        chunks=lambda size: resp.stream(size, decode_content=True),
+                        release=release, url=url)
+
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+
+    def patch(self, url, **kwargs):
+        return self.request('PATCH', url, **kwargs)
+
+
+    def stats(self):
+        """
+        Returns
+        -------
+        dict
+
+            {requests, connections, reused_connections}
+
+        """
+        num_requests = self._num_requests
+        num_connections = self._num_connections
+        with self._lock:
+            pools = self._manager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is not None:
+                    num_requests += pool.num_requests
+                    num_connections += pool.num_connections
+        if not self.keep_alive:
+            # urllib3 re-opens closed connections in place, without counting them
+            num_connections = num_requests
+        return {'requests': num_requests,
+                'connections': num_connections,
+                'reused_connections': max(num_requests - num_connections, 0)}
+
+
+    def close(self):
+        with self._lock:
+            if not self._closed:
+                self._manager.clear()
+            self._closed = True
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class _HostPool(object):
+
+    def __init__(self, maxsize, block):
+        self.idle = collections.deque()
+        self.slots = threading.BoundedSemaphore(maxsize) if block else None
+
+
+class HttpClientSession(object):
+
+    """
+    Thread-safe, pooled HTTP session on the standard library http.client,
+    with no third-party dependencies.
+    """
+
+    # safe to send again on a new connection whether or not they were processed
+    IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'])
+
+    def __init__(self, pool_connections=10, pool_maxsize=10, pool_block=False,
+                 keep_alive=True, max_retries=0, timeout=None):
+        """
+        Parameters
+        ----------
+        pool_connections: int
+            number of hosts to keep idle connections for
+        pool_maxsize: int
+            maximum number of idle connections kept per host
+        pool_block: bool
+            if True, never have more than pool_maxsize connections per host
+            in use, callers wait for a free connection instead
+        keep_alive: bool
+            if False, send 'Connection: close' and disable connection re-use
+        max_retries: int
+            retries when a connection cannot be established
+        timeout: float or tuple
+            optional, seconds, or (connect, read) seconds
+
+        """
+        # imported here, http.client is only needed by this transport
+        try:
+            import http.client as httplib
+        except ImportError:
+            import httplib
+        self._httplib = httplib
+        # a kept-alive connection the server has since closed, before the
+        # request was sent, so it can be sent again on a new connection
+        self._send_errors = (httplib.CannotSendRequest, socket.error)
+        # ... or after, the server may have processed the request
+        self._response_errors = (httplib.BadStatusLine, socket.error)
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.pool_block = pool_block
+        self.keep_alive = keep_alive
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.headers = {'Accept-Encoding': ACCEPT_ENCODING}
+        if not keep_alive:
+            self.headers['Connection'] = 'close'
+        self._pools = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._num_requests = 0
+        self._num_connections = 0
+
+
+    def _pool(self, key):
+        with self._lock:
+            if self._closed:
+                raise Exception('Session is closed')
+            pool = self._pools.pop(key, None)
+            if pool is None:
+                pool = _HostPool(self.pool_maxsize, self.pool_block)
+            self._pools[key] = pool
+            while len(self._pools) > self.pool_connections:
+                _, evicted = self._pools.popitem(last=False)
+                while evicted.idle:
+                    evicted.idle.pop().close()
+            return pool
+
+
+    def _connect(self, key, timeout):
+        scheme, host, port = key
+        connect, read = _split_timeout(timeout)
+        httplib = self._httplib
+        cls = httplib.HTTPSConnection if scheme == 'https' else httplib.HTTPConnection
+        for attempt in range(self.max_retries + 1):
+            conn = cls(host, port, timeout=connect)
+            try:
+                conn.connect()
+                break
+            except (socket.error, OSError):
+                conn.close()
+                if attempt == self.max_retries:
+                    raise
+        conn.sock.settimeout(read)
+        conn.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with self._lock:
+            self._num_connections += 1
+        return conn
+
+
+    def _checkin(self, pool, conn, resp):
+        if self.keep_alive and not resp.will_close and not self._closed \
+                and len(pool.idle) < self.pool_maxsize:
+            pool.idle.append(conn)
+        else:
+            conn.close()
+        if pool.slots is not None:
+            pool.slots.release()
+
+
+    def request(self, method, url, headers=None, data=None, stream=False, timeout=None):
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.hostname,
+               parts.port or (443 if parts.scheme == 'https' else 80))
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        merged = dict(self.headers)
+        if headers:
+            merged.update(headers)
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        timeout = timeout if timeout is not None else self.timeout
+        pool = self._pool(key)
+        if pool.slots is not None:
+            pool.slots.acquire()
+        try:
+            while True:
+                try:
+                    conn, reused = pool.idle.pop(), True
+                except IndexError:
+                    conn, reused = self._connect(key, timeout), False
+                if reused and _dropped(conn):
+                    conn.close()
+                    continue
+                try:
+                    conn.request(method, path, body=data, headers=merged)
+                except self._send_errors as e:
+                    conn.close()
+                    if not reused or isinstance(e, socket.timeout):
+                        raise
+                    continue
+                try:
+                    resp = conn.getresponse()
+                    break
+                except self._response_errors as e:
+                    conn.close()
+                    if not reused or isinstance(e, socket.timeout) \
+                            or method not in self.IDEMPOTENT_METHODS:
+                        raise
+        except Exception:
+            if pool.slots is not None:
+                pool.slots.release()
+            raise
+        with self._lock:
+            self._num_requests += 1
+        encoding = (resp.getheader('Content-Encoding') or '').lower()
+        headers = resp.msg
+        if not stream:
+            try:
+                body = resp.read()
+            except Exception:
+                # a short or timed out body, the connection cannot be re-used
+                conn.close()
+                if pool.slots is not None:
+                    pool.slots.release()
+                raise
+            self._checkin(pool, conn, resp)
+            if encoding in ('gzip', 'deflate'):
+                body = decompress(body, encoding)
+            return Response(resp.status, headers, body, url=url)
+
+        def chunks(size):
+            decompressor = _decompressor(encoding) if encoding in ('gzip', 'deflate') else None
+            while True:
+                chunk = resp.read(size)
+                if not chunk:
+                    break
+                if decompressor is not None:
+                    chunk = decompressor.decompress(chunk)
+                if chunk:
+                    yield chunk
+            if decompressor is not None:
+                tail = decompressor.flush()
+                if tail:
+                    yield tail
+
+        def release():
+            if resp.isclosed():
+                self._checkin(pool, conn, resp)
+            else:
+                # body not fully read, the connection cannot be re-used
+                conn.close()
+                if pool.slots is not None:
+                    pool.slots.release()
+        return Response(resp.status, headers, chunks=chunks, release=release, url=url)
+
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+
+    def patch(self, url, **kwargs):
+        return self.request('PATCH', url, **kwargs)
+
+
+    def stats(self):
+        """
+        Returns
+        -------
+        dict
+
+            {requests, connections, reused_connections}
+
+        """
+        with self._lock:
+            return {'requests': self._num_requests,
+                    'connections': self._num_connections,
+                    'reused_connections': max(self._num_requests - self._num_connections, 0)}
+
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            for pool in self._pools.values():
+                while pool.idle:
+                    pool.idle.pop().close()
+            self._pools.clear()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def _dropped(conn):
+    # an idle connection only has something to read once the server closed it
+    sock = conn.sock
+    if sock is None:
+        return True
+    try:
+        if hasattr(select, 'poll'):
+            poller = select.poll()
+            poller.register(sock, select.POLLIN)
+            return bool(poller.poll(0))
+        return bool(select.select([sock], [], [], 0)[0])
+    except (ValueError, socket.error):
+        return True
+
+
+def _decompressor(encoding):
+    if encoding == 'gzip':
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    return zlib.decompressobj()
+
+
+def _requests_session(**options):
+    # imported here, requests takes tens of milliseconds to import
+    from .session import HttpSession
+    return HttpSession(**options)
+
+
+TRANSPORTS = {
+    'requests': _requests_session,
+    'urllib3': Urllib3Session,
+    'http.client': HttpClientSession,
+}
+
+
+def create_session(transport='requests', **options):
+    """
+    Parameters
+    ----------
+    transport: str
+        <requests, urllib3, http.client>
+    options:
+        pool_connections, pool_maxsize, pool_block, keep_alive,
+        max_retries, timeout
+
+    Returns
+    -------
+    HttpSession, Urllib3Session or HttpClientSession
+
+    """
+    if transport not in TRANSPORTS:
+        raise Exception('Unknown transport: %s, use one of %s'
+                        % (transport, sorted(TRANSPORTS)))
+    return TRANSPORTS[transport](**options)
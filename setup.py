@@ -10,6 +10,13 @@ setup(
     author_email='dutoit.leon@gmail.com',
     url='https://github.com/leondutoit/py-need-to-know',
     packages=['pyneedtoknow'],
+    entry_points={
+        'console_scripts': ['pyneedtoknow = pyneedtoknow.cli:main'],
+    },
+    extras_require={
+        'async': ['aiohttp'],
+        'export': ['numpy', 'pyarrow'],
+    },
     package_data={
         'pyneedtoknow': [
             'tests/*.py'